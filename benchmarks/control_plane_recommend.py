@@ -0,0 +1,113 @@
+"""Per-request latency of control-plane ``/recommend`` scoring for small and large catalogs.
+
+Compares the precompiled catalog index against the original implementation that
+rebuilt every ``ModelDescriptor`` and rescored the whole catalog on each call.
+
+Usage::
+
+    python benchmarks/control_plane_recommend.py --sizes 10 1000 --iterations 2000
+"""
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import yaml
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+
+def load_control_plane(root: Path):
+    os.environ["CONTROL_PLANE_ROOT"] = str(root)
+    spec = importlib.util.spec_from_file_location("control_plane_bench", ROOT / "control-plane" / "app" / "main.py")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["control_plane_bench"] = module
+    assert spec.loader is not None
+    spec.loader.exec_module(module)
+    return module
+
+
+def synthetic_catalog(size: int, seed: int = 7) -> Dict[str, object]:
+    rng = random.Random(seed)
+    models = {}
+    for index in range(size):
+        cloud = index % 5 == 0
+        models[f"model_{index}"] = {
+            "provider": "cloud-openrouter" if cloud else "local",
+            "label": f"Model {index}",
+            "task": rng.choice(["chat", "code", "chat", "vision"]),
+            "context": rng.choice([4096, 8192, 32768, 262144]),
+            "memory_gb": None if cloud else rng.choice([2, 4, 15, 18]),
+            "latency_ms": rng.randint(150, 3000),
+            "cost_per_million": rng.choice([0, 0, 2.5, 10]) if cloud else 0,
+        }
+    return {"profiles": {"default": {"routing": {}}}, "models": models}
+
+
+def legacy_recommend(module, config: Dict[str, object], request) -> object:
+    """The pre-index implementation, kept here as the comparison baseline."""
+    models = [module.ModelDescriptor(id=key, **value) for key, value in config.get("models", {}).items() if value.get("task") == request.task]
+    best_score, best_model = -1e9, None
+    for model in models:
+        if model.context and model.context < request.context_tokens:
+            continue
+        if model.provider.startswith("cloud") and not request.allow_cloud:
+            continue
+        score, _ = module._static_score(model, request.priority)
+        if score > best_score:
+            best_score, best_model = score, model
+    return best_model
+
+
+def bench(size: int, iterations: int) -> Dict[str, float]:
+    with tempfile.TemporaryDirectory() as tmp:
+        config_dir = Path(tmp) / "config"
+        config_dir.mkdir()
+        (config_dir / "models.yaml").write_text(yaml.safe_dump(synthetic_catalog(size)), encoding="utf-8")
+        module = load_control_plane(Path(tmp))
+        config = module.get_config()
+        requests: List[object] = [
+            module.RecommendationRequest(task="chat", context_tokens=tokens, priority=priority, allow_cloud=cloud)
+            for tokens in (1024, 16384)
+            for priority in module.PRIORITIES
+            for cloud in (True, False)
+        ]
+
+        started = time.perf_counter()
+        for index in range(iterations):
+            legacy_recommend(module, config, requests[index % len(requests)])
+        legacy = (time.perf_counter() - started) / iterations
+
+        catalog = module.get_catalog()
+        started = time.perf_counter()
+        for index in range(iterations):
+            module._recommend(catalog, requests[index % len(requests)])
+        indexed = (time.perf_counter() - started) / iterations
+
+    return {
+        "models": size,
+        "legacy_us": round(legacy * 1e6, 2),
+        "indexed_us": round(indexed * 1e6, 2),
+        "speedup": round(legacy / indexed, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000])
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+    print(json.dumps([bench(size, args.iterations) for size in args.sizes], indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Compare a client-per-request against the gateway's pooled upstream client.
+
+Usage::
+
+    python benchmarks/gateway_pool.py --requests 2000 --concurrency 32
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.stubs import start_stub  # noqa: E402
+from gateway.app.upstream import UpstreamPool  # noqa: E402
+
+
+async def _drive(send, total: int, concurrency: int) -> float:
+    queue: asyncio.Queue[int] = asyncio.Queue()
+    for index in range(total):
+        queue.put_nowait(index)
+
+    async def worker() -> None:
+        while True:
+            try:
+                queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            await send()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return total / (time.perf_counter() - started)
+
+
+async def run(total: int, concurrency: int) -> dict:
+    server, base_url = start_stub()
+    url = f"{base_url}/v1/chat/completions"
+    payload = {"messages": [{"role": "user", "content": "Hello"}]}
+
+    async def per_request() -> None:
+        async with httpx.AsyncClient() as client:
+            (await client.post(url, json=payload, timeout=120)).raise_for_status()
+
+    pool = UpstreamPool({"max_connections": concurrency, "max_keepalive_connections": concurrency})
+
+    async def pooled() -> None:
+        (await pool.client_for(url).post(url, json=payload)).raise_for_status()
+
+    try:
+        before = await _drive(per_request, total, concurrency)
+        after = await _drive(pooled, total, concurrency)
+    finally:
+        await pool.aclose()
+        server.shutdown()
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "client_per_request_rps": round(before, 1),
+        "pooled_rps": round(after, 1),
+        "speedup": round(after / before, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.requests, args.concurrency)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
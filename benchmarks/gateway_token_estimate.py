@@ -0,0 +1,67 @@
+"""Cost of the gateway's prompt-size estimate for large prompts.
+
+Builds ``--tokens``-sized payloads (single English prompt, a chat history of many
+messages, and mixed English/Chinese text) and times ``TokenEstimator.estimate``,
+which runs on every routed request that arrives without ``context_tokens``.
+
+Usage::
+
+    python benchmarks/gateway_token_estimate.py --tokens 100000 --iterations 200
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from gateway.app.tokens import TokenEstimator  # noqa: E402
+
+ENGLISH = "The quick brown fox explains long division to a curious eight-year-old. "
+CHINESE = "孩子们在学习数学和语文，老师讲解了分数的加减法。"
+
+
+def payloads(tokens: int) -> Dict[str, Dict[str, Any]]:
+    english = (ENGLISH * (tokens * 4 // len(ENGLISH) + 1))[: tokens * 4]
+    turns = 400
+    per_turn = english[: len(english) // turns]
+    mixed = (ENGLISH + CHINESE) * (tokens // 40)
+    return {
+        "prompt_ascii": {"prompt": english},
+        "chat_history": {"messages": [{"role": "user" if index % 2 else "assistant", "content": per_turn} for index in range(turns)]},
+        "mixed_cjk": {"messages": [{"role": "user", "content": mixed}]},
+    }
+
+
+def bench(payload: Dict[str, Any], iterations: int) -> Dict[str, float]:
+    estimator = TokenEstimator()
+    estimate = estimator.estimate(payload)
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        estimator.estimate(payload)
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+    return {
+        "estimated_tokens": estimate,
+        "p50_us": round(samples[len(samples) // 2] * 1e6, 2),
+        "max_us": round(samples[-1] * 1e6, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tokens", type=int, default=100_000)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+    results = {name: bench(payload, args.iterations) for name, payload in payloads(args.tokens).items()}
+    print(json.dumps({"target_tokens": args.tokens, **results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Gateway peak memory and throughput for large audio uploads.
+
+Compares the JSON route (``/v1/proxy`` with the audio base64-encoded in the
+payload, as clients had to do before) with the streaming ``/v1/upload/asr``
+route. Each case runs in a fresh interpreter that hosts the gateway app (driven
+through httpx's ASGI transport) and a local stub upstream; ``peak_rss_mb`` is
+the growth of the RSS high-water mark (``VmHWM``) over the baseline once the
+upload body has been prepared, so it counts what the gateway adds on top of the
+bytes the client already holds. Upload bodies are fed to the gateway in 64 KiB
+chunks, as a server reading a socket would.
+
+Usage::
+
+    python benchmarks/gateway_upload.py --size-mb 50 --uploads 8 --concurrency 2
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+import yaml
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.stubs import start_stub  # noqa: E402
+
+CHUNK = 64 * 1024
+
+
+def peak_rss_kb() -> int:
+    try:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+async def run_case(mode: str, size_mb: int, uploads: int, concurrency: int) -> dict:
+    server, base_url = start_stub()
+    with tempfile.TemporaryDirectory() as tmp:
+        config = {
+            "models": {"whisper_small": {"endpoint": f"{base_url}/v1/transcribe", "kind": "asr"}},
+            "policies": {"asr": {"default": "whisper_small"}},
+            "scheduler": {"enabled": False},
+        }
+        config_path = Path(tmp) / "routing.yaml"
+        config_path.write_text(yaml.safe_dump(config), encoding="utf-8")
+        os.environ["ROUTING_CONFIG"] = str(config_path)
+        from gateway.app import main as gateway
+
+        audio = os.urandom(size_mb * 1024 * 1024)
+        if mode == "json":
+            body = json.dumps({"task": "asr", "payload": {"audio": base64.b64encode(audio).decode("ascii")}}).encode()
+            del audio
+            path, headers = "/v1/proxy", {"Content-Type": "application/json"}
+        else:
+            body = audio
+            path, headers = "/v1/upload/asr", {"Content-Type": "audio/wav"}
+        headers["Content-Length"] = str(len(body))
+        view = memoryview(body)
+
+        async def chunks():
+            for offset in range(0, len(view), CHUNK):
+                yield view[offset : offset + CHUNK]
+
+        transport = httpx.ASGITransport(app=gateway.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://gateway", timeout=300) as client:
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def send() -> None:
+                async with semaphore:
+                    response = await client.post(path, content=chunks(), headers=headers)
+                    response.raise_for_status()
+
+            baseline = peak_rss_kb()
+            await send()  # warm the upstream pool
+            started = time.perf_counter()
+            await asyncio.gather(*(send() for _ in range(uploads)))
+            elapsed = time.perf_counter() - started
+        await gateway.get_pool().aclose()
+    server.shutdown()
+    return {
+        "body_mb": round(len(body) / 2**20, 1),
+        "peak_rss_mb": round((peak_rss_kb() - baseline) / 1024, 1),
+        "uploads_per_s": round(uploads / elapsed, 2),
+        "throughput_mb_s": round(uploads * size_mb / elapsed, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=50)
+    parser.add_argument("--uploads", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=2)
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.case:
+        print(json.dumps(asyncio.run(run_case(args.case, args.size_mb, args.uploads, args.concurrency))))
+        return
+
+    results = {"size_mb": args.size_mb, "uploads": args.uploads, "concurrency": args.concurrency}
+    for mode in ("json", "upload"):
+        output = subprocess.run(
+            [
+                sys.executable,
+                __file__,
+                "--case",
+                mode,
+                "--size-mb",
+                str(args.size_mb),
+                "--uploads",
+                str(args.uploads),
+                "--concurrency",
+                str(args.concurrency),
+            ],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        results[mode] = json.loads(output.strip().splitlines()[-1])
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+"""Load test the gateway, control plane and media services; compare against a baseline.
+
+Each scenario is driven for ``--duration`` seconds after ``--warmup`` seconds of
+unrecorded traffic, either closed-loop (``--concurrency`` workers that send as
+soon as their previous request completes) or open-loop (requests scheduled at
+``--rps``, constant or Poisson arrivals, whether or not earlier ones finished;
+latency is measured from the scheduled start so a stalled server is not hidden
+by the generator slowing down). The report is JSON: requests, error rate,
+throughput and p50/p95/p99 latency per scenario.
+
+``--offline`` needs no running stack: fake vLLM/Whisper/Piper/vision upstreams
+are started locally with ``--stub-latency-ms`` of latency, and the gateway and
+control plane apps run in-process behind httpx's ASGI transport (so they share
+the event loop with the load generator). Otherwise the URLs given on the
+command line are used; the media defaults are the compose service names, so run
+it from a container on the ``familyai`` network to reach them.
+
+With ``--baseline`` each scenario is compared against a stored report; a p95 or
+throughput change beyond ``--tolerance``, or an error rate more than one point
+higher, counts as a regression and makes the run exit with status 1.
+``--save-baseline`` writes the current report for later runs.
+
+Usage::
+
+    python benchmarks/loadtest.py --offline --mode closed --concurrency 16 --duration 10
+    python benchmarks/loadtest.py --offline --mode open --rps 100 --baseline benchmarks/baselines/offline.json
+    python benchmarks/loadtest.py --gateway http://localhost:8080 --control-plane http://localhost:9000 \\
+        --scenarios route proxy recommend
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import importlib.util
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from contextlib import AsyncExitStack
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+import yaml
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.stubs import SPEECH, start_service_stubs  # noqa: E402
+
+CHAT = {"messages": [{"role": "user", "content": "Explain fractions to a nine-year-old."}], "max_tokens": 64}
+
+
+@lru_cache(maxsize=1)
+def sample_jpeg() -> bytes:
+    from PIL import Image  # vision dependency; only needed for the vision scenario
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (320, 240), (200, 120, 40)).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+@dataclass(frozen=True)
+class Scenario:
+    target: str
+    path: str
+    request: Callable[[], Dict[str, Any]]
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    "route": Scenario("gateway", "/v1/route", lambda: {"json": {"task": "chat", "complexity": 0.3}}),
+    "proxy": Scenario("gateway", "/v1/proxy", lambda: {"json": {"task": "chat", "payload": CHAT}}),
+    "upload_asr": Scenario(
+        "gateway", "/v1/upload/asr", lambda: {"content": SPEECH, "headers": {"Content-Type": "audio/wav"}}
+    ),
+    "recommend": Scenario(
+        "control_plane",
+        "/recommend",
+        lambda: {"json": {"task": "chat", "context_tokens": 2048, "priority": "balanced", "allow_cloud": False}},
+    ),
+    "transcribe": Scenario("whisper", "/v1/transcribe", lambda: {"files": {"file": ("clip.wav", SPEECH, "audio/wav")}}),
+    "speak": Scenario("piper", "/v1/speak", lambda: {"json": {"text": "Dinner is ready in five minutes."}}),
+    "vision": Scenario("vision", "/v1/vision", lambda: {"files": {"file": ("photo.jpg", sample_jpeg(), "image/jpeg")}}),
+}
+
+
+@dataclass
+class Samples:
+    latencies_s: List[float] = field(default_factory=list)
+    statuses: Counter = field(default_factory=Counter)
+    errors: int = 0
+
+    def record(self, latency_s: float, status: Optional[int]) -> None:
+        self.latencies_s.append(latency_s)
+        self.statuses[str(status) if status is not None else "transport_error"] += 1
+        if status is None or status >= 400:
+            self.errors += 1
+
+
+def percentile(ordered: List[float], quantile: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(quantile * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def summarize(samples: Samples, elapsed_s: float) -> Dict[str, Any]:
+    ordered = sorted(samples.latencies_s)
+    total = len(ordered)
+    return {
+        "requests": total,
+        "errors": samples.errors,
+        "error_rate": round(samples.errors / total, 4) if total else 0.0,
+        "throughput_rps": round((total - samples.errors) / elapsed_s, 2) if elapsed_s else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(ordered, 0.50) * 1e3, 2),
+            "p95": round(percentile(ordered, 0.95) * 1e3, 2),
+            "p99": round(percentile(ordered, 0.99) * 1e3, 2),
+            "max": round(ordered[-1] * 1e3, 2) if ordered else 0.0,
+            "mean": round(sum(ordered) / total * 1e3, 2) if total else 0.0,
+        },
+        "status_codes": dict(sorted(samples.statuses.items())),
+    }
+
+
+async def send(client: httpx.AsyncClient, scenario: Scenario, samples: Optional[Samples], started: float) -> None:
+    try:
+        response = await client.post(scenario.path, **scenario.request())
+        await response.aread()
+        status: Optional[int] = response.status_code
+    except httpx.HTTPError:
+        status = None
+    if samples is not None:
+        samples.record(time.perf_counter() - started, status)
+
+
+async def closed_loop(client: httpx.AsyncClient, scenario: Scenario, concurrency: int, warmup_s: float, duration_s: float):
+    samples = Samples()
+    recording_at = time.perf_counter() + warmup_s
+    deadline = recording_at + duration_s
+
+    async def worker() -> None:
+        while True:
+            started = time.perf_counter()
+            if started >= deadline:
+                return
+            await send(client, scenario, samples if started >= recording_at else None, started)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return samples, duration_s
+
+
+async def open_loop(
+    client: httpx.AsyncClient, scenario: Scenario, rps: float, arrivals: str, warmup_s: float, duration_s: float
+):
+    samples = Samples()
+    rng = random.Random(7)
+    begin = time.perf_counter()
+    recording_at = begin + warmup_s
+    deadline = recording_at + duration_s
+    scheduled = begin
+    pending = set()
+    while scheduled < deadline:
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        task = asyncio.create_task(send(client, scenario, samples if scheduled >= recording_at else None, scheduled))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+        scheduled += rng.expovariate(rps) if arrivals == "poisson" else 1.0 / rps
+    if pending:
+        await asyncio.gather(*pending)
+    # requests still running at the deadline are part of the measured window
+    return samples, max(duration_s, time.perf_counter() - recording_at)
+
+
+def load_control_plane(root: Path):
+    os.environ["CONTROL_PLANE_ROOT"] = str(root)
+    spec = importlib.util.spec_from_file_location("control_plane_loadtest", ROOT / "control-plane" / "app" / "main.py")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["control_plane_loadtest"] = module
+    assert spec.loader is not None
+    spec.loader.exec_module(module)  # type: ignore
+    return module
+
+
+def offline_routing(stubs: Dict[str, str]) -> Dict[str, Any]:
+    return {
+        "models": {
+            "qwen3_8b": {"endpoint": f"{stubs['vllm']}/v1/chat/completions", "kind": "chat"},
+            "qwen3_32b": {"endpoint": f"{stubs['vllm']}/v1/chat/completions", "kind": "chat"},
+            "qwen2_5_coder_32b": {"endpoint": f"{stubs['vllm']}/v1/completions", "kind": "code"},
+            "qwen2_vl_7b": {"endpoint": f"{stubs['vision']}/v1/vision", "kind": "vision"},
+            "whisper_small": {"endpoint": f"{stubs['whisper']}/v1/transcribe", "kind": "asr"},
+            "piper_tts": {"endpoint": f"{stubs['piper']}/v1/speak", "kind": "tts"},
+        },
+        "policies": {
+            "chat": {"balanced": "qwen3_8b", "complex": "qwen3_32b"},
+            "code": {"default": "qwen2_5_coder_32b", "long_context": "qwen2_5_coder_32b"},
+            "vision": {"default": "qwen2_vl_7b"},
+            "asr": {"default": "whisper_small"},
+            "tts": {"default": "piper_tts"},
+        },
+        "http_client": {"max_connections": 256, "max_keepalive_connections": 256},
+        "scheduler": {"max_in_flight": 256, "max_queue": 1024},
+    }
+
+
+async def open_clients(args: argparse.Namespace, stack: AsyncExitStack, tmp: Path) -> Dict[str, httpx.AsyncClient]:
+    limits = httpx.Limits(max_connections=max(64, args.concurrency * 2), max_keepalive_connections=max(64, args.concurrency * 2))
+    timeout = httpx.Timeout(args.timeout)
+    urls = {
+        "gateway": args.gateway,
+        "control_plane": args.control_plane,
+        "whisper": args.whisper,
+        "piper": args.piper,
+        "vision": args.vision,
+    }
+    apps: Dict[str, Any] = {}
+    if args.offline:
+        latency = args.stub_latency_ms / 1e3
+        servers = start_service_stubs({name: latency for name in ("vllm", "whisper", "piper", "vision")}, args.stub_jitter_ms / 1e3)
+        stubs = {name: url for name, (_, url) in servers.items()}
+        stack.callback(lambda: [server.shutdown() for server, _ in servers.values()])
+        routing_path = tmp / "routing.yaml"
+        routing_path.write_text(yaml.safe_dump(offline_routing(stubs)), encoding="utf-8")
+        os.environ["ROUTING_CONFIG"] = str(routing_path)
+        os.environ.pop("CONTROL_PLANE_URL", None)
+        os.environ.setdefault("LOG_LEVEL", "WARNING")  # per-request INFO logs would skew the numbers
+        shutil.copytree(ROOT / "control-plane" / "config", tmp / "control-plane" / "config")
+        from gateway.app import main as gateway
+
+        apps = {"gateway": gateway.app, "control_plane": load_control_plane(tmp / "control-plane").app}
+        urls.update({name: stubs[name] for name in ("whisper", "piper", "vision")})
+        stack.push_async_callback(gateway.shutdown)
+
+    clients = {}
+    for name, url in urls.items():
+        if name in apps:
+            transport = httpx.ASGITransport(app=apps[name])
+            client = httpx.AsyncClient(transport=transport, base_url=f"http://{name}", timeout=timeout)
+        elif url:
+            client = httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits)
+        else:
+            continue
+        clients[name] = await stack.enter_async_context(client)
+    return clients
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> Dict[str, Any]:
+    comparison: Dict[str, Any] = {}
+    for name, current in report["scenarios"].items():
+        previous = (baseline.get("scenarios") or {}).get(name)
+        if not previous:
+            continue
+        p95, base_p95 = current["latency_ms"]["p95"], previous["latency_ms"]["p95"]
+        rps, base_rps = current["throughput_rps"], previous["throughput_rps"]
+        p95_change = (p95 - base_p95) / base_p95 if base_p95 else 0.0
+        rps_change = (rps - base_rps) / base_rps if base_rps else 0.0
+        error_delta = current["error_rate"] - previous["error_rate"]
+        reasons = []
+        if p95_change > tolerance:
+            reasons.append("p95")
+        if rps_change < -tolerance:
+            reasons.append("throughput")
+        if error_delta > 0.01:
+            reasons.append("error_rate")
+        comparison[name] = {
+            "p95_change": round(p95_change, 4),
+            "throughput_change": round(rps_change, 4),
+            "error_rate_delta": round(error_delta, 4),
+            "regressions": reasons,
+        }
+    settings = ("mode", "concurrency", "rps", "offline", "stub_latency_ms")
+    mismatched = [key for key in settings if report.get(key) != baseline.get(key)]
+    return {"tolerance": tolerance, "settings_differ": mismatched, "scenarios": comparison}
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    report: Dict[str, Any] = {
+        "mode": args.mode,
+        "concurrency": args.concurrency if args.mode == "closed" else None,
+        "rps": args.rps if args.mode == "open" else None,
+        "arrivals": args.arrivals if args.mode == "open" else None,
+        "duration_s": args.duration,
+        "offline": args.offline,
+        "stub_latency_ms": args.stub_latency_ms if args.offline else None,
+        "scenarios": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        async with AsyncExitStack() as stack:
+            clients = await open_clients(args, stack, Path(tmp))
+            for name in args.scenarios:
+                scenario = SCENARIOS[name]
+                client = clients.get(scenario.target)
+                if client is None:
+                    report["scenarios"][name] = {"skipped": f"no URL for {scenario.target}"}
+                    continue
+                if args.mode == "closed":
+                    samples, elapsed = await closed_loop(client, scenario, args.concurrency, args.warmup, args.duration)
+                else:
+                    samples, elapsed = await open_loop(client, scenario, args.rps, args.arrivals, args.warmup, args.duration)
+                report["scenarios"][name] = summarize(samples, elapsed)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--mode", choices=("closed", "open"), default="closed")
+    parser.add_argument("--concurrency", type=int, default=16, help="closed-loop workers")
+    parser.add_argument("--rps", type=float, default=50.0, help="open-loop arrival rate")
+    parser.add_argument("--arrivals", choices=("constant", "poisson"), default="constant")
+    parser.add_argument("--duration", type=float, default=10.0, help="measured seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=1.0, help="unrecorded seconds per scenario")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--offline", action="store_true", help="stub upstreams, in-process gateway and control plane")
+    parser.add_argument("--stub-latency-ms", type=float, default=20.0)
+    parser.add_argument("--stub-jitter-ms", type=float, default=5.0)
+    parser.add_argument("--gateway", default=os.getenv("GATEWAY_URL", "http://localhost:8080"))
+    parser.add_argument("--control-plane", default=os.getenv("CONTROL_PLANE_URL", "http://localhost:9000"))
+    parser.add_argument("--whisper", default=os.getenv("WHISPER_URL", "http://whisper:8500"))
+    parser.add_argument("--piper", default=os.getenv("PIPER_URL", "http://piper:8600"))
+    parser.add_argument("--vision", default=os.getenv("VISION_URL", "http://vision:8300"))
+    parser.add_argument("--baseline", type=Path, help="report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="allowed relative p95/throughput change")
+    parser.add_argument("--save-baseline", type=Path, help="write this run's report here")
+    parser.add_argument("--output", type=Path, help="also write the report to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    regressed = False
+    if args.baseline:
+        report["comparison"] = compare(report, json.loads(args.baseline.read_text(encoding="utf-8")), args.tolerance)
+        regressed = any(entry["regressions"] for entry in report["comparison"]["scenarios"].values())
+    print(json.dumps(report, indent=2))
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    if args.save_baseline:
+        baseline = {key: value for key, value in report.items() if key != "comparison"}
+        args.save_baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.save_baseline.write_text(json.dumps(baseline, indent=2) + "\n", encoding="utf-8")
+    if regressed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Per-request cost of the shared Prometheus middleware.
+
+Drives a minimal FastAPI app over raw ASGI (no sockets) with and without
+``familyai_common.metrics`` installed and reports the difference per request.
+
+Usage::
+
+    python benchmarks/metrics_middleware.py --requests 20000
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+from fastapi import FastAPI
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from familyai_common.metrics import install  # noqa: E402
+
+
+def build_app(instrumented: bool) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/health")
+    async def health() -> dict:
+        return {"status": "ok"}
+
+    if instrumented:
+        install(app, "bench")
+    return app
+
+
+async def drive(app: FastAPI, total: int) -> float:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/health",
+        "raw_path": b"/health",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [],
+        "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80),
+    }
+
+    async def receive() -> dict:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(_message: dict) -> None:
+        return None
+
+    for _ in range(min(total, 500)):  # warm up label children and the route table
+        await app(dict(scope), receive, send)
+    started = time.perf_counter()
+    for _ in range(total):
+        await app(dict(scope), receive, send)
+    return (time.perf_counter() - started) / total
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+    bare = asyncio.run(drive(build_app(False), args.requests))
+    instrumented = asyncio.run(drive(build_app(True), args.requests))
+    print(
+        json.dumps(
+            {
+                "requests": args.requests,
+                "bare_us": round(bare * 1e6, 2),
+                "instrumented_us": round(instrumented * 1e6, 2),
+                "overhead_us": round((instrumented - bare) * 1e6, 2),
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
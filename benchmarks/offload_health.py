@@ -0,0 +1,123 @@
+"""``/health`` latency on the vision service while large images are being analysed.
+
+Drives the real vision app over ``httpx.ASGITransport`` (one event loop, as under
+uvicorn). For each mode it measures ``/health`` with no load, then again while
+``--concurrency`` clients keep posting ``--megapixels`` JPEGs. ``inline`` runs the
+analysis on the event loop as the handler used to; ``offload`` uses the service's
+``OffloadPool``.
+
+Usage::
+
+    python benchmarks/offload_health.py --megapixels 12 --concurrency 4 --probes 100
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import importlib.util
+import io
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import httpx
+import numpy as np
+from PIL import Image
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+
+def load_vision() -> Any:
+    spec = importlib.util.spec_from_file_location("vision_service", ROOT / "vision" / "serve.py")
+    module = importlib.util.module_from_spec(spec)
+    assert spec.loader is not None
+    spec.loader.exec_module(module)  # type: ignore
+    return module
+
+
+def make_jpeg(megapixels: float) -> bytes:
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(megapixels * 1e6 / width)
+    pixels = np.random.default_rng(0).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def quantiles(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1e3, 2)  # noqa: E731
+    return {"p50_ms": pick(0.5), "p99_ms": pick(0.99), "max_ms": round(ordered[-1] * 1e3, 2)}
+
+
+async def probe(client: httpx.AsyncClient, count: int, interval_s: float) -> List[float]:
+    latencies = []
+    for _ in range(count):
+        started = time.perf_counter()
+        (await client.get("/health")).raise_for_status()
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(interval_s)
+    return latencies
+
+
+async def run_mode(module: Any, image: bytes, concurrency: int, probes: int, interval_s: float) -> Dict[str, Any]:
+    transport = httpx.ASGITransport(app=module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://vision", timeout=600) as client:
+        idle = await probe(client, probes, interval_s)
+        stop = asyncio.Event()
+        completed = 0
+        statuses: Dict[int, int] = {}
+
+        async def heavy() -> None:
+            nonlocal completed
+            while not stop.is_set():
+                response = await client.post("/v1/vision", files={"file": ("photo.jpg", image, "image/jpeg")})
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                completed += 1
+
+        workers = [asyncio.create_task(heavy()) for _ in range(concurrency)]
+        await asyncio.sleep(0.05)
+        started = time.perf_counter()
+        loaded = await probe(client, probes, interval_s)
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await asyncio.gather(*workers)
+    return {
+        "health_idle": quantiles(idle),
+        "health_under_load": quantiles(loaded),
+        "heavy_per_s": round(completed / elapsed, 2),
+        "heavy_statuses": statuses,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--megapixels", type=float, default=12)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--probes", type=int, default=100)
+    parser.add_argument("--interval-ms", type=float, default=10)
+    args = parser.parse_args()
+
+    module = load_vision()
+    image = make_jpeg(args.megapixels)
+    results = {}
+    for mode in ("inline", "offload"):
+        if mode == "inline":
+            original = module.offload.run
+
+            async def inline(fn, *fn_args, request=None):
+                return fn(*fn_args)
+
+            module.offload.run = inline
+        else:
+            module.offload.run = original
+        results[mode] = asyncio.run(run_mode(module, image, args.concurrency, args.probes, args.interval_ms / 1000))
+    module.offload.shutdown()
+    print(json.dumps({"megapixels": args.megapixels, "concurrency": args.concurrency, **results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Local stand-ins for FamilyAI upstreams used by the benchmarks.
+
+The stubs run on the standard library HTTP server in a background thread so the
+benchmarks work offline and without any model weights. Replies are shaped like
+the real service's for the request path (OpenAI completions for vLLM, a
+transcript for Whisper, WAV audio for Piper, a description for vision), after a
+configurable latency with optional uniform jitter.
+"""
+from __future__ import annotations
+
+import json
+import random
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+SAMPLE_RATE = 22_050
+
+
+def silent_wav(seconds: float = 0.5) -> bytes:
+    """A mono 16-bit PCM WAV of silence."""
+    data = b"\x00\x00" * int(SAMPLE_RATE * seconds)
+    header = struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + len(data), b"WAVE", b"fmt ", 16, 1, 1, SAMPLE_RATE, SAMPLE_RATE * 2, 2, 16, b"data", len(data),
+    )
+    return header + data
+
+
+SPEECH = silent_wav()
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body go out in separate writes; without this, delayed ACKs add ~40 ms
+    disable_nagle_algorithm = True
+    latency_s = 0.0
+    jitter_s = 0.0
+
+    def log_message(self, *_args) -> None:  # keep benchmark output clean
+        pass
+
+    def _reply(self, payload: dict) -> None:
+        self._send(json.dumps(payload).encode("utf-8"), "application/json")
+
+    def _send(self, body: bytes, content_type: str) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        self._reply({"status": "ok"})
+
+    def do_POST(self) -> None:
+        remaining = int(self.headers.get("Content-Length", 0))
+        while remaining:
+            # drain large uploads in chunks so the stub does not show up in memory benchmarks
+            remaining -= len(self.rfile.read(min(remaining, 1 << 20)))
+        if self.latency_s or self.jitter_s:
+            time.sleep(self.latency_s + random.uniform(0.0, self.jitter_s))
+        path = self.path.split("?", 1)[0]
+        if path.endswith("/transcribe"):
+            self._reply({"text": "hello", "language": "en", "segments": []})
+        elif path.endswith("/speak"):
+            self._send(SPEECH, "audio/wav")
+        elif path.endswith("/vision"):
+            self._reply({"prompt": "Describe", "dominant_color": "#000000", "palette": []})
+        elif path.endswith("/chat/completions"):
+            self._reply({"choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "text": "ok"}]})
+        else:
+            self._reply({"choices": [{"text": "ok"}]})
+
+
+def start_stub(latency_s: float = 0.0, host: str = "127.0.0.1", jitter_s: float = 0.0) -> Tuple[ThreadingHTTPServer, str]:
+    """Start a keep-alive upstream and return ``(server, base_url)``."""
+    handler = type("StubHandler", (_StubHandler,), {"latency_s": latency_s, "jitter_s": jitter_s})
+    server_cls = type("StubServer", (ThreadingHTTPServer,), {"request_queue_size": 256})
+    server = server_cls((host, 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def start_service_stubs(
+    latency_s: Optional[Dict[str, float]] = None, jitter_s: float = 0.0
+) -> Dict[str, Tuple[ThreadingHTTPServer, str]]:
+    """One stub per FamilyAI upstream (vllm, whisper, piper, vision), each with its own latency."""
+    latency_s = latency_s or {}
+    return {
+        name: start_stub(latency_s.get(name, 0.0), jitter_s=jitter_s) for name in ("vllm", "whisper", "piper", "vision")
+    }
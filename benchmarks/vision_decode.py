@@ -0,0 +1,102 @@
+"""Vision decode time and peak memory for large JPEGs, with and without ``draft()``.
+
+Each (mode, size) case runs in a fresh interpreter so the RSS high-water mark
+(``VmHWM``) is that case's own peak; ``peak_rss_mb`` is the growth over the
+interpreter's baseline once imports and the JPEG bytes are loaded. ``full`` is
+the previous behaviour (decode everything, then box-reduce), ``draft`` lets
+libjpeg decode at 1/2-1/8 scale. ``cached_ms`` is a repeated ``describe()`` of
+the same upload, answered from the thumbnail cache. ``palette_delta`` is the
+largest difference in palette fractions between the two modes.
+
+Usage::
+
+    python benchmarks/vision_decode.py --sizes 3 12 24 48 --repeat 3
+"""
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.vision_dominant_color import make_jpeg, peak_rss_kb  # noqa: E402
+
+
+def load_service(draft: bool):
+    os.environ["DRAFT_DECODE"] = "1" if draft else "0"
+    os.environ.setdefault("MAX_IMAGE_MEGAPIXELS", "200")
+    spec = importlib.util.spec_from_file_location("vision_service", ROOT / "vision" / "serve.py")
+    module = importlib.util.module_from_spec(spec)
+    assert spec.loader is not None
+    spec.loader.exec_module(module)  # type: ignore
+    return module
+
+
+def run_case(mode: str, path: str, repeat: int) -> dict:
+    service = load_service(mode == "draft")
+    image_bytes = Path(path).read_bytes()
+    baseline = peak_rss_kb()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        thumbnail = service.decode_thumbnail(image_bytes)
+        timings.append(time.perf_counter() - started)
+    peak = peak_rss_kb()
+    service.describe(image_bytes)
+    started = time.perf_counter()
+    described = service.describe(image_bytes)
+    cached = time.perf_counter() - started
+    assert described["cache"] == "hit"
+    return {
+        "decode_ms": round(min(timings) * 1e3, 1),
+        "peak_rss_mb": round((peak - baseline) / 1024, 1),
+        "draft_scale": thumbnail.draft_scale,
+        "analysis_pixels": len(thumbnail.pixels),
+        "cached_ms": round(cached * 1e3, 2),
+        "palette": [entry["fraction"] for entry in described["palette"]],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=float, nargs="+", default=[3, 12, 24, 48], help="megapixels")
+    parser.add_argument("--repeat", type=int, default=3, help="decodes per case; the fastest is reported")
+    parser.add_argument("--case", nargs=3, metavar=("MODE", "PATH", "REPEAT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.case:
+        mode, path, repeat = args.case
+        print(json.dumps(run_case(mode, path, int(repeat))))
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for megapixels in args.sizes:
+            path = Path(tmp) / f"{megapixels}mp.jpg"
+            make_jpeg(megapixels, path)
+            row: dict = {"megapixels": megapixels, "jpeg_mb": round(path.stat().st_size / 1e6, 1)}
+            for mode in ("full", "draft"):
+                output = subprocess.run(
+                    [sys.executable, __file__, "--case", mode, str(path), str(args.repeat)],
+                    check=True,
+                    capture_output=True,
+                    text=True,
+                ).stdout
+                row[mode] = json.loads(output)
+            row["speedup"] = round(row["full"]["decode_ms"] / row["draft"]["decode_ms"], 1)
+            row["palette_delta"] = round(
+                max(abs(a - b) for a, b in zip(row["full"].pop("palette"), row["draft"].pop("palette"))), 4
+            )
+            results.append(row)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Dominant-colour latency and peak memory: ``Counter(image.getdata())`` vs the NumPy path.
+
+Each (implementation, size) case runs in a fresh interpreter so the RSS
+high-water mark (``VmHWM``) is that case's own peak; ``peak_rss_mb`` is the
+growth over the interpreter's baseline once imports and the JPEG bytes are
+loaded. Images are noisy gradients encoded as JPEG, so most pixels have a
+colour of their own.
+
+Usage::
+
+    python benchmarks/vision_dominant_color.py --sizes 0.3 3 12 48 --legacy-max-mp 12
+"""
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import io
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+
+def make_jpeg(megapixels: float, path: Path) -> None:
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(megapixels * 1e6 / width)
+    rng = np.random.default_rng(0)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    pixels = np.empty((height, width, 3), dtype=np.uint8)
+    pixels[..., 0] = x
+    pixels[..., 1] = y
+    pixels[..., 2] = np.clip((x + y) / 2 + rng.normal(0, 12, (height, width)), 0, 255)
+    Image.fromarray(pixels).save(path, format="JPEG", quality=90)
+
+
+def legacy(image_bytes: bytes) -> str:
+    image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+    dominant_rgb, _ = Counter(image.getdata()).most_common(1)[0]
+    return "#%02x%02x%02x" % dominant_rgb
+
+
+def load_vectorized():
+    spec = importlib.util.spec_from_file_location("vision_service", ROOT / "vision" / "serve.py")
+    module = importlib.util.module_from_spec(spec)
+    assert spec.loader is not None
+    spec.loader.exec_module(module)  # type: ignore
+    return lambda image_bytes: module.describe(image_bytes)["dominant_color"]
+
+
+def peak_rss_kb() -> int:
+    """Per-process RSS high-water mark; ``ru_maxrss`` is inherited across exec on Linux."""
+    try:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_case(implementation: str, path: str) -> dict:
+    describe = legacy if implementation == "legacy" else load_vectorized()
+    image_bytes = Path(path).read_bytes()
+    baseline = peak_rss_kb()
+    started = time.perf_counter()
+    color = describe(image_bytes)
+    elapsed = time.perf_counter() - started
+    return {
+        "latency_ms": round(elapsed * 1e3, 1),
+        "peak_rss_mb": round((peak_rss_kb() - baseline) / 1024, 1),
+        "color": color,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=float, nargs="+", default=[0.3, 3, 12, 48], help="megapixels")
+    parser.add_argument("--legacy-max-mp", type=float, default=48, help="skip the Counter path above this size")
+    parser.add_argument("--case", nargs=2, metavar=("IMPL", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.case:
+        print(json.dumps(run_case(*args.case)))
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for megapixels in args.sizes:
+            path = Path(tmp) / f"{megapixels}mp.jpg"
+            make_jpeg(megapixels, path)
+            row: dict = {"megapixels": megapixels}
+            for implementation in ("legacy", "vectorized"):
+                if implementation == "legacy" and megapixels > args.legacy_max_mp:
+                    row[implementation] = None
+                    continue
+                output = subprocess.run(
+                    [sys.executable, __file__, "--case", implementation, str(path)],
+                    check=True,
+                    capture_output=True,
+                    text=True,
+                ).stdout
+                row[implementation] = json.loads(output)
+            if row["legacy"]:
+                row["speedup"] = round(row["legacy"]["latency_ms"] / row["vectorized"]["latency_ms"], 1)
+            results.append(row)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,42 +1,85 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
 import json
+import math
 import os
-from functools import lru_cache
+import threading
+import time
+from collections import deque
+from itertools import islice
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Any, Callable, Deque, Dict, FrozenSet, Iterator, List, NamedTuple, Optional, Tuple
 
-import yaml
-from fastapi import Body, FastAPI, HTTPException
+from fastapi import Body, FastAPI, HTTPException, Response
 from pydantic import BaseModel, Field
 
+from familyai_common.config import ConfigWatcher, poll_interval
+from familyai_common.downloads import DownloadFile, DownloadScheduler
+from familyai_common.metrics import install as install_metrics
+from familyai_common.readiness import Readiness
+from familyai_common.readiness import install as install_readiness
+from familyai_common.store import DocumentStore, journal_path
+
 BASE_PATH = Path(os.getenv("CONTROL_PLANE_ROOT", Path(__file__).resolve().parent.parent))
 CONFIG_PATH = BASE_PATH / "config" / "models.yaml"
 STATE_PATH = BASE_PATH / "config" / "state.json"
+MEMORY_BUDGET_GB = float(os.getenv("MEMORY_BUDGET_GB", "0"))  # 0 = track residency without a budget
+RESIDENT_BONUS = float(os.getenv("RESIDENT_BONUS", "1.0"))
+EVICTION_PENALTY = float(os.getenv("EVICTION_PENALTY", "2.0"))
+LATENCY_HALF_LIFE_S = float(os.getenv("LATENCY_HALF_LIFE_S", "60"))
+LATENCY_MIN_SAMPLES = float(os.getenv("LATENCY_MIN_SAMPLES", "5"))
+
+_models_config: Optional[ConfigWatcher] = None
+_stores: Dict[str, DocumentStore] = {}
+
+
+def get_store(name: str) -> DocumentStore:
+    """Writer-side handle on ``state.json`` (``"state"``) or ``models.yaml`` (``"models"``)."""
+    store = _stores.get(name)
+    if store is None:
+        if name == "state":
+            store = DocumentStore(STATE_PATH, "state", default={"active_profile": "default"}, journal_path=journal_path(STATE_PATH))
+        elif name == "models":
+            store = DocumentStore(CONFIG_PATH, "models", fmt="yaml", journal_path=journal_path(CONFIG_PATH))
+        else:
+            raise HTTPException(status_code=404, detail=f"Unknown store {name}")
+        store = _stores.setdefault(name, store)
+    return store
 
-def _load_yaml(path: Path) -> Dict[str, object]:
-    with path.open("r", encoding="utf-8") as handle:
-        return yaml.safe_load(handle)
 
+def get_state() -> Dict[str, object]:
+    return get_store("state").read()
 
-def _load_state() -> Dict[str, object]:
-    if STATE_PATH.exists():
-        return json.loads(STATE_PATH.read_text(encoding="utf-8"))
-    return {"active_profile": "default"}
 
+def get_models_config() -> ConfigWatcher:
+    global _models_config
+    if _models_config is None:
+        if not CONFIG_PATH.exists():
+            raise RuntimeError(f"Model config missing at {CONFIG_PATH}")
+        # the catalog index is built and validated during the reload, off the request path
+        _models_config = ConfigWatcher(CONFIG_PATH, "models", prepare=CatalogIndex)
+    return _models_config
 
-def _write_state(state: Dict[str, object]) -> None:
-    STATE_PATH.write_text(json.dumps(state, indent=2), encoding="utf-8")
+
+def reset_config() -> None:
+    global _models_config, _residency, _latency
+    _models_config = None
+    _residency = None
+    _latency = None
+    _stores.clear()
 
 
-@lru_cache(maxsize=1)
 def get_config() -> Dict[str, object]:
-    if not CONFIG_PATH.exists():
-        raise RuntimeError(f"Model config missing at {CONFIG_PATH}")
-    return _load_yaml(CONFIG_PATH)
+    return get_models_config().current.data
 
 
 app = FastAPI(title="FamilyAI Control Plane", version="0.2.0")
+install_metrics(app, "control-plane")
+readiness = Readiness("control-plane")
+readiness.register("models_config")
+install_readiness(app, readiness)
 
 
 class ModelDescriptor(BaseModel):
@@ -71,10 +114,18 @@ class RecommendationRequest(BaseModel):
     allow_cloud: bool = True
 
 
+class Placement(BaseModel):
+    action: str = Field(description="resident | load | evict | queue | refuse")
+    evict: List[str] = Field(default_factory=list, description="Resident models to unload first, least recently used first.")
+    free_gb: Optional[float] = None
+
+
 class RecommendationResponse(BaseModel):
     model: ModelDescriptor
     score: float
     rationale: List[str]
+    placement: Optional[Placement] = Field(None, description="Residency decision for local models.")
+    alternatives: List[ModelDescriptor] = Field(default_factory=list, description="Next-best feasible models, best first.")
 
 
 @app.get("/health")
@@ -82,14 +133,16 @@ def health() -> Dict[str, str]:
     return {"status": "ok"}
 
 
+@app.get("/version")
+def version(response: Response) -> Dict[str, str]:
+    current = config_version()
+    response.headers["ETag"] = f'"{current}"'
+    return {"version": current}
+
+
 @app.get("/models", response_model=List[ModelDescriptor])
 def list_models() -> List[ModelDescriptor]:
-    config = get_config()
-    models = []
-    for key, value in config.get("models", {}).items():
-        entry = ModelDescriptor(id=key, **value)
-        models.append(entry)
-    return models
+    return list(get_catalog().models.values())
 
 
 @app.get("/profiles", response_model=ProfilesResponse)
@@ -98,7 +151,7 @@ def list_profiles() -> ProfilesResponse:
     profiles: List[ProfileDescriptor] = []
     for name, data in config.get("profiles", {}).items():
         profiles.append(ProfileDescriptor(name=name, routing=data.get("routing", {}), description=data.get("description")))
-    state = _load_state()
+    state = get_state()
     return ProfilesResponse(active_profile=state.get("active_profile", "default"), profiles=profiles)
 
 
@@ -107,30 +160,34 @@ def activate_profile(profile_name: str) -> Dict[str, str]:
     config = get_config()
     if profile_name not in config.get("profiles", {}):
         raise HTTPException(status_code=404, detail=f"Unknown profile {profile_name}")
-    state = _load_state()
-    state["active_profile"] = profile_name
-    _write_state(state)
+
+    def activate(state: Dict[str, object]) -> None:
+        state["active_profile"] = profile_name
+
+    get_store("state").update(f"activate_profile:{profile_name}", activate)
     return {"status": "ok", "active_profile": profile_name}
 
 
-def _score_model(model: ModelDescriptor, request: RecommendationRequest) -> tuple[float, list[str]]:
+PRIORITIES = ("balanced", "speed", "quality", "cost")
+MAX_ALTERNATIVES = 3
+# score lost per millisecond of latency; also applied to the difference between live and static latency
+LATENCY_WEIGHTS = {"speed": 1 / 1000, "balanced": 1 / 1500}
+
+
+def _static_score(model: ModelDescriptor, priority: str) -> Tuple[float, List[str]]:
+    """Score the request-independent part of a model for ``priority``."""
     score = 0.0
     rationale: List[str] = []
 
-    # Context fit
-    if model.context and model.context < request.context_tokens:
-        rationale.append("Insufficient context window")
-        return -1e9, rationale
-
-    if request.priority == "speed":
+    if priority == "speed":
         latency = model.latency_ms or 10_000
-        score -= latency / 1000
+        score -= latency * LATENCY_WEIGHTS["speed"]
         rationale.append(f"Speed priority latency={latency}ms")
-    elif request.priority == "cost":
+    elif priority == "cost":
         cost = model.cost_per_million or 0.0
         score -= cost
         rationale.append(f"Cost priority cost={cost}")
-    elif request.priority == "quality":
+    elif priority == "quality":
         # treat bigger memory footprint as proxy for quality
         quality = model.memory_gb or 1
         score += quality
@@ -139,15 +196,12 @@ def _score_model(model: ModelDescriptor, request: RecommendationRequest) -> tupl
         latency = model.latency_ms or 10_000
         cost = model.cost_per_million or 0.0
         score += (model.memory_gb or 1) * 0.6
-        score -= latency / 1500
+        score -= latency * LATENCY_WEIGHTS["balanced"]
         score -= cost * 0.2
         rationale.append(f"Balanced score latency={latency} cost={cost}")
 
     # Provider preference: local before cloud unless allowed
     if model.provider.startswith("cloud"):
-        if not request.allow_cloud:
-            rationale.append("Cloud models disabled")
-            return -1e9, rationale
         score -= 0.5  # bias toward local
         rationale.append("Cloud penalty -0.5")
     else:
@@ -156,45 +210,544 @@ def _score_model(model: ModelDescriptor, request: RecommendationRequest) -> tupl
     return score, rationale
 
 
-@app.post("/recommend", response_model=RecommendationResponse)
-def recommend(request: RecommendationRequest = Body(...)) -> RecommendationResponse:
-    config = get_config()
-    models = [ModelDescriptor(id=key, **value) for key, value in config.get("models", {}).items() if value.get("task") == request.task]
-    if not models:
+class ScoredModel(NamedTuple):
+    """Immutable index record: everything ``/recommend`` needs besides the request."""
+
+    score: float
+    context: int
+    cloud: bool
+    rationale: Tuple[str, ...]
+    descriptor: ModelDescriptor
+
+
+class CatalogIndex:
+    """Per-task, per-priority ranking of the catalog, built once per config load."""
+
+    def __init__(self, config: Dict[str, object]) -> None:
+        self.config = config
+        canonical = json.dumps(config, sort_keys=True, default=str)
+        self.digest = hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+        self.models: Dict[str, ModelDescriptor] = {
+            key: ModelDescriptor(id=key, **value) for key, value in (config.get("models") or {}).items()
+        }
+        self.ranked: Dict[Tuple[str, str], Tuple[ScoredModel, ...]] = {}
+        for priority in PRIORITIES:
+            by_task: Dict[str, List[ScoredModel]] = {}
+            for model in self.models.values():
+                score, rationale = _static_score(model, priority)
+                record = ScoredModel(score, model.context or 0, model.provider.startswith("cloud"), tuple(rationale), model)
+                by_task.setdefault(model.task, []).append(record)
+            for task, records in by_task.items():
+                # stable sort keeps catalog order for ties, matching the original linear scan
+                self.ranked[(task, priority)] = tuple(sorted(records, key=lambda record: -record.score))
+
+    def candidates(self, task: str, priority: str) -> Tuple[ScoredModel, ...]:
+        if priority not in PRIORITIES:
+            priority = "balanced"
+        return self.ranked.get((task, priority), ())
+
+    def feasible(self, request: RecommendationRequest) -> Iterator[ScoredModel]:
+        """Yield records that fit the request, best first."""
+        for record in self.candidates(request.task, request.priority):
+            if record.context and record.context < request.context_tokens:
+                continue
+            if record.cloud and not request.allow_cloud:
+                continue
+            yield record
+
+    def best(self, request: RecommendationRequest) -> Optional[ScoredModel]:
+        return next(self.feasible(request), None)
+
+
+def get_catalog() -> CatalogIndex:
+    return get_models_config().current.prepared
+
+
+class Fit(NamedTuple):
+    action: str
+    evict: Tuple[str, ...] = ()
+
+
+LOAD = Fit("load")
+
+
+class ResidencyView(NamedTuple):
+    """Immutable picture of device memory; replaced wholesale on every load or evict."""
+
+    version: int
+    budget_gb: float
+    resident: Dict[str, float]  # model id -> footprint, least recently loaded first
+    used_gb: float
+
+    @property
+    def free_gb(self) -> float:
+        return self.budget_gb - self.used_gb if self.budget_gb > 0 else float("inf")
+
+    def place(self, model: ModelDescriptor, protected: Callable[[], FrozenSet[str]]) -> Fit:
+        """Decide how ``model`` could be served without exceeding the budget.
+
+        ``protected`` models (the active profile's routes) are never evicted to make
+        room; a model that only fits by evicting them is queued instead. It is a
+        callable because it is only needed when eviction is on the table.
+        """
+        if model.id in self.resident:
+            return Fit("resident")
+        footprint = model.memory_gb or 0.0
+        if self.budget_gb <= 0 or footprint <= self.free_gb:
+            return LOAD
+        if footprint > self.budget_gb:
+            return Fit("refuse")
+        victims: List[str] = []
+        available = self.free_gb
+        keep = protected()
+        for model_id, size in self.resident.items():
+            if model_id in keep:
+                continue
+            victims.append(model_id)
+            available += size
+            if footprint <= available:
+                return Fit("evict", tuple(victims))
+        return Fit("queue")
+
+    def placement(self, fit: Fit) -> Placement:
+        return Placement(action=fit.action, evict=list(fit.evict), free_gb=round(self.free_gb, 3) if self.budget_gb > 0 else None)
+
+
+class ResidencyTracker:
+    """Which local models are loaded, their footprint and the memory budget.
+
+    Model servers (or operators) report loads and evictions; ``/recommend`` reads
+    the current ``view`` without locking and prefers resident models. Loads that
+    need memory held by protected models wait in a FIFO queue and are admitted
+    as evictions free memory.
+    """
+
+    def __init__(
+        self,
+        budget_gb: float,
+        protected: Callable[[], FrozenSet[str]] = frozenset,
+        history: int = 50,
+    ) -> None:
+        self.view = ResidencyView(0, budget_gb, {}, 0.0)
+        self.protected = protected
+        self.queue: Deque[ModelDescriptor] = deque()
+        self.decisions: Deque[Dict[str, Any]] = deque(maxlen=history)
+        self._lock = threading.Lock()
+
+    def _publish(self, resident: Dict[str, float]) -> None:
+        self.view = ResidencyView(self.view.version + 1, self.view.budget_gb, resident, round(sum(resident.values()), 3))
+
+    def _record(self, action: str, model_id: str, reason: str, **extra: Any) -> Dict[str, Any]:
+        decision = {"ts": time.time(), "action": action, "model": model_id, "reason": reason, **extra}
+        self.decisions.append(decision)
+        return decision
+
+    def load(self, model: ModelDescriptor, reason: str = "requested") -> Dict[str, Any]:
+        with self._lock:
+            return self._load(model, reason)
+
+    def _load(self, model: ModelDescriptor, reason: str) -> Dict[str, Any]:
+        placement = self.view.place(model, self.protected)
+        if placement.action == "resident":
+            resident = dict(self.view.resident)
+            resident[model.id] = resident.pop(model.id)  # refresh its LRU position
+            self._publish(resident)
+            return self._record("resident", model.id, reason)
+        if placement.action == "refuse":
+            return self._record("refuse", model.id, f"needs {model.memory_gb} GB, budget is {self.view.budget_gb} GB")
+        if placement.action == "queue":
+            if all(queued.id != model.id for queued in self.queue):
+                self.queue.append(model)
+            position = next(index for index, queued in enumerate(self.queue) if queued.id == model.id)
+            return self._record("queue", model.id, "memory held by protected models", position=position + 1)
+        resident = dict(self.view.resident)
+        for victim in placement.evict:
+            resident.pop(victim)
+            self._record("evict", victim, f"make room for {model.id}")
+        resident[model.id] = model.memory_gb or 0.0
+        self._publish(resident)
+        return self._record("load", model.id, reason, evicted=list(placement.evict))
+
+    def evict(self, model_id: str, reason: str = "requested") -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if model_id not in self.view.resident:
+                return None
+            resident = dict(self.view.resident)
+            resident.pop(model_id)
+            self._publish(resident)
+            decision = self._record("evict", model_id, reason)
+            self._drain()
+            return decision
+
+    def _drain(self) -> None:
+        """Admit queued loads, oldest first, while they fit."""
+        while self.queue:
+            placement = self.view.place(self.queue[0], self.protected)
+            if placement.action not in ("load", "evict", "resident"):
+                return
+            self._load(self.queue.popleft(), "dequeued")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            view, queue, decisions = self.view, [model.id for model in self.queue], list(self.decisions)
+        return {
+            "version": view.version,
+            "budget_gb": view.budget_gb or None,
+            "used_gb": view.used_gb,
+            "free_gb": round(view.free_gb, 3) if view.budget_gb > 0 else None,
+            "resident": [{"model": model_id, "memory_gb": size} for model_id, size in view.resident.items()],
+            "protected": sorted(self.protected()),
+            "queue": queue,
+            "decisions": decisions,
+        }
+
+
+class LiveLatency(NamedTuple):
+    p50_ms: float
+    p95_ms: float
+    error_rate: float
+    samples: float
+
+
+class LatencySketch:
+    """Time-decayed latency histogram and error rate of one model, in fixed memory.
+
+    Latencies land in ``BUCKETS`` log-spaced buckets (about 7% relative error from
+    1 ms to hours); every count halves each ``half_life_s``, so quantiles follow the
+    recent past and a model that stops receiving traffic turns cold again.
+    """
+
+    BUCKETS = 160
+    GROWTH = 1.15
+
+    def __init__(self, half_life_s: float = LATENCY_HALF_LIFE_S) -> None:
+        self.half_life_s = half_life_s
+        self.counts = [0.0] * self.BUCKETS
+        self.weight = 0.0
+        self.calls = 0.0
+        self.errors = 0.0
+        self.updated = time.monotonic()
+
+    def _decay(self, now: float) -> None:
+        factor = 0.5 ** ((now - self.updated) / self.half_life_s)
+        self.updated = now
+        if factor < 1.0:
+            self.counts = [count * factor for count in self.counts]
+            self.weight *= factor
+            self.calls *= factor
+            self.errors *= factor
+
+    def add(self, latency_ms: float, ok: bool, now: Optional[float] = None) -> None:
+        self._decay(time.monotonic() if now is None else now)
+        self.calls += 1
+        if not ok:
+            # failures often end in a timeout; keep them out of the latency distribution
+            self.errors += 1
+            return
+        bucket = 0 if latency_ms <= 1 else min(self.BUCKETS - 1, int(math.log(latency_ms, self.GROWTH)) + 1)
+        self.counts[bucket] += 1
+        self.weight += 1
+
+    def quantile(self, q: float) -> float:
+        target, seen = q * self.weight, 0.0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= target and count:
+                # geometric midpoint of the bucket's [GROWTH**(b-1), GROWTH**b) range
+                return self.GROWTH ** (bucket - 0.5) if bucket else 1.0
+        return self.GROWTH ** (self.BUCKETS - 1)
+
+    def snapshot(self, now: Optional[float] = None) -> Optional[LiveLatency]:
+        self._decay(time.monotonic() if now is None else now)
+        if self.weight < LATENCY_MIN_SAMPLES:
+            return None
+        return LiveLatency(
+            round(self.quantile(0.5), 1),
+            round(self.quantile(0.95), 1),
+            round(self.errors / self.calls, 4) if self.calls else 0.0,
+            round(self.weight, 1),
+        )
+
+
+class LatencyView(NamedTuple):
+    version: int
+    published: float
+    live: Dict[str, LiveLatency]  # warm models only
+
+
+class LatencyTracker:
+    """Observed latency per catalog model, fed by the gateway through ``POST /feedback``.
+
+    Readers get an immutable ``LatencyView`` that is republished after each batch
+    and at most a second after the last one so decay keeps applying.
+    """
+
+    REFRESH_S = 1.0
+
+    def __init__(self, half_life_s: float = LATENCY_HALF_LIFE_S) -> None:
+        self.half_life_s = half_life_s
+        self.sketches: Dict[str, LatencySketch] = {}
+        self._view = LatencyView(0, time.monotonic(), {})
+        self._lock = threading.Lock()
+
+    def ingest(self, observations: List[Tuple[str, float, bool]]) -> None:
+        now = time.monotonic()
+        with self._lock:
+            for model_id, latency_ms, ok in observations:
+                sketch = self.sketches.get(model_id)
+                if sketch is None:
+                    sketch = self.sketches[model_id] = LatencySketch(self.half_life_s)
+                sketch.add(latency_ms, ok, now)
+            self._publish(now)
+
+    def _publish(self, now: float) -> None:
+        live = {}
+        for model_id, sketch in self.sketches.items():
+            snapshot = sketch.snapshot(now)
+            if snapshot is not None:
+                live[model_id] = snapshot
+        self._view = LatencyView(self._view.version + 1, now, live)
+
+    @property
+    def view(self) -> LatencyView:
+        view = self._view
+        if view.live and time.monotonic() - view.published > self.REFRESH_S:
+            with self._lock:
+                if self._view is view:
+                    self._publish(time.monotonic())
+                view = self._view
+        return view
+
+    def stats(self) -> Dict[str, Any]:
+        view = self.view
+        with self._lock:
+            tracked = sorted(self.sketches)
+        return {
+            "version": view.version,
+            "half_life_s": self.half_life_s,
+            "min_samples": LATENCY_MIN_SAMPLES,
+            "models": {model_id: view.live[model_id]._asdict() if model_id in view.live else None for model_id in tracked},
+        }
+
+
+_latency: Optional[LatencyTracker] = None
+
+
+def get_latency() -> LatencyTracker:
+    global _latency
+    if _latency is None:
+        _latency = LatencyTracker()
+    return _latency
+
+
+def protected_models() -> FrozenSet[str]:
+    """Models routed by the active profile; recommendations never evict them."""
+    profile = get_state().get("active_profile", "default")
+    routing = (get_config().get("profiles", {}).get(profile) or {}).get("routing") or {}
+    return frozenset(routing.values())
+
+
+_residency: Optional[ResidencyTracker] = None
+
+
+def get_residency() -> ResidencyTracker:
+    global _residency
+    if _residency is None:
+        _residency = ResidencyTracker(MEMORY_BUDGET_GB, protected=protected_models)
+    return _residency
+
+
+def config_version(catalog: Optional[CatalogIndex] = None, view: Optional[ResidencyView] = None) -> str:
+    """Version tag for everything a recommendation depends on (catalog + active profile + residency)."""
+    catalog = catalog or get_catalog()
+    view = view or get_residency().view
+    return f"{catalog.digest}-{get_state().get('active_profile', 'default')}-r{view.version}"
+
+
+class Ranked(NamedTuple):
+    score: float
+    record: ScoredModel
+    rationale: Tuple[str, ...]
+    fit: Optional[Fit]
+
+
+def _rank(
+    catalog: CatalogIndex,
+    request: RecommendationRequest,
+    view: ResidencyView,
+    latency: LatencyView,
+    limit: int,
+) -> List[Ranked]:
+    """Best ``limit`` feasible models after adjusting static scores for residency and live latency.
+
+    Residency can raise a score by at most ``RESIDENT_BONUS`` and live latency by at
+    most the weight times the largest static latency of a warm model, so the scan
+    over the statically ranked list stops once no later record could enter the top
+    ``limit``.
+    """
+    weight = LATENCY_WEIGHTS.get(request.priority if request.priority in PRIORITIES else "balanced", 0.0)
+    live = latency.live if weight else {}
+    if not view.resident and view.budget_gb <= 0 and not live:
+        # nothing to prefer, to run out of or to correct: the static ranking stands
+        return [
+            Ranked(record.score, record, record.rationale, None if record.cloud else LOAD)
+            for record in islice(catalog.feasible(request), limit)
+        ]
+    ceiling = RESIDENT_BONUS if view.resident else 0.0
+    warm = [catalog.models[model_id] for model_id in live if model_id in catalog.models]
+    ceiling += weight * max((model.latency_ms or 10_000 for model in warm), default=0)
+    protected = get_residency().protected
+    ranked: List[Ranked] = []
+    for record in catalog.feasible(request):
+        if len(ranked) >= limit and record.score + ceiling <= ranked[-1].score:
+            break
+        score, rationale, fit = record.score, record.rationale, None
+        observed = live.get(record.descriptor.id)
+        if observed is not None:
+            # expected time to a successful answer, using the tail for speed and the median otherwise
+            typical = observed.p95_ms if request.priority == "speed" else observed.p50_ms
+            effective = typical / max(0.05, 1.0 - observed.error_rate)
+            score += ((record.descriptor.latency_ms or 10_000) - effective) * weight
+            rationale += (f"Live p50={observed.p50_ms}ms p95={observed.p95_ms}ms errors={observed.error_rate:.0%}",)
+        if not record.cloud:
+            fit = view.place(record.descriptor, protected)
+            if fit.action in ("queue", "refuse"):
+                continue
+            if fit.action == "resident":
+                score += RESIDENT_BONUS
+                rationale += (f"Resident +{RESIDENT_BONUS}",)
+            elif fit.action == "evict":
+                score -= EVICTION_PENALTY
+                rationale += (f"Evicts {', '.join(fit.evict)} -{EVICTION_PENALTY}",)
+        ranked.append(Ranked(score, record, rationale, fit))
+        if len(ranked) > 1 and score > ranked[-2].score:
+            ranked.sort(key=lambda entry: -entry.score)  # stable: ties keep catalog rank
+        del ranked[limit:]
+    return ranked
+
+
+def _recommend(
+    catalog: CatalogIndex,
+    request: RecommendationRequest,
+    view: Optional[ResidencyView] = None,
+    latency: Optional[LatencyView] = None,
+) -> RecommendationResponse:
+    if not catalog.candidates(request.task, request.priority):
         raise HTTPException(status_code=404, detail=f"No models available for task {request.task}")
+    view = view or get_residency().view
+    ranked = _rank(catalog, request, view, latency or get_latency().view, 1 + MAX_ALTERNATIVES)
+    if not ranked:
+        detail = "No suitable model found"
+        if any(not record.cloud for record in catalog.feasible(request)):
+            detail += " within the memory budget"
+        raise HTTPException(status_code=503, detail=detail)
+    best = ranked[0]
+    return RecommendationResponse(
+        model=best.record.descriptor,
+        score=best.score,
+        rationale=list(best.rationale),
+        placement=view.placement(best.fit) if best.fit else None,
+        alternatives=[alternative.record.descriptor for alternative in ranked[1:]],
+    )
+
+
+@app.post("/recommend", response_model=RecommendationResponse)
+def recommend(response: Response, request: RecommendationRequest = Body(...)) -> RecommendationResponse:
+    catalog, view = get_catalog(), get_residency().view
+    response.headers["ETag"] = f'"{config_version(catalog, view)}"'
+    return _recommend(catalog, request, view)
+
+
+class BatchRecommendationRequest(BaseModel):
+    requests: List[RecommendationRequest]
+
 
-    best_score = -1e9
-    best_model = None
-    best_rationale: List[str] = []
+class BatchRecommendationResult(BaseModel):
+    status: int = 200
+    detail: Optional[str] = None
+    recommendation: Optional[RecommendationResponse] = None
 
-    for model in models:
-        score, rationale = _score_model(model, request)
-        if score > best_score:
-            best_score = score
-            best_model = model
-            best_rationale = rationale
 
-    if best_model is None:
-        raise HTTPException(status_code=503, detail="No suitable model found")
+class BatchRecommendationResponse(BaseModel):
+    results: List[BatchRecommendationResult]
 
-    return RecommendationResponse(model=best_model, score=best_score, rationale=best_rationale)
+
+@app.post("/recommend/batch", response_model=BatchRecommendationResponse)
+def recommend_batch(response: Response, body: BatchRecommendationRequest) -> BatchRecommendationResponse:
+    catalog, view = get_catalog(), get_residency().view
+    response.headers["ETag"] = f'"{config_version(catalog, view)}"'
+    results: List[BatchRecommendationResult] = []
+    for request in body.requests:
+        try:
+            results.append(BatchRecommendationResult(recommendation=_recommend(catalog, request, view)))
+        except HTTPException as exc:
+            results.append(BatchRecommendationResult(status=exc.status_code, detail=exc.detail))
+    return BatchRecommendationResponse(results=results)
+
+
+class DownloadFileSpec(BaseModel):
+    url: str
+    name: Optional[str] = Field(None, description="File name under the model directory; defaults to the URL's last path segment.")
+    sha256: Optional[str] = None
 
 
 class DownloadRequest(BaseModel):
     model_id: str
+    files: List[DownloadFileSpec] = Field(default_factory=list, description="Overrides `download.files` from models.yaml.")
+
+
+def download_dir() -> Path:
+    return Path(os.getenv("MODEL_DOWNLOAD_DIR", BASE_PATH / "downloads"))
+
+
+_downloader: Optional[DownloadScheduler] = None
+
+
+def get_downloader() -> DownloadScheduler:
+    global _downloader
+    if _downloader is None:
+        _downloader = DownloadScheduler.from_env(download_dir())
+    return _downloader
 
 
 @app.post("/models/{model_id}/download")
-def schedule_download(model_id: str, body: DownloadRequest) -> Dict[str, str]:
+def schedule_download(model_id: str, body: DownloadRequest) -> Dict[str, object]:
     if model_id != body.model_id:
         raise HTTPException(status_code=400, detail="Model id mismatch")
     config = get_config()
     if model_id not in config.get("models", {}):
         raise HTTPException(status_code=404, detail="Unknown model")
-    download_dir = Path(os.getenv("MODEL_DOWNLOAD_DIR", BASE_PATH / "downloads"))
-    download_dir.mkdir(parents=True, exist_ok=True)
-    (download_dir / f"{model_id}.pending").touch()
-    return {"status": "scheduled", "model_id": model_id}
+    source = config["models"][model_id].get("download") or {}
+    specs = body.files or [DownloadFileSpec(**entry) for entry in source.get("files", [])]
+    if not specs:
+        # no source known to the control plane: leave a marker for an external puller
+        download_dir().mkdir(parents=True, exist_ok=True)
+        (download_dir() / f"{model_id}.pending").touch()
+        return {"status": "scheduled", "model_id": model_id}
+    files = [DownloadFile(spec.url, spec.name or spec.url.split("?")[0].rstrip("/").rsplit("/", 1)[-1], spec.sha256) for spec in specs]
+    # the source's credentials only go to URLs models.yaml lists, never to ones a caller picked
+    configured = {entry.get("url") for entry in source.get("files", [])}
+    trusted = all(file.url in configured for file in files)
+    token = os.getenv(source["auth_env"]) if source.get("auth_env") and trusted else None
+    try:
+        job = get_downloader().submit(model_id, files, {"Authorization": f"Bearer {token}"} if token else None)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return {"status": job.status, "model_id": model_id, "job_id": job.id}
+
+
+@app.get("/downloads")
+def list_downloads() -> Dict[str, object]:
+    downloader = get_downloader()
+    return {**downloader.stats(), "jobs": downloader.jobs()}
+
+
+@app.get("/downloads/{job_id}")
+def get_download(job_id: str) -> Dict[str, object]:
+    job = get_downloader().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown download {job_id}")
+    return job.snapshot()
 
 
 class UpdateRoutingRequest(BaseModel):
@@ -204,13 +757,120 @@ class UpdateRoutingRequest(BaseModel):
 
 @app.post("/profiles/{profile_name}/routing")
 def update_routing(profile_name: str, request: UpdateRoutingRequest) -> Dict[str, object]:
-    config = get_config()
-    profiles = config.setdefault("profiles", {})
-    if profile_name not in profiles:
-        raise HTTPException(status_code=404, detail=f"Unknown profile {profile_name}")
-    if request.model_id not in config.get("models", {}):
-        raise HTTPException(status_code=404, detail=f"Unknown model {request.model_id}")
-    profiles[profile_name].setdefault("routing", {})[request.task] = request.model_id
-    CONFIG_PATH.write_text(yaml.safe_dump(config, sort_keys=True), encoding="utf-8")
-    get_config.cache_clear()
-    return {"status": "ok", "profile": profile_name, "routing": profiles[profile_name]["routing"]}
+    def route(config: Dict[str, object]) -> None:
+        profiles = config.setdefault("profiles", {})
+        if profile_name not in profiles:
+            raise HTTPException(status_code=404, detail=f"Unknown profile {profile_name}")
+        if request.model_id not in config.get("models", {}):
+            raise HTTPException(status_code=404, detail=f"Unknown model {request.model_id}")
+        profiles[profile_name].setdefault("routing", {})[request.task] = request.model_id
+
+    # the store re-reads the file if it was edited by hand since the last commit
+    config = get_store("models").update(f"update_routing:{profile_name}.{request.task}", route)
+    get_models_config().reload()
+    return {"status": "ok", "profile": profile_name, "routing": config["profiles"][profile_name]["routing"]}
+
+
+@app.get("/history/{store_name}")
+def history(store_name: str, limit: int = 20) -> Dict[str, object]:
+    store = get_store(store_name)
+    return {**store.stats(), "entries": store.history(limit)}
+
+
+@app.post("/history/{store_name}/{version}/restore")
+def restore(store_name: str, version: int) -> Dict[str, object]:
+    store = get_store(store_name)
+    try:
+        store.restore(version)
+    except LookupError as exc:
+        raise HTTPException(status_code=404, detail=str(exc)) from exc
+    if store_name == "models":
+        get_models_config().reload()
+    return {"status": "ok", **store.stats()}
+
+
+def _local_model(model_id: str) -> ModelDescriptor:
+    model = get_catalog().models.get(model_id)
+    if model is None:
+        raise HTTPException(status_code=404, detail=f"Unknown model {model_id}")
+    if model.provider.startswith("cloud"):
+        raise HTTPException(status_code=400, detail=f"{model_id} is not a local model")
+    return model
+
+
+class Observation(BaseModel):
+    model: str
+    latency_ms: float = Field(ge=0)
+    ok: bool = True
+
+
+class FeedbackRequest(BaseModel):
+    observations: List[Observation]
+
+
+@app.post("/feedback")
+def feedback(body: FeedbackRequest) -> Dict[str, int]:
+    """Ingest upstream outcomes observed by the gateway; unknown models are ignored to bound memory."""
+    known = get_catalog().models
+    accepted = [(entry.model, entry.latency_ms, entry.ok) for entry in body.observations if entry.model in known]
+    if accepted:
+        get_latency().ingest(accepted)
+    return {"accepted": len(accepted), "ignored": len(body.observations) - len(accepted)}
+
+
+@app.get("/latency")
+def latency_stats() -> Dict[str, Any]:
+    return get_latency().stats()
+
+
+@app.get("/residency")
+def residency() -> Dict[str, Any]:
+    return get_residency().stats()
+
+
+@app.get("/residency/{model_id}/plan", response_model=Placement)
+def plan_residency(model_id: str) -> Placement:
+    tracker = get_residency()
+    view = tracker.view
+    return view.placement(view.place(_local_model(model_id), tracker.protected))
+
+
+@app.post("/residency/{model_id}/load")
+def load_model(model_id: str, response: Response) -> Dict[str, Any]:
+    decision = get_residency().load(_local_model(model_id))
+    if decision["action"] == "refuse":
+        raise HTTPException(status_code=409, detail=decision["reason"])
+    if decision["action"] == "queue":
+        response.status_code = 202
+    return decision
+
+
+@app.post("/residency/{model_id}/evict")
+def evict_model(model_id: str) -> Dict[str, Any]:
+    decision = get_residency().evict(model_id)
+    if decision is None:
+        raise HTTPException(status_code=404, detail=f"{model_id} is not resident")
+    return decision
+
+
+@app.get("/config")
+def config_stats() -> Dict[str, object]:
+    return get_models_config().stats()
+
+
+_background_tasks: List[asyncio.Task] = []
+
+
+@app.on_event("startup")
+async def watch_config() -> None:
+    get_models_config()
+    readiness.set("models_config", True, f"version {get_models_config().stats()['version']}")
+    _background_tasks.append(asyncio.create_task(get_models_config().watch(poll_interval())))
+
+
+@app.on_event("shutdown")
+async def stop_watching() -> None:
+    while _background_tasks:
+        _background_tasks.pop().cancel()
+    if _downloader is not None:
+        _downloader.shutdown()
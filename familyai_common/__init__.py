@@ -0,0 +1 @@
+"""Helpers shared by the FamilyAI Python services (gateway, control plane, whisper, piper, vision)."""
@@ -0,0 +1,157 @@
+"""Hot-reloadable YAML configuration.
+
+``ConfigWatcher`` owns one file. Reloads read, parse, validate and ``prepare``
+the new content (for example building an index) entirely off the request path,
+then publish it by swapping a single reference to a frozen ``ConfigSnapshot``
+carrying a monotonically increasing version. A file that fails to parse or
+validate is logged and ignored; the previous snapshot keeps serving.
+
+Handlers that read the config more than once should wrap their work in
+``watcher.pin()`` so every read inside the request (including tasks it spawns)
+sees the same snapshot even if a reload lands halfway through. Snapshot data is
+shared between requests and must be treated as read-only; writers copy it,
+persist the file and call ``reload()``.
+
+Change detection polls ``stat()`` (mtime, size, inode) rather than inotify so it
+also works for bind mounts and ConfigMap symlink swaps.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+import yaml
+from prometheus_client import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+CONFIG_VERSION = Gauge("config_version", "Version of the configuration snapshot currently served.", ["config"])
+CONFIG_RELOAD_FAILURES = Counter("config_reload_failures_total", "Config files rejected during reload.", ["config"])
+
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    version: int
+    digest: str
+    data: Dict[str, Any]
+    prepared: Any = None
+    loaded_at: float = 0.0
+
+
+class ConfigWatcher:
+    def __init__(
+        self,
+        path: str | Path,
+        name: str,
+        validate: Optional[Callable[[Dict[str, Any]], None]] = None,
+        prepare: Optional[Callable[[Dict[str, Any]], Any]] = None,
+    ) -> None:
+        self.path = Path(path)
+        self.name = name
+        self.validate = validate
+        self.prepare = prepare
+        self.last_error: Optional[str] = None
+        self._snapshot: Optional[ConfigSnapshot] = None
+        self._stat: Optional[Tuple[int, int, int]] = None
+        self._lock = threading.Lock()
+        self._pinned: ContextVar[Optional[ConfigSnapshot]] = ContextVar(f"config_{name}", default=None)
+        self._gauge = CONFIG_VERSION.labels(name)
+        self._failures = CONFIG_RELOAD_FAILURES.labels(name)
+
+    @property
+    def current(self) -> ConfigSnapshot:
+        pinned = self._pinned.get()
+        if pinned is not None:
+            return pinned
+        snapshot = self._snapshot
+        if snapshot is None:
+            self.reload()
+            snapshot = self._snapshot
+            assert snapshot is not None
+        return snapshot
+
+    @contextmanager
+    def pin(self) -> Iterator[ConfigSnapshot]:
+        """Make ``current`` return one snapshot for the duration of the block."""
+        token = self._pinned.set(self.current)
+        try:
+            yield self._pinned.get()  # type: ignore[misc]
+        finally:
+            self._pinned.reset(token)
+
+    def _file_stat(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = self.path.stat()
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def reload(self) -> bool:
+        """Re-read the file and publish it if it changed; returns whether a new snapshot was published.
+
+        Raises only when no snapshot has been published yet, so a broken edit can
+        never take down a running service.
+        """
+        with self._lock:
+            self._stat = self._file_stat()
+            try:
+                raw = self.path.read_bytes()
+                digest = hashlib.sha256(raw).hexdigest()[:16]
+                if self._snapshot is not None and digest == self._snapshot.digest:
+                    return False
+                data = yaml.safe_load(raw)
+                if not isinstance(data, dict) or not data:
+                    raise ValueError(f"{self.path} is empty or not a mapping")
+                if self.validate is not None:
+                    self.validate(data)
+                prepared = self.prepare(data) if self.prepare is not None else None
+            except Exception as exc:
+                self.last_error = f"{type(exc).__name__}: {exc}"
+                if self._snapshot is None:
+                    raise
+                self._failures.inc()
+                logger.warning("Ignoring invalid %s config %s: %s", self.name, self.path, self.last_error)
+                return False
+            version = self._snapshot.version + 1 if self._snapshot is not None else 1
+            self._snapshot = ConfigSnapshot(version, digest, data, prepared, time.time())
+            self.last_error = None
+            self._gauge.set(version)
+            logger.info("Loaded %s config %s (version %d, %s)", self.name, self.path, version, digest)
+            return True
+
+    def check(self) -> bool:
+        """Reload if the file's stat signature changed since the last read."""
+        if self._snapshot is not None and self._file_stat() == self._stat:
+            return False
+        return self.reload()
+
+    async def watch(self, interval_s: float = 2.0) -> None:
+        while True:
+            await asyncio.sleep(interval_s)
+            try:
+                await asyncio.to_thread(self.check)
+            except Exception:  # pragma: no cover - reload() already logs rejections
+                logger.exception("Config watch for %s failed", self.path)
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        return {
+            "path": str(self.path),
+            "version": snapshot.version if snapshot else None,
+            "digest": snapshot.digest if snapshot else None,
+            "loaded_at": snapshot.loaded_at if snapshot else None,
+            "last_error": self.last_error,
+        }
+
+
+def poll_interval() -> float:
+    return float(os.getenv("CONFIG_POLL_S", "2.0"))
@@ -0,0 +1,397 @@
+"""Parallel, resumable model downloads.
+
+``DownloadScheduler`` runs at most ``max_jobs`` jobs at once on a thread pool.
+Each file of a job is fetched as fixed-size byte ranges by ``chunk_workers``
+threads writing into a preallocated ``<name>.part``; the indices of finished
+chunks are recorded in ``<name>.part.json`` after every chunk, so an interrupted
+transfer (crash, restart, network error) resumes with only the missing chunks.
+Servers that do not advertise ``Accept-Ranges: bytes`` fall back to one streamed
+GET. A finished file is checked against its sha256 before it is renamed into
+place, and a file already in place is re-checked before it is skipped. A shared
+token bucket optionally caps the total bandwidth of all jobs. Finished jobs are
+forgotten ``retention_s`` after they end.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Set, Tuple
+
+import httpx
+from prometheus_client import Counter
+
+from .store import atomic_write
+
+logger = logging.getLogger(__name__)
+
+DOWNLOAD_BYTES = Counter("download_bytes_total", "Bytes received by the model downloader.")
+DOWNLOAD_JOBS = Counter("download_jobs_total", "Finished download jobs.", ["status"])
+
+BLOCK_BYTES = 256 * 1024
+HASH_BLOCK_BYTES = 1024 * 1024
+ACTIVE_STATUSES = ("queued", "running", "verifying")
+
+
+class DownloadError(Exception):
+    pass
+
+
+class DownloadCancelled(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class DownloadFile:
+    url: str
+    name: str
+    sha256: Optional[str] = None
+
+
+def file_sha256(path: Path) -> str:
+    # hashlib.file_digest needs Python 3.11
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        while block := handle.read(HASH_BLOCK_BYTES):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class RateLimiter:
+    """Token bucket shared by every transfer; ``bytes_per_s <= 0`` disables it."""
+
+    def __init__(self, bytes_per_s: float, burst_s: float = 0.25) -> None:
+        self.rate = bytes_per_s
+        self.capacity = max(bytes_per_s * burst_s, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: int) -> None:
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # go into debt and sleep it off, so large blocks are throttled as precisely as small ones
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+
+
+@dataclass
+class DownloadJob:
+    id: str
+    model_id: str
+    files: List[DownloadFile]
+    status: str = "queued"
+    bytes_done: int = 0
+    bytes_total: Optional[int] = None
+    resumed_bytes: int = 0
+    current_file: Optional[str] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, amount: int) -> None:
+        with self._lock:
+            self.bytes_done += amount
+
+    def snapshot(self) -> Dict[str, Any]:
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        transferred = self.bytes_done - self.resumed_bytes
+        return {
+            "id": self.id,
+            "model_id": self.model_id,
+            "status": self.status,
+            "files": [file.name for file in self.files],
+            "current_file": self.current_file,
+            "bytes_done": self.bytes_done,
+            "bytes_total": self.bytes_total,
+            "progress": round(self.bytes_done / self.bytes_total, 4) if self.bytes_total else None,
+            "resumed_bytes": self.resumed_bytes,
+            "rate_bps": round(transferred / elapsed) if elapsed > 0 else None,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class DownloadScheduler:
+    def __init__(
+        self,
+        root: str | Path,
+        max_jobs: int = 2,
+        chunk_workers: int = 4,
+        chunk_bytes: int = 16 * 1024 * 1024,
+        rate_limit_bps: float = 0.0,
+        retries: int = 3,
+        backoff_s: float = 0.5,
+        retention_s: float = 3600.0,
+        client: Optional[httpx.Client] = None,
+    ) -> None:
+        self.root = Path(root)
+        self.max_jobs = max_jobs
+        self.chunk_workers = chunk_workers
+        self.chunk_bytes = chunk_bytes
+        self.retries = retries
+        self.backoff_s = backoff_s
+        self.retention_s = retention_s
+        self.limiter = RateLimiter(rate_limit_bps)
+        self.client = client or httpx.Client(follow_redirects=True, timeout=httpx.Timeout(30.0, read=120.0))
+        self._executor = ThreadPoolExecutor(max_jobs, thread_name_prefix="download")
+        self._jobs: Dict[str, DownloadJob] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_env(cls, root: str | Path) -> "DownloadScheduler":
+        return cls(
+            root,
+            max_jobs=int(os.getenv("DOWNLOAD_MAX_JOBS", "2")),
+            chunk_workers=int(os.getenv("DOWNLOAD_CHUNK_WORKERS", "4")),
+            chunk_bytes=int(float(os.getenv("DOWNLOAD_CHUNK_MB", "16")) * 1024 * 1024),
+            rate_limit_bps=float(os.getenv("DOWNLOAD_RATE_LIMIT_MBPS", "0")) * 1024 * 1024,
+            retention_s=float(os.getenv("DOWNLOAD_JOB_RETENTION_S", "3600")),
+        )
+
+    def submit(self, model_id: str, files: List[DownloadFile], headers: Optional[Mapping[str, str]] = None) -> DownloadJob:
+        """Queue a job, or return the model's job that is already queued or running."""
+        for file in files:
+            if not file.name or file.name.startswith(".") or Path(file.name).name != file.name:
+                raise ValueError(f"Invalid file name {file.name!r}")
+        with self._lock:
+            self._prune()
+            for job in self._jobs.values():
+                if job.model_id == model_id and job.status in ACTIVE_STATUSES:
+                    return job
+            job = DownloadJob(uuid.uuid4().hex[:12], model_id, list(files))
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, dict(headers or {}))
+        return job
+
+    def get(self, job_id: str) -> Optional[DownloadJob]:
+        return self._jobs.get(job_id)
+
+    def jobs(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            self._prune()
+            jobs = list(self._jobs.values())
+        return [job.snapshot() for job in jobs]
+
+    def _prune(self) -> None:
+        # caller holds the lock
+        cutoff = time.time() - self.retention_s
+        for job_id in [job.id for job in self._jobs.values() if job.finished_at is not None and job.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_jobs": self.max_jobs,
+            "chunk_workers": self.chunk_workers,
+            "chunk_bytes": self.chunk_bytes,
+            "rate_limit_bps": self.limiter.rate,
+        }
+
+    def shutdown(self, wait: bool = False) -> None:
+        """Stop transfers; partial files and chunk records are kept for the next run."""
+        self._stop.set()
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _run(self, job: DownloadJob, headers: Dict[str, str]) -> None:
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            target = self.root / job.model_id
+            target.mkdir(parents=True, exist_ok=True)
+            plans = [(file, *self._probe(file.url, headers)) for file in job.files]
+            sizes = [size for _, size, _ in plans]
+            job.bytes_total = sum(sizes) if all(size is not None for size in sizes) else None
+            for file, size, ranges in plans:
+                job.current_file = file.name
+                self._fetch(job, file, target / file.name, size, ranges, headers)
+            job.current_file = None
+            job.status = "done"
+        except DownloadCancelled:
+            job.status = "interrupted"
+        except Exception as exc:
+            job.status = "failed"
+            job.error = f"{type(exc).__name__}: {exc}"
+            logger.warning("Download of %s failed: %s", job.model_id, job.error)
+        finally:
+            job.finished_at = time.time()
+            DOWNLOAD_JOBS.labels(job.status).inc()
+
+    def _probe(self, url: str, headers: Dict[str, str]) -> Tuple[Optional[int], bool]:
+        response = self.client.head(url, headers=headers)
+        response.raise_for_status()
+        length = response.headers.get("content-length")
+        size = int(length) if length is not None else None
+        return size, response.headers.get("accept-ranges", "").lower() == "bytes"
+
+    def _fetch(
+        self,
+        job: DownloadJob,
+        file: DownloadFile,
+        path: Path,
+        size: Optional[int],
+        ranges: bool,
+        headers: Dict[str, str],
+    ) -> None:
+        if path.exists() and (size is None or path.stat().st_size == size):
+            if self._mismatch(job, file, path) is None:
+                job.add(path.stat().st_size)
+                job.resumed_bytes += path.stat().st_size
+                return
+            # truncated or corrupted by something other than this downloader
+            logger.warning("Existing %s does not match its sha256; downloading it again", path)
+            path.unlink()
+        part = path.with_name(path.name + ".part")
+        record = path.with_name(path.name + ".part.json")
+        if ranges and size:
+            self._fetch_ranges(job, file, part, record, size, headers)
+        else:
+            self._fetch_stream(job, file, part, headers)
+        digest = self._mismatch(job, file, part)
+        if digest is not None:
+            part.unlink(missing_ok=True)
+            record.unlink(missing_ok=True)
+            raise DownloadError(f"Checksum mismatch for {file.name}: expected {file.sha256}, got {digest}")
+        os.replace(part, path)
+        record.unlink(missing_ok=True)
+
+    def _mismatch(self, job: DownloadJob, file: DownloadFile, path: Path) -> Optional[str]:
+        """The sha256 of ``path`` when it differs from ``file.sha256``; ``None`` when it matches or none is known."""
+        if not file.sha256:
+            return None
+        job.status = "verifying"
+        try:
+            digest = file_sha256(path)
+        finally:
+            job.status = "running"
+        return digest if digest != file.sha256.lower() else None
+
+    def _load_record(self, record: Path, file: DownloadFile, size: int) -> Set[int]:
+        try:
+            data = json.loads(record.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return set()
+        if (data.get("url"), data.get("size"), data.get("chunk_bytes")) != (file.url, size, self.chunk_bytes):
+            return set()
+        return set(data.get("done", []))
+
+    def _fetch_ranges(
+        self,
+        job: DownloadJob,
+        file: DownloadFile,
+        part: Path,
+        record: Path,
+        size: int,
+        headers: Dict[str, str],
+    ) -> None:
+        chunks = [(start, min(start + self.chunk_bytes, size) - 1) for start in range(0, size, self.chunk_bytes)]
+        done = self._load_record(record, file, size) if part.exists() and part.stat().st_size == size else set()
+        if not done:
+            with part.open("wb") as handle:
+                handle.truncate(size)
+        resumed = sum(chunks[index][1] - chunks[index][0] + 1 for index in done)
+        job.add(resumed)
+        job.resumed_bytes += resumed
+
+        abort = threading.Event()
+        errors: List[BaseException] = []
+        fd = os.open(part, os.O_RDWR)
+        try:
+            with ThreadPoolExecutor(self.chunk_workers, thread_name_prefix="download-chunk") as pool:
+                futures = {
+                    pool.submit(self._fetch_chunk, job, file.url, fd, start, end, headers, abort): index
+                    for index, (start, end) in enumerate(chunks)
+                    if index not in done
+                }
+                for future in as_completed(futures):
+                    try:
+                        future.result()
+                    except BaseException as exc:
+                        errors.append(exc)
+                        abort.set()
+                        continue
+                    done.add(futures[future])
+                    payload = {"url": file.url, "size": size, "chunk_bytes": self.chunk_bytes, "done": sorted(done)}
+                    atomic_write(record, json.dumps(payload).encode("utf-8"))
+        finally:
+            os.close(fd)
+        if errors:
+            real = [error for error in errors if not isinstance(error, DownloadCancelled)]
+            raise (real or errors)[0]
+
+    def _fetch_chunk(
+        self,
+        job: DownloadJob,
+        url: str,
+        fd: int,
+        start: int,
+        end: int,
+        headers: Dict[str, str],
+        abort: threading.Event,
+    ) -> None:
+        for attempt in range(self.retries + 1):
+            if self._stop.is_set() or abort.is_set():
+                raise DownloadCancelled()
+            received = 0
+            try:
+                with self.client.stream("GET", url, headers={**headers, "Range": f"bytes={start}-{end}"}) as response:
+                    if response.status_code != 206:
+                        raise DownloadError(f"Range request for {url} returned {response.status_code}")
+                    offset = start
+                    for block in response.iter_bytes(BLOCK_BYTES):
+                        if self._stop.is_set() or abort.is_set():
+                            raise DownloadCancelled()
+                        self.limiter.acquire(len(block))
+                        os.pwrite(fd, block, offset)
+                        offset += len(block)
+                        received += len(block)
+                        job.add(len(block))
+                        DOWNLOAD_BYTES.inc(len(block))
+                if offset != end + 1:
+                    raise DownloadError(f"Short range {start}-{end} from {url}: got {offset - start} bytes")
+                return
+            except (httpx.HTTPError, DownloadError):
+                job.add(-received)
+                if attempt == self.retries or self._stop.is_set() or abort.is_set():
+                    # stop queued chunks now rather than when the collector gets to this failure
+                    abort.set()
+                    raise
+                time.sleep(self.backoff_s * 2**attempt)
+
+    def _fetch_stream(self, job: DownloadJob, file: DownloadFile, part: Path, headers: Dict[str, str]) -> None:
+        for attempt in range(self.retries + 1):
+            received = 0
+            try:
+                with self.client.stream("GET", file.url, headers=headers) as response, part.open("wb") as handle:
+                    response.raise_for_status()
+                    for block in response.iter_bytes(BLOCK_BYTES):
+                        if self._stop.is_set():
+                            raise DownloadCancelled()
+                        self.limiter.acquire(len(block))
+                        handle.write(block)
+                        received += len(block)
+                        job.add(len(block))
+                        DOWNLOAD_BYTES.inc(len(block))
+                return
+            except httpx.HTTPError:
+                job.add(-received)
+                if attempt == self.retries or self._stop.is_set():
+                    raise
+                time.sleep(self.backoff_s * 2**attempt)
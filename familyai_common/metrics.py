@@ -0,0 +1,117 @@
+"""Prometheus instrumentation shared by every FamilyAI FastAPI service.
+
+``install(app, service)`` adds a pure-ASGI middleware that records per-route
+request latency, in-flight requests, bytes in/out and 5xx errors, and mounts
+``GET /metrics``. Label children are cached per (method, route, status) so the
+hot path is a dict lookup plus a handful of lock-protected increments.
+"""
+from __future__ import annotations
+
+import time
+from typing import Any, Callable, Dict, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from starlette.responses import Response
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template.",
+    ["service", "method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "Requests currently being served.", ["service"])
+REQUEST_BYTES = Counter("http_request_bytes_total", "Request body bytes received.", ["service", "route"])
+RESPONSE_BYTES = Counter("http_response_bytes_total", "Response body bytes sent.", ["service", "route"])
+REQUEST_ERRORS = Counter(
+    "http_request_errors_total",
+    "Requests that ended in a 5xx status or an unhandled exception.",
+    ["service", "route", "status"],
+)
+UPSTREAM_DURATION = Histogram(
+    "upstream_request_duration_seconds",
+    "Latency of calls made to upstream models.",
+    ["service", "model", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware; unlike ``BaseHTTPMiddleware`` it does not buffer streams."""
+
+    def __init__(self, app: Callable, service: str) -> None:
+        self.app = app
+        self.service = service
+        self.in_flight = REQUESTS_IN_FLIGHT.labels(service)
+        self._children: Dict[Tuple[str, str, int], Tuple[Any, ...]] = {}
+
+    def _observe(self, method: str, route: str, status: int, seconds: float, bytes_in: int, bytes_out: int) -> None:
+        key = (method, route, status)
+        children = self._children.get(key)
+        if children is None:
+            children = (
+                REQUEST_DURATION.labels(self.service, method, route, str(status)),
+                REQUEST_BYTES.labels(self.service, route),
+                RESPONSE_BYTES.labels(self.service, route),
+                REQUEST_ERRORS.labels(self.service, route, str(status)) if status >= 500 else None,
+            )
+            self._children[key] = children
+        duration, received, sent, errors = children
+        duration.observe(seconds)
+        if bytes_in:
+            received.inc(bytes_in)
+        if bytes_out:
+            sent.inc(bytes_out)
+        if errors is not None:
+            errors.inc()
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+        bytes_in = 0
+        bytes_out = 0
+
+        async def counting_receive() -> Dict[str, Any]:
+            nonlocal bytes_in
+            message = await receive()
+            bytes_in += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message: Dict[str, Any]) -> None:
+            nonlocal status, bytes_out
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                bytes_out += len(message.get("body", b""))
+            await send(message)
+
+        self.in_flight.inc()
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        except Exception:
+            status = 500
+            raise
+        finally:
+            self.in_flight.dec()
+            route = scope.get("route")
+            template = getattr(route, "path", None) or "unmatched"
+            self._observe(scope["method"], template, status, time.perf_counter() - started, bytes_in, bytes_out)
+
+
+def observe_upstream(service: str, model: str, seconds: float, outcome: str) -> None:
+    UPSTREAM_DURATION.labels(service, model, outcome).observe(seconds)
+
+
+def metrics_response() -> Response:
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+def install(app: Any, service: str) -> None:
+    """Instrument ``app`` and expose ``GET /metrics``."""
+    app.add_middleware(MetricsMiddleware, service=service)
+    app.add_api_route("/metrics", metrics_response, methods=["GET"], include_in_schema=False)
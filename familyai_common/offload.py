@@ -0,0 +1,172 @@
+"""Bounded CPU offload for request handlers.
+
+Heavy work (image analysis, audio decoding, synthesis) must not run on the event
+loop or in Starlette's shared threadpool, or a single large request stalls
+``/health`` and every other caller. ``OffloadPool`` runs it on a dedicated thread
+pool with a fixed number of workers and a bounded queue:
+
+* when ``max_workers + max_queue`` jobs are already admitted the call fails fast
+  with ``429 Too Many Requests`` and a ``Retry-After`` estimated from recent job
+  durations;
+* while a job waits, the client connection is polled; if the client goes away
+  the job is dropped before it starts (a job already running in a thread cannot
+  be interrupted, so it finishes and its result is discarded).
+
+Each service process owns one pool sized from ``OFFLOAD_MAX_WORKERS`` and
+``OFFLOAD_MAX_QUEUE``.
+"""
+from __future__ import annotations
+
+import asyncio
+import math
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, TypeVar
+
+from fastapi import HTTPException, Request
+from prometheus_client import Counter, Gauge, Histogram
+
+T = TypeVar("T")
+
+OFFLOAD_PENDING = Gauge("offload_pending_jobs", "Jobs admitted to the offload pool (running + queued).", ["service"])
+OFFLOAD_REJECTED = Counter("offload_rejected_total", "Jobs refused with 429 because the queue was full.", ["service"])
+OFFLOAD_CANCELLED = Counter("offload_cancelled_total", "Jobs abandoned because the client disconnected.", ["service"])
+OFFLOAD_WAIT = Histogram(
+    "offload_queue_wait_seconds",
+    "Time a job spent queued before a worker picked it up.",
+    ["service"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+
+CLIENT_CLOSED_REQUEST = 499
+
+
+def overloaded(retry_after_s: float, detail: str = "Server busy, retry later") -> HTTPException:
+    return HTTPException(status_code=429, detail=detail, headers={"Retry-After": str(max(1, math.ceil(retry_after_s)))})
+
+
+async def until_disconnected(awaitable: Awaitable[T], request: Optional[Request], poll_s: float = 0.1) -> T:
+    """Await ``awaitable`` but cancel it and raise 499 if the client disconnects first."""
+    task = asyncio.ensure_future(awaitable)
+    if request is None:
+        return await task
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_s)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client closed request")
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+class OffloadPool:
+    def __init__(self, service: str, max_workers: int = 2, max_queue: int = 16, poll_s: float = 0.1) -> None:
+        self.service = service
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue = max(0, int(max_queue))
+        self.poll_s = poll_s
+        self.pending = 0
+        self.avg_job_s = 1.0
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending_gauge = OFFLOAD_PENDING.labels(service)
+        self._rejected = OFFLOAD_REJECTED.labels(service)
+        self._cancelled = OFFLOAD_CANCELLED.labels(service)
+        self._wait = OFFLOAD_WAIT.labels(service)
+
+    @classmethod
+    def from_env(cls, service: str, max_workers: int = 2, max_queue: int = 16) -> "OffloadPool":
+        return cls(
+            service,
+            max_workers=int(os.getenv("OFFLOAD_MAX_WORKERS", str(max_workers))),
+            max_queue=int(os.getenv("OFFLOAD_MAX_QUEUE", str(max_queue))),
+        )
+
+    @property
+    def capacity(self) -> int:
+        return self.max_workers + self.max_queue
+
+    def retry_after(self) -> float:
+        """Rough time until a slot frees up: queued work divided across the workers."""
+        return self.avg_job_s * max(1, self.pending - self.max_workers + 1) / self.max_workers
+
+    def _reserve(self) -> None:
+        # caller holds the lock
+        if self.pending >= self.capacity:
+            self._rejected.inc()
+            raise overloaded(self.retry_after())
+        self.pending += 1
+        self._pending_gauge.set(self.pending)
+
+    def _admit(self) -> ThreadPoolExecutor:
+        with self._lock:
+            self._reserve()
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix=f"{self.service}-offload")
+            return self._executor
+
+    def _release(self, _future: Optional[Future] = None) -> None:
+        with self._lock:
+            self.pending -= 1
+            self._pending_gauge.set(self.pending)
+
+    @contextmanager
+    def reserve(self) -> Iterator[None]:
+        """Count work that runs elsewhere (e.g. on a model's own thread) against the pool's limit; 429 when full."""
+        with self._lock:
+            self._reserve()
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _timed(self, fn: Callable[..., T], queued_at: float, *args: Any) -> T:
+        started = time.perf_counter()
+        self._wait.observe(started - queued_at)
+        try:
+            return fn(*args)
+        finally:
+            self.avg_job_s = 0.8 * self.avg_job_s + 0.2 * (time.perf_counter() - started)
+
+    def submit(self, fn: Callable[..., T], *args: Any) -> "asyncio.Future[T]":
+        """Admit ``fn(*args)`` (429 when full) and return a future; cancelling it drops queued work."""
+        future = self._admit().submit(self._timed, fn, time.perf_counter(), *args)
+        future.add_done_callback(self._release)
+        return asyncio.wrap_future(future)
+
+    async def run(self, fn: Callable[..., T], *args: Any, request: Optional[Request] = None) -> T:
+        """Run ``fn(*args)`` on the pool; raises 429 when full and 499 if ``request`` disconnects."""
+        job = self.submit(fn, *args)
+        try:
+            return await until_disconnected(job, request, self.poll_s)
+        except BaseException:
+            job.cancel()
+            if job.cancelled():
+                self._cancelled.inc()
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "pending": self.pending,
+            "avg_job_s": round(self.avg_job_s, 4),
+        }
+
+    def shutdown(self) -> None:
+        """Stop the workers; the pool starts a fresh executor if it is used again."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            if sys.version_info >= (3, 9):
+                executor.shutdown(wait=False, cancel_futures=True)
+            else:  # pragma: no cover - whisper's L4T base image is Python 3.8; queued jobs still run
+                executor.shutdown(wait=False)
@@ -0,0 +1,162 @@
+"""Liveness and readiness for FamilyAI services.
+
+``install(app, readiness)`` mounts two probes that never do work themselves:
+
+* ``GET /health/live`` answers as long as the process and its event loop do;
+* ``GET /health/ready`` returns 200 once every critical dependency is ready and
+  503 otherwise, with the state of each dependency in the body.
+
+Dependency state lives in a ``Readiness`` tracker. Slow one-off work such as
+loading model weights is registered with ``load()`` and runs in a worker thread
+after startup (and again after ``retry_s`` if it fails), so the service accepts
+connections and answers probes while it loads. Periodic checks (upstream health,
+for instance) report their outcome with ``set()``. Each state is an immutable
+``DependencyState`` swapped into a dict, so readers on the request path only do
+a dict lookup.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from prometheus_client import Gauge
+
+logger = logging.getLogger(__name__)
+
+STARTING = "starting"
+READY = "ready"
+DOWN = "down"
+
+DEPENDENCY_READY = Gauge(
+    "dependency_ready", "1 when a service dependency is ready, 0 while starting or down.", ["service", "dependency"]
+)
+
+
+@dataclass(frozen=True)
+class DependencyState:
+    status: str
+    critical: bool
+    detail: Optional[str] = None
+    changed_at: float = 0.0
+    checked_at: float = 0.0
+    failures: int = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "status": self.status,
+            "critical": self.critical,
+            "detail": self.detail,
+            "changed_at": self.changed_at,
+            "checked_at": self.checked_at,
+            "failures": self.failures,
+        }
+
+
+class Readiness:
+    def __init__(self, service: str) -> None:
+        self.service = service
+        self.started_at = time.time()
+        self._states: Dict[str, DependencyState] = {}
+        self._loaders: List[Tuple[str, Callable[[], Optional[str]], bool, float]] = []
+        self._tasks: List[asyncio.Task] = []
+
+    def register(self, name: str, critical: bool = True) -> None:
+        """Declare a dependency that is not ready until a check or loader says so."""
+        if name not in self._states:
+            self._states[name] = DependencyState(STARTING, critical, changed_at=time.time())
+            DEPENDENCY_READY.labels(self.service, name).set(0)
+
+    def set(self, name: str, ok: bool, detail: Optional[str] = None, critical: Optional[bool] = None) -> None:
+        """Record the outcome of a check; ``critical`` defaults to the registered value (or True)."""
+        previous = self._states.get(name)
+        now = time.time()
+        status = READY if ok else DOWN
+        critical = critical if critical is not None else (previous.critical if previous else True)
+        changed_at = previous.changed_at if previous is not None and previous.status == status else now
+        failures = 0 if ok else (previous.failures + 1 if previous is not None else 1)
+        self._states[name] = DependencyState(status, critical, detail, changed_at, now, failures)
+        DEPENDENCY_READY.labels(self.service, name).set(1 if ok else 0)
+        if previous is None or previous.status != status:
+            log = logger.info if ok else logger.warning
+            log("%s dependency %s is %s%s", self.service, name, status, f": {detail}" if detail else "")
+
+    def forget(self, name: str) -> None:
+        self._states.pop(name, None)
+
+    def load(self, name: str, loader: Callable[[], Optional[str]], critical: bool = True, retry_s: float = 30.0) -> None:
+        """Run the blocking ``loader`` in a thread once the service starts; its return value is the detail."""
+        self.register(name, critical)
+        self._loaders.append((name, loader, critical, retry_s))
+
+    async def _run_loader(self, name: str, loader: Callable[[], Optional[str]], retry_s: float) -> None:
+        while True:
+            started = time.monotonic()
+            try:
+                # run_in_executor rather than asyncio.to_thread: whisper's L4T base is Python 3.8
+                detail = await asyncio.get_running_loop().run_in_executor(None, loader)
+            except Exception as exc:
+                self.set(name, False, f"{type(exc).__name__}: {exc}")
+                await asyncio.sleep(retry_s)
+                continue
+            self.set(name, True, detail or f"loaded in {time.monotonic() - started:.1f}s")
+            return
+
+    def status(self, name: str) -> Optional[str]:
+        state = self._states.get(name)
+        return state.status if state is not None else None
+
+    def state(self, name: str) -> Optional[DependencyState]:
+        return self._states.get(name)
+
+    @property
+    def ready(self) -> bool:
+        return all(state.status == READY for state in list(self._states.values()) if state.critical)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "status": READY if self.ready else STARTING if self._starting() else DOWN,
+            "service": self.service,
+            "uptime_s": round(time.time() - self.started_at, 1),
+            "dependencies": {name: state.as_dict() for name, state in sorted(self._states.items())},
+        }
+
+    def _starting(self) -> bool:
+        critical = [state for state in list(self._states.values()) if state.critical]
+        return any(state.status == STARTING for state in critical) and not any(state.status == DOWN for state in critical)
+
+    def spawn(self, coroutine: Any) -> asyncio.Task:
+        """Run a background coroutine (a probe loop, say) for the lifetime of the service."""
+        task = asyncio.create_task(coroutine)
+        self._tasks.append(task)
+        return task
+
+    async def start(self) -> None:
+        for name, loader, critical, retry_s in self._loaders:
+            # a restarted app loads again, so it is not ready until the loader says so
+            self.forget(name)
+            self.register(name, critical)
+            self.spawn(self._run_loader(name, loader, retry_s))
+
+    async def stop(self) -> None:
+        while self._tasks:
+            self._tasks.pop().cancel()
+
+
+def install(app: FastAPI, readiness: Readiness) -> None:
+    """Mount ``/health/live`` and ``/health/ready`` and tie background loads to the app's lifetime."""
+
+    async def live() -> Dict[str, Any]:
+        return {"status": "ok", "service": readiness.service, "uptime_s": round(time.time() - readiness.started_at, 1)}
+
+    async def ready() -> JSONResponse:
+        return JSONResponse(readiness.snapshot(), status_code=200 if readiness.ready else 503)
+
+    app.add_api_route("/health/live", live, methods=["GET"], tags=["health"])
+    app.add_api_route("/health/ready", ready, methods=["GET"], tags=["health"])
+    app.add_event_handler("startup", readiness.start)
+    app.add_event_handler("shutdown", readiness.stop)
@@ -0,0 +1,220 @@
+"""Crash-safe persistence for small documents a service owns and rewrites.
+
+``DocumentStore`` keeps one JSON or YAML file. Every commit serializes the whole
+document to a temporary file in the same directory, fsyncs it and ``os.replace``s
+it over the original, so readers and a crash at any point see either the old
+or the new file, never a truncated one. Writers are serialized by a lock and
+apply their change to the latest committed document, so concurrent updates
+cannot be lost.
+
+Reads are served from an in-memory copy tagged with the store's version; it is
+replaced when a commit bumps the version or when a ``stat`` shows the file was
+changed outside the store (by hand or by another process), so hot paths cost
+one ``stat`` and never re-parse an unchanged file. Returned documents are
+shared and must be treated as read-only.
+
+With a journal path, each commit also appends one JSON line (version, time,
+action and the full document) to an append-only log that serves as an audit
+trail and as the source for ``restore()``. The journal keeps the last
+``STORE_JOURNAL_MAX_ENTRIES`` commits: once it grows a quarter past that it is
+rewritten atomically without the oldest entries.
+"""
+from __future__ import annotations
+
+import copy
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import yaml
+from prometheus_client import Counter
+
+logger = logging.getLogger(__name__)
+
+STORE_COMMITS = Counter("store_commits_total", "Documents committed to disk.", ["store"])
+JOURNAL_MAX_ENTRIES = int(os.getenv("STORE_JOURNAL_MAX_ENTRIES", "500"))
+
+
+def atomic_write(path: Path, data: bytes) -> None:
+    """Replace ``path`` with ``data`` via a fsynced temporary file and rename."""
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as handle:
+            handle.write(data)
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+    try:
+        dir_fd = os.open(path.parent, os.O_RDONLY)
+    except OSError:  # pragma: no cover - directories cannot be opened on some platforms
+        return
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+class Journal:
+    """Append-only JSON-lines log of committed documents, compacted to the newest ``max_entries``."""
+
+    def __init__(self, path: Path, max_entries: int = JOURNAL_MAX_ENTRIES) -> None:
+        self.path = path
+        self.max_entries = max(1, max_entries)
+        self._lines: Optional[int] = None
+
+    def append(self, entry: Dict[str, Any]) -> None:
+        line = json.dumps(entry, sort_keys=True, default=str) + "\n"
+        with self.path.open("a", encoding="utf-8") as handle:
+            handle.write(line)
+            handle.flush()
+            os.fsync(handle.fileno())
+        if self._lines is None:
+            self._lines = len(self._read_lines())
+        else:
+            self._lines += 1
+        if self._lines > self.max_entries + max(1, self.max_entries // 4):
+            self.compact()
+
+    def compact(self) -> None:
+        """Atomically drop all but the newest ``max_entries`` lines."""
+        lines = self._read_lines()[-self.max_entries:]
+        atomic_write(self.path, "".join(line + "\n" for line in lines).encode("utf-8"))
+        self._lines = len(lines)
+
+    def _read_lines(self) -> List[str]:
+        if not self.path.exists():
+            return []
+        return self.path.read_text(encoding="utf-8").splitlines()
+
+    def entries(self) -> List[Dict[str, Any]]:
+        entries = []
+        lines = self._read_lines()
+        self._lines = len(lines)
+        for line in lines:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                # a crash mid-append can only damage the last line
+                logger.warning("Skipping unreadable journal line in %s", self.path)
+        return entries
+
+
+class DocumentStore:
+    def __init__(
+        self,
+        path: str | Path,
+        name: str,
+        default: Optional[Dict[str, Any]] = None,
+        fmt: str = "json",
+        journal_path: Optional[str | Path] = None,
+    ) -> None:
+        if fmt not in ("json", "yaml"):
+            raise ValueError(f"Unsupported document format {fmt}")
+        self.path = Path(path)
+        self.name = name
+        self.default = default or {}
+        self.fmt = fmt
+        self.journal = Journal(Path(journal_path)) if journal_path else None
+        self.version = 0
+        self._cache: Optional[Tuple[int, Dict[str, Any]]] = None
+        self._stat: Optional[Tuple[int, int, int]] = None
+        self._lock = threading.Lock()
+        self._commits = STORE_COMMITS.labels(name)
+        if self.journal is not None:
+            entries = self.journal.entries()
+            self.version = entries[-1]["version"] if entries else 0
+
+    def _file_stat(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = self.path.stat()
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def _load(self) -> Dict[str, Any]:
+        self._stat = self._file_stat()
+        if self._stat is None:
+            return copy.deepcopy(self.default)
+        text = self.path.read_text(encoding="utf-8")
+        data = json.loads(text) if self.fmt == "json" else yaml.safe_load(text)
+        if not isinstance(data, dict):
+            raise ValueError(f"{self.path} does not contain a mapping")
+        return data
+
+    def _dump(self, document: Dict[str, Any]) -> bytes:
+        if self.fmt == "json":
+            return json.dumps(document, indent=2, sort_keys=True).encode("utf-8")
+        return yaml.safe_dump(document, sort_keys=True).encode("utf-8")
+
+    def read(self) -> Dict[str, Any]:
+        cached = self._cache
+        if cached is not None and cached[0] == self.version and self._file_stat() == self._stat:
+            return cached[1]
+        with self._lock:
+            if self._cache is None or self._cache[0] != self.version or self._file_stat() != self._stat:
+                self._cache = (self.version, self._load())
+            return self._cache[1]
+
+    def update(self, action: str, mutate: Callable[[Dict[str, Any]], Any]) -> Dict[str, Any]:
+        """Apply ``mutate`` to a copy of the latest document and commit it atomically.
+
+        Exceptions raised by ``mutate`` abort the commit and propagate unchanged.
+        """
+        with self._lock:
+            base = self._cache[1] if self._cache is not None else None
+            if base is None or self._file_stat() != self._stat:
+                # first write, or the file was edited behind our back: start from disk
+                base = self._load()
+            document = copy.deepcopy(base)
+            mutate(document)
+            return self._commit(action, document)
+
+    def _commit(self, action: str, document: Dict[str, Any]) -> Dict[str, Any]:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write(self.path, self._dump(document))
+        version = self.version + 1
+        if self.journal is not None:
+            self.journal.append({"version": version, "ts": time.time(), "action": action, "document": document})
+        self._stat = self._file_stat()
+        self._cache = (version, document)
+        self.version = version
+        self._commits.inc()
+        return document
+
+    def history(self, limit: int = 20) -> List[Dict[str, Any]]:
+        if self.journal is None:
+            return []
+        entries = self.journal.entries()[-limit:] if limit > 0 else []
+        return [{key: value for key, value in entry.items() if key != "document"} for entry in entries]
+
+    def restore(self, version: int) -> Dict[str, Any]:
+        """Commit the document recorded at ``version`` in the journal as a new version."""
+        if self.journal is None:
+            raise LookupError(f"{self.name} store has no journal")
+        for entry in reversed(self.journal.entries()):
+            if entry.get("version") == version:
+                with self._lock:
+                    return self._commit(f"restore:{version}", entry["document"])
+        raise LookupError(f"{self.name} journal has no version {version}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": str(self.path),
+            "version": self.version,
+            "journal": str(self.journal.path) if self.journal is not None else None,
+        }
+
+
+def journal_path(path: Path) -> Optional[Path]:
+    """Journal location for ``path`` when ``STORE_JOURNAL`` is enabled."""
+    if os.getenv("STORE_JOURNAL", "0").lower() in ("1", "true", "yes"):
+        return path.with_name(path.name + ".journal.jsonl")
+    return None
@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import hashlib
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Mapping, Optional
+
+from prometheus_client import Counter, Gauge
+
+REPLICA_OUTSTANDING = Gauge(
+    "gateway_replica_outstanding_requests", "Requests sent or queued to an upstream replica.", ["endpoint"]
+)
+REPLICA_EJECTIONS = Counter(
+    "gateway_replica_ejections_total", "Replicas taken out of rotation after consecutive failures.", ["endpoint"]
+)
+
+# session the current request sticks to, when affinity is on; set by the proxy and upload handlers
+current_session: ContextVar[Optional[str]] = ContextVar("gateway_session", default=None)
+
+
+def model_replicas(model_cfg: Mapping[str, Any]) -> List[Dict[str, Optional[str]]]:
+    """``{"endpoint", "health"}`` for each replica of a model; a model without ``replicas`` is its own."""
+    entries = model_cfg.get("replicas")
+    if not entries:
+        return [{"endpoint": model_cfg.get("endpoint"), "health": model_cfg.get("health")}]
+    replicas = []
+    for entry in entries:
+        if isinstance(entry, str):
+            replicas.append({"endpoint": entry, "health": None})
+        else:
+            replicas.append({"endpoint": entry.get("endpoint"), "health": entry.get("health")})
+    return replicas
+
+
+def validate_replicas(model_id: str, model_cfg: Mapping[str, Any]) -> None:
+    entries = model_cfg.get("replicas")
+    if entries is None:
+        return
+    if not isinstance(entries, list) or not entries:
+        raise ValueError(f"Model {model_id} replicas must be a non-empty list")
+    for entry in entries:
+        if not (isinstance(entry, str) and entry) and not (isinstance(entry, dict) and entry.get("endpoint")):
+            raise ValueError(f"Model {model_id} has a replica without an endpoint")
+
+
+class ReplicaState:
+    def __init__(self) -> None:
+        self.outstanding = 0
+        self.picks = 0
+        self.last_picked = 0.0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+
+
+class ReplicaBalancer:
+    """Client-side balancing across the replicas of each model.
+
+    Replicas are ranked by outstanding requests (sent or still queued by the
+    scheduler), fewest first, with ties going to the replica picked least recently
+    so sequential traffic round-robins. ``power_of_two`` ranks a random pair first
+    instead of scanning every replica. A replica that fails ``eject_after`` calls
+    in a row leaves the rotation for ``eject_s``, doubling on each repeat ejection
+    up to ``max_eject_s``; if every replica is ejected the ranking falls back to
+    all of them rather than refusing. With ``affinity.enabled`` a session key
+    (header or payload field) is mapped to a replica by rendezvous hashing, so a
+    conversation keeps hitting the replica that holds its KV cache and only the
+    sessions of a replica that disappears move elsewhere.
+    """
+
+    def __init__(self, settings: Optional[Dict[str, Any]] = None) -> None:
+        settings = settings or {}
+        self.strategy = str(settings.get("strategy", "least_outstanding"))
+        if self.strategy not in ("least_outstanding", "power_of_two"):
+            raise ValueError(f"Unknown balancing strategy {self.strategy!r}")
+        self.eject_after = max(1, int(settings.get("eject_after", 3)))
+        self.eject_s = float(settings.get("eject_s", 10.0))
+        self.max_eject_s = float(settings.get("max_eject_s", 300.0))
+        affinity = settings.get("affinity") or {}
+        self.affinity = bool(affinity.get("enabled", False))
+        self.affinity_headers = [header.lower() for header in affinity.get("headers") or ["x-session-id"]]
+        self.affinity_field = affinity.get("payload_field", "user")
+        # a sticky replica this much busier than the least loaded one is passed over
+        self.affinity_max_gap = int(affinity.get("max_outstanding_gap", 8))
+        self._replicas: Dict[str, ReplicaState] = {}
+        self._random = random.Random()
+
+    def state(self, endpoint: str) -> ReplicaState:
+        state = self._replicas.get(endpoint)
+        if state is None:
+            state = self._replicas[endpoint] = ReplicaState()
+        return state
+
+    def session_key(self, headers: Mapping[str, str], payload: Optional[Mapping[str, Any]] = None) -> Optional[str]:
+        if not self.affinity:
+            return None
+        for header in self.affinity_headers:
+            value = headers.get(header)
+            if value:
+                return value
+        if payload is not None and self.affinity_field:
+            value = payload.get(self.affinity_field)
+            if isinstance(value, str) and value:
+                return value
+        return None
+
+    def ejected(self, endpoint: str, now: Optional[float] = None) -> bool:
+        state = self._replicas.get(endpoint)
+        return state is not None and state.ejected_until > (now if now is not None else time.monotonic())
+
+    def rank(self, endpoints: List[str], session: Optional[str] = None) -> List[str]:
+        """Replicas in the order they should be tried."""
+        if len(endpoints) <= 1:
+            return list(endpoints)
+        now = time.monotonic()
+        pool = [endpoint for endpoint in endpoints if not self.ejected(endpoint, now)]
+        if not pool:
+            pool = sorted(endpoints, key=lambda endpoint: self.state(endpoint).ejected_until)
+        ranked = sorted(pool, key=self._load)
+        if self.strategy == "power_of_two" and len(ranked) > 2:
+            pair = sorted(self._random.sample(pool, 2), key=self._load)
+            ranked = pair + [endpoint for endpoint in ranked if endpoint not in pair]
+        if session is not None:
+            sticky = max(pool, key=lambda endpoint: hashlib.sha256(f"{session}|{endpoint}".encode("utf-8")).digest())
+            if self.state(sticky).outstanding - self.state(ranked[0]).outstanding <= self.affinity_max_gap:
+                ranked = [sticky] + [endpoint for endpoint in ranked if endpoint != sticky]
+        return ranked
+
+    def _load(self, endpoint: str) -> tuple:
+        state = self.state(endpoint)
+        return (state.outstanding, state.last_picked)
+
+    @contextmanager
+    def track(self, endpoint: str) -> Iterator[None]:
+        """Count a request against ``endpoint`` for as long as it is outstanding."""
+        state = self.state(endpoint)
+        state.outstanding += 1
+        state.picks += 1
+        state.last_picked = time.monotonic()
+        gauge = REPLICA_OUTSTANDING.labels(endpoint)
+        gauge.set(state.outstanding)
+        try:
+            yield
+        finally:
+            state.outstanding -= 1
+            gauge.set(state.outstanding)
+
+    def record(self, endpoint: str, ok: bool) -> None:
+        state = self.state(endpoint)
+        if ok:
+            state.consecutive_failures = 0
+            if state.ejected_until <= time.monotonic():
+                state.ejections = 0
+            return
+        state.failures += 1
+        state.consecutive_failures += 1
+        if state.consecutive_failures >= self.eject_after:
+            state.consecutive_failures = 0
+            state.ejections += 1
+            state.ejected_until = time.monotonic() + min(self.max_eject_s, self.eject_s * 2 ** (state.ejections - 1))
+            REPLICA_EJECTIONS.labels(endpoint).inc()
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "strategy": self.strategy,
+            "affinity": self.affinity,
+            "replicas": {
+                endpoint: {
+                    "outstanding": state.outstanding,
+                    "picks": state.picks,
+                    "failures": state.failures,
+                    "ejections": state.ejections,
+                    "ejected_for_s": round(max(0.0, state.ejected_until - now), 3),
+                }
+                for endpoint, state in self._replicas.items()
+            },
+        }
@@ -0,0 +1,228 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Generic, Hashable, List, Optional, TypeVar
+
+from familyai_common.store import atomic_write
+
+logger = logging.getLogger(__name__)
+
+V = TypeVar("V")
+
+
+class TTLCache(Generic[V]):
+    """Bounded LRU cache whose entries expire after ``ttl_s`` seconds.
+
+    Entries are tagged with the upstream ``version`` they were computed against;
+    observing a different version drops everything at once.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_s: float = 30.0) -> None:
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_s = float(ttl_s)
+        self.version: Optional[str] = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries: "OrderedDict[Hashable, tuple[float, V]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[V]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: V) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl_s, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def observe_version(self, version: Optional[str]) -> None:
+        """Record the upstream version, clearing entries computed against an older one."""
+        if not version or version == self.version:
+            return
+        if self.version is not None:
+            self.invalidate()
+        self.version = version
+
+    def invalidate(self) -> None:
+        self._entries.clear()
+        self.invalidations += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_s": self.ttl_s,
+            "version": self.version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+        }
+
+
+# payload fields that change how a response is delivered, not what it says
+TRANSPORT_FIELDS = frozenset({"stream", "stream_options", "user"})
+
+
+def _canonical(value: Any) -> Any:
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, dict):
+        return {key: _canonical(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_canonical(item) for item in value]
+    return value
+
+
+def payload_digest(model: str, payload: Dict[str, Any]) -> str:
+    """Hash of the resolved model and the canonical JSON form of ``payload``.
+
+    Keys are sorted, whitespace stripped and integral floats written as integers,
+    so requests that differ only in field order or formatting share an entry.
+    """
+    canonical = {key: _canonical(value) for key, value in payload.items() if key not in TRANSPORT_FIELDS}
+    body = json.dumps(canonical, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(f"{model}\n{body}".encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Upstream responses for deterministic requests, in memory and optionally on disk.
+
+    Only requests with ``temperature == 0``, or ones that ask for it explicitly,
+    are cached; a request can also opt out. The in-memory tier is a ``TTLCache``
+    so hits never leave the event loop. With ``disk_dir`` every entry is also
+    written to ``<digest>.json`` there (atomically, off the event loop) and a
+    memory miss falls back to the file, so the cache survives restarts. The
+    disk tier is bounded by ``disk_max_entries``, dropping the oldest files.
+    File reads, writes and deletes run in worker threads; the disk index is only
+    touched on the event loop, so it needs no lock.
+    """
+
+    def __init__(self, settings: Optional[Dict[str, Any]] = None) -> None:
+        settings = settings or {}
+        self.enabled = bool(settings.get("enabled", True))
+        self.ttl_s = float(settings.get("ttl_s", 3600.0))
+        self.memory: TTLCache[Dict[str, Any]] = TTLCache(settings.get("max_entries", 512), self.ttl_s)
+        disk_dir = os.getenv("RESPONSE_CACHE_DIR") or settings.get("disk_dir")
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.disk_max_entries = max(1, int(settings.get("disk_max_entries", 10_000)))
+        self.disk_hits = 0
+        self.stores = 0
+        self.bypassed = 0
+        self._disk_index: "OrderedDict[str, None]" = OrderedDict()
+        if self.disk_dir is not None:
+            self._scan_disk()
+
+    def _scan_disk(self) -> None:
+        assert self.disk_dir is not None
+        try:
+            files = sorted(self.disk_dir.glob("*.json"), key=lambda path: path.stat().st_mtime)
+        except OSError:
+            files = []
+        for path in files:
+            self._disk_index[path.stem] = None
+
+    def eligible(self, payload: Dict[str, Any], flag: Optional[bool]) -> bool:
+        """Whether this request may be answered from (and stored in) the cache."""
+        if not self.enabled or payload.get("stream") is True:
+            return False
+        if flag is False:
+            self.bypassed += 1
+            return False
+        return flag is True or payload.get("temperature") == 0
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self.memory.get(key)
+        if entry is None and self.disk_dir is not None and key in self._disk_index:
+            entry = await asyncio.to_thread(self._read_disk, key)
+            if entry is None:
+                self._disk_index.pop(key, None)
+            else:
+                self.disk_hits += 1
+                self.memory.put(key, entry)
+        if entry is None or entry["expires_at"] < time.time():
+            return None
+        return entry
+
+    def _read_disk(self, key: str) -> Optional[Dict[str, Any]]:
+        """The live entry stored for ``key``; expired files are deleted. Blocking file I/O only."""
+        assert self.disk_dir is not None
+        path = self.disk_dir / f"{key}.json"
+        try:
+            entry = json.loads(path.read_bytes())
+        except (OSError, ValueError):
+            return None
+        if entry.get("expires_at", 0) < time.time():
+            path.unlink(missing_ok=True)
+            return None
+        return entry
+
+    def put(self, key: str, model: str, endpoint: str, response: Any) -> Dict[str, Any]:
+        now = time.time()
+        entry = {"model": model, "endpoint": endpoint, "response": response, "stored_at": now, "expires_at": now + self.ttl_s}
+        self.memory.put(key, entry)
+        self.stores += 1
+        return entry
+
+    async def persist(self, key: str, entry: Dict[str, Any]) -> None:
+        """Write ``entry`` to the disk tier and evict the oldest files past ``disk_max_entries``."""
+        if self.disk_dir is None or not await asyncio.to_thread(self._write_disk, key, entry):
+            return
+        self._disk_index[key] = None
+        self._disk_index.move_to_end(key)
+        evicted: List[str] = []
+        while len(self._disk_index) > self.disk_max_entries:
+            evicted.append(self._disk_index.popitem(last=False)[0])
+        if evicted:
+            await asyncio.to_thread(self._unlink_disk, evicted)
+
+    def _write_disk(self, key: str, entry: Dict[str, Any]) -> bool:
+        assert self.disk_dir is not None
+        try:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            atomic_write(self.disk_dir / f"{key}.json", json.dumps(entry).encode("utf-8"))
+        except (OSError, TypeError, ValueError) as exc:
+            logger.warning("Could not persist cached response %s: %s", key, exc)
+            return False
+        return True
+
+    def _unlink_disk(self, keys: List[str]) -> None:
+        assert self.disk_dir is not None
+        for key in keys:
+            (self.disk_dir / f"{key}.json").unlink(missing_ok=True)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.memory.stats()
+        stats.update(
+            {
+                "enabled": self.enabled,
+                "stores": self.stores,
+                "bypassed": self.bypassed,
+                "disk_dir": str(self.disk_dir) if self.disk_dir is not None else None,
+                "disk_entries": len(self._disk_index),
+                "disk_hits": self.disk_hits,
+            }
+        )
+        return stats
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class FeedbackReporter:
+    """Batch per-model upstream outcomes for the control plane's live latency estimates.
+
+    Observations wait in a bounded deque (the oldest are dropped when it is full)
+    and are posted to ``POST /feedback`` every ``flush_s``. A failed post drops the
+    batch instead of retrying: the control plane only cares about recent samples.
+    """
+
+    def __init__(self, settings: Optional[Dict[str, Any]] = None) -> None:
+        settings = settings or {}
+        self.enabled = bool(settings.get("enabled", True))
+        self.flush_s = float(settings.get("flush_s", 2.0))
+        self.sent = 0
+        self.dropped = 0
+        self.failed_flushes = 0
+        self._pending: Deque[Dict[str, Any]] = deque(maxlen=max(1, int(settings.get("max_pending", 2048))))
+
+    def observe(self, model: str, latency_s: float, ok: bool) -> None:
+        if not self.enabled:
+            return
+        if len(self._pending) == self._pending.maxlen:
+            self.dropped += 1
+        self._pending.append({"model": model, "latency_ms": round(latency_s * 1000, 2), "ok": ok})
+
+    def drain(self) -> List[Dict[str, Any]]:
+        batch = list(self._pending)
+        self._pending.clear()
+        return batch
+
+    async def flush(self, client: httpx.AsyncClient, url: str) -> int:
+        batch = self.drain()
+        if not batch:
+            return 0
+        try:
+            response = await client.post(url, json={"observations": batch}, timeout=2.0)
+            response.raise_for_status()
+        except httpx.HTTPError as exc:
+            self.failed_flushes += 1
+            self.dropped += len(batch)
+            logger.debug("Latency feedback to %s failed: %s", url, exc)
+            return 0
+        self.sent += len(batch)
+        return len(batch)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "pending": len(self._pending),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "failed_flushes": self.failed_flushes,
+        }
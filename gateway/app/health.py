@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+
+from familyai_common.readiness import DOWN, Readiness
+
+from .balancer import model_replicas
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamHealth:
+    """Background probes of each model's ``health`` URL, cached for routing.
+
+    Every ``interval_s`` the distinct health URLs of the current routing config
+    (one per replica for models with ``replicas``) are fetched concurrently; an
+    endpoint is reported down after ``failures_to_down`` consecutive failed
+    probes and up again after one good one. Routing only reads the cached
+    verdict, so a dead upstream is skipped without waiting for a connect or read
+    timeout. Models without a ``health`` URL are never considered down.
+    """
+
+    def __init__(self, readiness: Readiness, settings: Optional[Dict[str, Any]] = None) -> None:
+        settings = settings or {}
+        self.readiness = readiness
+        self.enabled = bool(settings.get("enabled", True))
+        self.interval_s = float(settings.get("interval_s", 10.0))
+        self.timeout_s = float(settings.get("timeout_s", 2.0))
+        self.failures_to_down = max(1, int(settings.get("failures_to_down", 2)))
+        self.probes = 0
+        self.last_probe_at: Optional[float] = None
+        self._health_for: Dict[str, str] = {}
+        self._failures: Dict[str, int] = {}
+
+    @staticmethod
+    def dependency(health_url: str) -> str:
+        return f"upstream:{health_url}"
+
+    def targets(self, config: Dict[str, Any]) -> Dict[str, List[str]]:
+        """Health URL -> endpoints it vouches for, from the routing config's models and their replicas."""
+        targets: Dict[str, List[str]] = {}
+        for model in config["models"].values():
+            for replica in model_replicas(model):
+                health_url, endpoint = replica["health"], replica["endpoint"]
+                if health_url and endpoint:
+                    endpoints = targets.setdefault(health_url, [])
+                    if endpoint not in endpoints:
+                        endpoints.append(endpoint)
+        return targets
+
+    def is_down(self, endpoint: str) -> bool:
+        health_url = self._health_for.get(endpoint)
+        return health_url is not None and self.readiness.status(self.dependency(health_url)) == DOWN
+
+    def retry_after(self) -> float:
+        """Seconds until the next probe may clear a down verdict."""
+        if self.last_probe_at is None:
+            return self.interval_s
+        return max(0.0, self.interval_s - (time.monotonic() - self.last_probe_at))
+
+    async def check(self, client: httpx.AsyncClient, url: str) -> Optional[str]:
+        """Return ``None`` when ``url`` answers 2xx, else what went wrong."""
+        try:
+            response = await client.get(url, timeout=self.timeout_s)
+        except httpx.HTTPError as exc:
+            return f"{type(exc).__name__}: {exc}" if str(exc) else type(exc).__name__
+        if response.is_success:
+            return None
+        return f"HTTP {response.status_code}"
+
+    def report(self, url: str, error: Optional[str]) -> None:
+        failures = 0 if error is None else self._failures.get(url, 0) + 1
+        self._failures[url] = failures
+        down = failures >= self.failures_to_down
+        detail = error if error is None or down else f"{error} ({failures}/{self.failures_to_down})"
+        self.readiness.set(self.dependency(url), not down, detail, critical=False)
+
+    async def probe(self, config: Dict[str, Any], client_for: Callable[[str], httpx.AsyncClient]) -> None:
+        targets = self.targets(config)
+        urls = list(targets)
+        errors = await asyncio.gather(*(self.check(client_for(url), url) for url in urls))
+        for url, error in zip(urls, errors):
+            self.report(url, error)
+        for url in set(self._failures) - set(targets):
+            # dropped from the config by a reload
+            self._failures.pop(url, None)
+            self.readiness.forget(self.dependency(url))
+        self._health_for = {endpoint: url for url, endpoints in targets.items() for endpoint in endpoints}
+        self.probes += 1
+        self.last_probe_at = time.monotonic()
+
+    async def run(
+        self, config_for: Callable[[], Dict[str, Any]], client_for: Callable[[str], httpx.AsyncClient]
+    ) -> None:
+        while True:
+            try:
+                await self.probe(config_for(), client_for)
+            except Exception:  # pragma: no cover - keep probing whatever a single round did
+                logger.exception("Upstream health probe failed")
+            await asyncio.sleep(self.interval_s)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "interval_s": self.interval_s,
+            "probes": self.probes,
+            "down": sorted(endpoint for endpoint in self._health_for if self.is_down(endpoint)),
+        }
@@ -2,15 +2,33 @@ from __future__ import annotations
 
 import asyncio
 import logging
+import math
 import os
-from functools import lru_cache
-from typing import Any, Dict, Literal, Optional
+import time
+from contextlib import AsyncExitStack
+from typing import Any, AsyncIterator, Callable, Dict, List, Literal, Optional, Set, Tuple
 
+import anyio
 import httpx
-import yaml
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 
+from familyai_common.config import ConfigWatcher, poll_interval
+from familyai_common.metrics import install as install_metrics
+from familyai_common.metrics import observe_upstream
+from familyai_common.readiness import READY, Readiness
+from familyai_common.readiness import install as install_readiness
+
+from .balancer import ReplicaBalancer, current_session, model_replicas, validate_replicas
+from .cache import ResponseCache, TTLCache, payload_digest
+from .feedback import FeedbackReporter
+from .health import UpstreamHealth
+from .resilience import BreakerRegistry, hedge
+from .scheduler import AdmissionRejected, AdmissionScheduler, current_client
+from .tokens import TokenEstimator
+from .upstream import UpstreamPool, build_timeout
+
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
 
@@ -43,21 +61,42 @@ class ProxyRequest(BaseModel):
     context_tokens: Optional[int] = None
     complexity: Optional[float] = None
     priority: Optional[Literal["speed", "quality", "cost", "balanced"]] = None
+    cache: Optional[bool] = Field(
+        None,
+        description="True caches the response even when temperature > 0; False bypasses the response cache.",
+    )
+
+
+def validate_routing_config(config: Dict[str, Any]) -> None:
+    missing = {"models", "policies"} - set(config)
+    if missing:
+        raise ValueError(f"Routing configuration missing sections: {sorted(missing)}")
+    for model_id, model_cfg in config["models"].items():
+        if not isinstance(model_cfg, dict) or not model_cfg.get("endpoint"):
+            raise ValueError(f"Model {model_id} has no endpoint")
+        validate_replicas(model_id, model_cfg)
+
+
+_routing_config: Optional[ConfigWatcher] = None
 
 
-def load_routing_config(path: str) -> Dict[str, Any]:
-    with open(path, "r", encoding="utf-8") as handle:
-        data = yaml.safe_load(handle)
-    if not data:
-        raise RuntimeError("Routing configuration is empty")
-    return data
+def get_routing_config() -> ConfigWatcher:
+    global _routing_config
+    if _routing_config is None:
+        config_path = os.getenv("ROUTING_CONFIG", "/app/config/routing.yaml")
+        _routing_config = ConfigWatcher(config_path, "routing", validate=validate_routing_config)
+    return _routing_config
+
+
+def reset_config() -> None:
+    """Forget the watcher so the next read picks up ``ROUTING_CONFIG`` afresh."""
+    global _routing_config
+    _routing_config = None
 
 
-@lru_cache(maxsize=1)
 def get_config() -> Dict[str, Any]:
-    config_path = os.getenv("ROUTING_CONFIG", "/app/config/routing.yaml")
-    logger.info("Loading routing configuration from %s", config_path)
-    return load_routing_config(config_path)
+    """The routing snapshot pinned to this request, or the latest one outside a request."""
+    return get_routing_config().current.data
 
 
 def select_code_model(config: Dict[str, Any], request: RouteRequest) -> str:
@@ -88,19 +127,114 @@ SELECTORS = {
 }
 
 app = FastAPI(title="FamilyAI Intelligent Gateway", version="0.1.0")
+install_metrics(app, "gateway")
+readiness = Readiness("gateway")
+readiness.register("routing_config")
+install_readiness(app, readiness)
+
+_pool: Optional[UpstreamPool] = None
+
+
+def get_pool() -> UpstreamPool:
+    global _pool
+    if _pool is None:
+        _pool = UpstreamPool(get_config().get("http_client"))
+    return _pool
+
+
+_breakers: Optional[BreakerRegistry] = None
+_recommendations: Optional[TTLCache[RouteResponse]] = None
+_feedback: Optional[FeedbackReporter] = None
+_responses: Optional[ResponseCache] = None
+_scheduler: Optional[AdmissionScheduler] = None
+_upstream_health: Optional[UpstreamHealth] = None
+_balancer: Optional[ReplicaBalancer] = None
+_background_tasks: List[asyncio.Task] = []
+_cache_writes: Set[asyncio.Task] = set()
+
+
+def get_breakers() -> BreakerRegistry:
+    global _breakers
+    if _breakers is None:
+        _breakers = BreakerRegistry(get_config().get("resilience"))
+    return _breakers
+
+
+def get_recommendation_cache() -> TTLCache[RouteResponse]:
+    global _recommendations
+    if _recommendations is None:
+        settings = get_config().get("recommendation_cache") or {}
+        _recommendations = TTLCache(
+            max_entries=settings.get("max_entries", 256),
+            ttl_s=settings.get("ttl_s", 30.0),
+        )
+    return _recommendations
+
+
+def get_feedback() -> FeedbackReporter:
+    global _feedback
+    if _feedback is None:
+        _feedback = FeedbackReporter(get_config().get("feedback"))
+    return _feedback
+
+
+def get_response_cache() -> ResponseCache:
+    global _responses
+    if _responses is None:
+        _responses = ResponseCache(get_config().get("response_cache"))
+    return _responses
+
+
+def get_scheduler() -> AdmissionScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = AdmissionScheduler(get_config().get("scheduler"))
+    return _scheduler
+
+
+def get_upstream_health() -> UpstreamHealth:
+    global _upstream_health
+    if _upstream_health is None:
+        _upstream_health = UpstreamHealth(readiness, get_config().get("health"))
+    return _upstream_health
+
+
+def get_balancer() -> ReplicaBalancer:
+    global _balancer
+    if _balancer is None:
+        _balancer = ReplicaBalancer(get_config().get("balancing"))
+    return _balancer
+
+
+def too_many_requests(exc: AdmissionRejected) -> HTTPException:
+    headers = {"Retry-After": str(max(1, math.ceil(exc.retry_after_s)))}
+    detail: Dict[str, Any] = {"reason": exc.reason, "retry_after_s": round(exc.retry_after_s, 3)}
+    if exc.queue_position is not None:
+        headers["X-Queue-Position"] = str(exc.queue_position)
+        detail["queue_position"] = exc.queue_position
+    return HTTPException(status_code=429, detail=detail, headers=headers)
+
+
+def context_bucket(tokens: Optional[int]) -> int:
+    """Round up to the next power of two (min 1024): the recommendation cache key's context."""
+    if not tokens:
+        return 0
+    return max(1024, 1 << (tokens - 1).bit_length())
+
+
+def model_timeout(model_id: str) -> httpx.Timeout:
+    config = get_config()
+    model_cfg = config["models"].get(model_id, {})
+    return build_timeout((config.get("http_client") or {}).get("timeout"), model_cfg.get("timeout"))
 
 
 @app.get("/health", tags=["health"])
 async def health() -> Dict[str, str]:
+    # liveness plus the last known control plane state; nothing is fetched here
     status: Dict[str, str] = {"status": "ok"}
-    if CONTROL_PLANE_URL:
-        try:
-            async with httpx.AsyncClient(timeout=2.0) as client:
-                response = await client.get(f"{CONTROL_PLANE_URL.rstrip('/')}/health")
-                response.raise_for_status()
-                status["control_plane"] = response.json().get("status", "ok")
-        except Exception:
-            status["control_plane"] = "degraded"
+    control_plane = readiness.status("control_plane")
+    if control_plane is not None:
+        status["control_plane"] = "ok" if control_plane == READY else "degraded"
     return status
 
 
@@ -108,22 +242,31 @@ async def recommend_via_control_plane(policy: Dict[str, Any], request: RouteRequ
     if not CONTROL_PLANE_URL or not policy.get("control_plane_profile"):
         return None
 
+    # the control plane scores the real context; only the cache key is bucketed
     payload = {
         "task": request.task,
         "context_tokens": request.context_tokens or 0,
         "priority": request.priority or "balanced",
         "allow_cloud": bool(policy.get("allow_cloud", False)),
     }
+    bucket = context_bucket(request.context_tokens)
+    cache = get_recommendation_cache()
+    routing_version = get_routing_config().current.version
+    cache_key = (payload["task"], payload["priority"], payload["allow_cloud"], bucket, routing_version)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return cached.model_copy(deep=True)
+
     url = f"{CONTROL_PLANE_URL.rstrip('/')}/recommend"
 
     try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            response = await client.post(url, json=payload)
-            response.raise_for_status()
+        response = await get_pool().client_for(url).post(url, json=payload, timeout=5.0)
+        response.raise_for_status()
     except httpx.HTTPError as exc:
         logger.warning("Control plane recommendation failed: %s", exc)
         return None
 
+    cache.observe_version(response.headers.get("etag"))
     data = response.json()
     model_info = data.get("model") or {}
     model_id = model_info.get("id")
@@ -138,11 +281,71 @@ async def recommend_via_control_plane(policy: Dict[str, Any], request: RouteRequ
         logger.warning("Unable to resolve endpoint for model %s", model_id)
         return None
 
+    alternatives = []
+    for alternative in data.get("alternatives") or []:
+        alternative_endpoint = alternative.get("endpoint") or config["models"].get(alternative.get("id"), {}).get("endpoint")
+        if alternative.get("id") and alternative_endpoint:
+            alternatives.append({"model": alternative["id"], "endpoint": alternative_endpoint})
+
     metadata = dict(model_info)
     metadata["score"] = data.get("score")
     metadata["rationale"] = data.get("rationale", [])
     metadata["source"] = "control-plane"
-    return RouteResponse(model=model_id, endpoint=endpoint, metadata=metadata)
+    metadata["alternatives"] = alternatives + policy_fallbacks(config, policy)
+    route = RouteResponse(model=model_id, endpoint=endpoint, metadata=metadata)
+    if not model_info.get("context") or model_info["context"] >= bucket:
+        # reused for any request in the bucket, so it must fit the bucket's upper edge
+        cache.put(cache_key, route)
+    return route.model_copy(deep=True)
+
+
+def policy_fallbacks(config: Dict[str, Any], policy: Dict[str, Any]) -> List[Dict[str, str]]:
+    fallbacks = []
+    for model_id in policy.get("fallbacks") or []:
+        endpoint = config["models"].get(model_id, {}).get("endpoint")
+        if endpoint:
+            fallbacks.append({"model": model_id, "endpoint": endpoint})
+    return fallbacks
+
+
+async def refresh_catalog_version() -> None:
+    url = f"{CONTROL_PLANE_URL.rstrip('/')}/version"
+    try:
+        response = await get_pool().client_for(url).get(url, timeout=2.0)
+        response.raise_for_status()
+    except httpx.HTTPError as exc:
+        logger.debug("Control plane version check failed: %s", exc)
+        readiness.set("control_plane", False, f"{type(exc).__name__}: {exc}", critical=False)
+        return
+    readiness.set("control_plane", True, critical=False)
+    get_recommendation_cache().observe_version(response.headers.get("etag"))
+
+
+async def report_feedback(interval_s: float) -> None:
+    """Ship observed upstream latency and errors to the control plane for live scoring."""
+    url = f"{CONTROL_PLANE_URL.rstrip('/')}/feedback"
+    while True:
+        await asyncio.sleep(interval_s)
+        await get_feedback().flush(get_pool().client_for(url), url)
+
+
+async def poll_catalog_version(interval_s: float) -> None:
+    """Watch the control plane's catalog version so cached picks are dropped on change.
+
+    The poll doubles as the control plane's health check for ``/health``.
+    """
+    while True:
+        await refresh_catalog_version()
+        await asyncio.sleep(interval_s)
+
+
+def estimate_context_tokens(config: Dict[str, Any], policy: Dict[str, Any], request: RouteRequest) -> bool:
+    """Fill in ``context_tokens`` from the payload when the caller did not; returns whether it did."""
+    if request.context_tokens is not None or not request.payload:
+        return False
+    estimator = TokenEstimator.for_family(config.get("token_estimation"), policy.get("token_family"))
+    request.context_tokens = estimator.estimate(request.payload)
+    return request.context_tokens is not None
 
 
 async def resolve_route(request: RouteRequest) -> RouteResponse:
@@ -151,8 +354,11 @@ async def resolve_route(request: RouteRequest) -> RouteResponse:
     if not policy:
         raise HTTPException(status_code=404, detail=f"Unsupported task: {request.task}")
 
+    estimated = estimate_context_tokens(config, policy, request)
     dynamic_route = await recommend_via_control_plane(policy, request)
     if dynamic_route:
+        if estimated:
+            dynamic_route.metadata["estimated_context_tokens"] = request.context_tokens
         return dynamic_route
 
     selector = SELECTORS.get(request.task, lambda _, __: policy.get("default"))
@@ -164,49 +370,541 @@ async def resolve_route(request: RouteRequest) -> RouteResponse:
 
     metadata = dict(model_cfg)
     metadata["source"] = "static"
+    if estimated:
+        metadata["estimated_context_tokens"] = request.context_tokens
+    metadata["alternatives"] = [entry for entry in policy_fallbacks(config, policy) if entry["model"] != model_id]
     return RouteResponse(model=model_id, endpoint=model_cfg["endpoint"], metadata=metadata)
 
 
-async def proxy_request(client: httpx.AsyncClient, endpoint: str, payload: Dict[str, Any]) -> httpx.Response:
+async def proxy_request(endpoint: str, payload: Dict[str, Any], timeout: httpx.Timeout) -> httpx.Response:
     try:
-        response = await client.post(endpoint, json=payload, timeout=120)
-        response.raise_for_status()
-        return response
+        response = await get_pool().client_for(endpoint).post(endpoint, json=payload, timeout=timeout)
+    except httpx.RequestError as exc:
+        logger.error("Gateway failed to reach %s: %s", endpoint, exc)
+        raise HTTPException(status_code=502, detail=str(exc) or type(exc).__name__) from exc
+    if response.status_code >= 500 or response.status_code == 429:
+        raise HTTPException(status_code=502, detail=f"Upstream returned {response.status_code}: {response.text[:512]}")
+    if response.is_error:
+        raise HTTPException(status_code=response.status_code, detail=response.text[:512])
+    return response
+
+
+def route_candidates(routing: RouteResponse) -> List[RouteResponse]:
+    """The chosen route followed by its alternatives, one per distinct (endpoint, model).
+
+    Local models often share one vLLM endpoint, so a lightweight alternative on the
+    primary's endpoint is still a candidate: it is sent with its own ``model``.
+    """
+    candidates = [routing]
+    seen = {(routing.endpoint, routing.model)}
+    for alternative in routing.metadata.get("alternatives") or []:
+        key = (alternative["endpoint"], alternative["model"])
+        if key in seen:
+            continue
+        seen.add(key)
+        metadata = {"source": "fallback", "primary": routing.model}
+        candidates.append(RouteResponse(model=alternative["model"], endpoint=alternative["endpoint"], metadata=metadata))
+    return candidates
+
+
+def candidate_payload(candidate: RouteResponse, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """``payload`` as sent to ``candidate``: a fallback names its own model (``served_model``, else its id)."""
+    if candidate.metadata.get("source") != "fallback":
+        return payload
+    model_cfg = get_config()["models"].get(candidate.model) or {}
+    return {**payload, "model": model_cfg.get("served_model", candidate.model)}
+
+
+def replica_endpoints(candidate: RouteResponse) -> List[str]:
+    """Where ``candidate`` can be sent: its model's ``replicas``, or else the endpoint it was routed to."""
+    model_cfg = get_config()["models"].get(candidate.model)
+    if not model_cfg or not model_cfg.get("replicas"):
+        return [candidate.endpoint]
+    return [replica["endpoint"] for replica in model_replicas(model_cfg)]
+
+
+def pick_replica(candidate: RouteResponse, tried: Set[Tuple[str, str]]) -> Optional[RouteResponse]:
+    """The best untried replica of ``candidate`` that is neither probed down nor circuit-open."""
+    upstream_health, breakers = get_upstream_health(), get_breakers()
+    endpoints = [endpoint for endpoint in replica_endpoints(candidate) if (endpoint, candidate.model) not in tried]
+    for endpoint in get_balancer().rank(endpoints, current_session.get()):
+        # health first: asking the breaker may hand out its half-open probe slot
+        if not upstream_health.is_down(endpoint) and breakers.get(endpoint).allow():
+            tried.add((endpoint, candidate.model))
+            return candidate if endpoint == candidate.endpoint else candidate.model_copy(update={"endpoint": endpoint})
+    return None
+
+
+def replica_picker(candidates: List[RouteResponse]) -> Callable[[], Optional[RouteResponse]]:
+    """Hand out one replica per call: every usable replica of a candidate before moving to the next."""
+    pending = list(candidates)
+    tried: Set[Tuple[str, str]] = set()
+
+    def next_candidate() -> Optional[RouteResponse]:
+        while pending:
+            candidate = pick_replica(pending[0], tried)
+            if candidate is not None:
+                return candidate
+            pending.pop(0)
+        return None
+
+    return next_candidate
+
+
+def record_outcome(candidate: RouteResponse, elapsed: float, outcome: str) -> None:
+    """Feed one upstream call to its breaker, the replica balancer, metrics and latency feedback."""
+    ok = outcome != "error"
+    get_breakers().get(candidate.endpoint).record(ok, elapsed)
+    get_balancer().record(candidate.endpoint, ok)
+    observe_upstream("gateway", candidate.model, elapsed, outcome)
+    get_feedback().observe(candidate.model, elapsed, ok)
+
+
+def upstreams_unavailable(candidates: List[RouteResponse]) -> HTTPException:
+    breakers, upstream_health = get_breakers(), get_upstream_health()
+    retry_after = min(
+        upstream_health.retry_after() if upstream_health.is_down(endpoint) else breakers.get(endpoint).retry_after()
+        for candidate in candidates
+        for endpoint in replica_endpoints(candidate)
+    )
+    return HTTPException(
+        status_code=503,
+        detail="All upstreams for this route are unavailable (circuit open or failing health checks)",
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+async def attempt_upstream(
+    candidate: RouteResponse, payload: Dict[str, Any], attempts: List[str]
+) -> Tuple[RouteResponse, httpx.Response]:
+    """Call one candidate once the admission scheduler grants its endpoint a slot."""
+    async with AsyncExitStack() as slot:
+        slot.enter_context(get_balancer().track(candidate.endpoint))
+        try:
+            await slot.enter_async_context(get_scheduler().slot(candidate.endpoint))
+        except AdmissionRejected as exc:
+            get_breakers().get(candidate.endpoint).release()
+            raise too_many_requests(exc) from None
+        except BaseException:
+            # cancelled while queued (e.g. the losing hedge): hand back a half-open probe
+            get_breakers().get(candidate.endpoint).release()
+            raise
+        return await call_upstream(candidate, payload, attempts)
+
+
+async def call_upstream(
+    candidate: RouteResponse, payload: Dict[str, Any], attempts: List[str]
+) -> Tuple[RouteResponse, httpx.Response]:
+    attempts.append(candidate.model)
+    started = time.perf_counter()
+    try:
+        response = await proxy_request(
+            candidate.endpoint, candidate_payload(candidate, payload), model_timeout(candidate.model)
+        )
+    except HTTPException as exc:
+        record_outcome(candidate, time.perf_counter() - started, "error" if exc.status_code >= 500 else "client_error")
+        raise
+    except asyncio.CancelledError:
+        get_breakers().get(candidate.endpoint).release()
+        observe_upstream("gateway", candidate.model, time.perf_counter() - started, "cancelled")
+        raise
+    record_outcome(candidate, time.perf_counter() - started, "ok")
+    return candidate, response
+
+
+async def send_with_fallback(
+    routing: RouteResponse, payload: Dict[str, Any]
+) -> Tuple[RouteResponse, httpx.Response, List[str]]:
+    """Send to the best available candidate, hedging and falling back along the ranking."""
+    breakers = get_breakers()
+    candidates = route_candidates(routing)
+    next_candidate = replica_picker(candidates)
+    attempts: List[str] = []
+
+    def start_backup():
+        backup = next_candidate()
+        return attempt_upstream(backup, payload, attempts) if backup else None
+
+    candidate = next_candidate()
+    if candidate is None:
+        raise upstreams_unavailable(candidates)
+    last_error: Optional[HTTPException] = None
+    while candidate is not None:
+        try:
+            if breakers.hedge_enabled:
+                delay = breakers.hedge_delay(candidate.endpoint)
+                chosen, response = await hedge(attempt_upstream(candidate, payload, attempts), start_backup, delay)
+            else:
+                chosen, response = await attempt_upstream(candidate, payload, attempts)
+            return chosen, response, attempts
+        except HTTPException as exc:
+            if exc.status_code < 500:
+                raise
+            last_error = exc
+        candidate = next_candidate()
+    assert last_error is not None
+    raise last_error
+
+
+async def open_stream(endpoint: str, payload: Dict[str, Any], timeout: httpx.Timeout) -> httpx.Response:
+    client = get_pool().client_for(endpoint)
+    return await send_streaming(client, client.build_request("POST", endpoint, json=payload, timeout=timeout))
+
+
+async def send_streaming(client: httpx.AsyncClient, request: httpx.Request) -> httpx.Response:
+    """Send ``request`` and return once the upstream's status line and headers arrive."""
+    endpoint = str(request.url)
+    try:
+        response = await client.send(request, stream=True)
     except httpx.RequestError as exc:  # pragma: no cover - network failure path
         logger.error("Gateway failed to reach %s: %s", endpoint, exc)
         raise HTTPException(status_code=502, detail=str(exc)) from exc
+    if response.is_error:
+        body = await response.aread()
+        await response.aclose()
+        status_code = 502 if response.status_code >= 500 or response.status_code == 429 else response.status_code
+        raise HTTPException(status_code=status_code, detail=f"Upstream returned {response.status_code}: {body[:512]!r}")
+    return response
+
+
+async def open_stream_with_fallback(
+    routing: RouteResponse, payload: Dict[str, Any], slots: AsyncExitStack
+) -> Tuple[RouteResponse, httpx.Response, float]:
+    """Open a stream on the first healthy candidate; no hedging once bytes may flow.
+
+    The endpoint's scheduler slot is entered on ``slots`` and stays held until
+    ``RelayResponse`` closes it after the last byte; the returned seconds to first
+    byte are recorded then, once the body is known to have arrived whole.
+    """
+    candidates = route_candidates(routing)
+    next_candidate = replica_picker(candidates)
+    last_error: Optional[HTTPException] = None
+    while (candidate := next_candidate()) is not None:
+        attempt_slot = AsyncExitStack()
+        attempt_slot.enter_context(get_balancer().track(candidate.endpoint))
+        try:
+            await attempt_slot.enter_async_context(get_scheduler().slot(candidate.endpoint))
+        except AdmissionRejected as exc:
+            await attempt_slot.aclose()
+            get_breakers().get(candidate.endpoint).release()
+            raise too_many_requests(exc) from None
+        except BaseException:
+            await attempt_slot.aclose()
+            get_breakers().get(candidate.endpoint).release()
+            raise
+        started = time.perf_counter()
+        try:
+            upstream = await open_stream(
+                candidate.endpoint, candidate_payload(candidate, payload), model_timeout(candidate.model)
+            )
+        except HTTPException as exc:
+            await attempt_slot.aclose()
+            record_outcome(candidate, time.perf_counter() - started, "error" if exc.status_code >= 500 else "client_error")
+            if exc.status_code < 500:
+                raise
+            last_error = exc
+            continue
+        except BaseException:
+            await attempt_slot.aclose()
+            get_breakers().get(candidate.endpoint).release()
+            raise
+        slots.push_async_exit(attempt_slot)
+        return candidate, upstream, time.perf_counter() - started
+    raise last_error or upstreams_unavailable(candidates)
+
+
+class RelayResponse(StreamingResponse):
+    """Stream an upstream body, then release the slot, replica tracking and connection on ``slots``.
+
+    Starlette skips a response's ``background`` task when the body iterator raises
+    or the client disconnects, so the release runs in ``__call__``'s ``finally``,
+    shielded from the cancellation that ends a disconnected response. A body cut
+    off by the upstream is recorded as a failure; for a complete one the upstream
+    histogram gets the time to first byte.
+    """
+
+    def __init__(
+        self,
+        candidate: RouteResponse,
+        upstream: httpx.Response,
+        slots: AsyncExitStack,
+        first_byte_s: float,
+        **kwargs: Any,
+    ) -> None:
+        self.candidate = candidate
+        self.upstream = upstream
+        self.slots = slots
+        self.first_byte_s = first_byte_s
+        self.started = time.perf_counter() - first_byte_s
+        self.outcome = "cancelled"
+        super().__init__(self._relay(), status_code=upstream.status_code, **kwargs)
+
+    async def _relay(self) -> AsyncIterator[bytes]:
+        try:
+            async for chunk in self.upstream.aiter_raw():
+                yield chunk
+        except httpx.HTTPError as exc:
+            self.outcome = "error"
+            logger.warning("Upstream %s failed mid-stream: %s", self.candidate.endpoint, exc)
+            raise
+        self.outcome = "ok"
+
+    async def __call__(self, scope: Any, receive: Any, send: Any) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            with anyio.CancelScope(shield=True):
+                await self.release()
+
+    async def release(self) -> None:
+        candidate = self.candidate
+        if self.outcome == "cancelled":
+            # the client went away (or the response never started): says nothing about the upstream
+            get_breakers().get(candidate.endpoint).release()
+            observe_upstream("gateway", candidate.model, time.perf_counter() - self.started, self.outcome)
+        else:
+            elapsed = self.first_byte_s if self.outcome == "ok" else time.perf_counter() - self.started
+            record_outcome(candidate, elapsed, self.outcome)
+        await self.body_iterator.aclose()  # type: ignore[attr-defined]
+        await self.slots.aclose()
+
+
+def routing_headers(routing: RouteResponse) -> Dict[str, str]:
+    return {
+        "X-FamilyAI-Model": routing.model,
+        "X-FamilyAI-Endpoint": routing.endpoint,
+        "X-FamilyAI-Source": str(routing.metadata.get("source", "static")),
+    }
+
+
+@app.get("/v1/cache", tags=["routing"])
+async def cache_stats() -> Dict[str, Any]:
+    return {"recommendations": get_recommendation_cache().stats(), "responses": get_response_cache().stats()}
+
+
+@app.get("/v1/config", tags=["routing"])
+async def config_stats() -> Dict[str, Any]:
+    return get_routing_config().stats()
+
+
+@app.get("/v1/upstreams", tags=["routing"])
+async def upstream_stats() -> Dict[str, Any]:
+    return {
+        "breakers": get_breakers().stats(),
+        "feedback": get_feedback().stats(),
+        "scheduler": get_scheduler().stats(),
+        "health": get_upstream_health().stats(),
+        "balancer": get_balancer().stats(),
+    }
 
 
 @app.post("/v1/route", response_model=RouteResponse, tags=["routing"])
 async def route(request: RouteRequest) -> RouteResponse:
-    return await resolve_route(request)
+    with get_routing_config().pin():
+        return await resolve_route(request)
 
 
 @app.post("/v1/proxy", tags=["proxy"])
-async def proxy(proxy_request_body: ProxyRequest) -> Dict[str, Any]:
+async def proxy(proxy_request_body: ProxyRequest, request: Request) -> Any:
+    scheduler = get_scheduler()
+    client = scheduler.identify(request.headers, request.client.host if request.client else None)
+    try:
+        scheduler.admit(client)
+    except AdmissionRejected as exc:
+        raise too_many_requests(exc) from None
+    token = current_client.set(client)
+    session = current_session.set(get_balancer().session_key(request.headers, proxy_request_body.payload))
+    try:
+        # one routing snapshot for route resolution, timeouts and fallbacks, even if a reload lands mid-request
+        with get_routing_config().pin():
+            return await proxy_pinned(proxy_request_body)
+    finally:
+        current_session.reset(session)
+        current_client.reset(token)
+
+
+async def proxy_pinned(proxy_request_body: ProxyRequest) -> Any:
     routing = await resolve_route(RouteRequest(**proxy_request_body.model_dump()))
-    async with httpx.AsyncClient() as client:
-        response = await proxy_request(client, routing.endpoint, proxy_request_body.payload)
-    return {
-        "model": routing.model,
-        "endpoint": routing.endpoint,
+    if proxy_request_body.payload.get("stream") is True:
+        # Relay SSE/chunked bytes as they arrive; routing metadata travels in headers
+        slots = AsyncExitStack()
+        routing, upstream, first_byte_s = await open_stream_with_fallback(routing, proxy_request_body.payload, slots)
+        slots.push_async_callback(upstream.aclose)
+        headers = routing_headers(routing)
+        headers["Cache-Control"] = "no-cache"
+        headers["X-Accel-Buffering"] = "no"
+        if "content-encoding" in upstream.headers:
+            headers["Content-Encoding"] = upstream.headers["content-encoding"]
+        return RelayResponse(
+            routing,
+            upstream,
+            slots,
+            first_byte_s,
+            media_type=upstream.headers.get("content-type", "text/event-stream"),
+            headers=headers,
+        )
+    cache = get_response_cache()
+    cache_key = None
+    if cache.eligible(proxy_request_body.payload, proxy_request_body.cache):
+        cache_key = payload_digest(routing.model, proxy_request_body.payload)
+        entry = await cache.get(cache_key)
+        if entry is not None:
+            return {
+                "model": entry["model"],
+                "endpoint": entry["endpoint"],
+                "response": entry["response"],
+                "attempts": [],
+                "cache": {"status": "hit", "key": cache_key, "age_s": round(time.time() - entry["stored_at"], 3)},
+            }
+    chosen, response, attempts = await send_with_fallback(routing, proxy_request_body.payload)
+    body = {
+        "model": chosen.model,
+        "endpoint": chosen.endpoint,
         "response": response.json(),
+        "attempts": attempts,
     }
+    if cache_key is not None:
+        body["cache"] = {"status": "miss", "key": cache_key}
+        # answers from a fallback model are not what the key's model would have said
+        if chosen.model == routing.model:
+            entry = cache.put(cache_key, chosen.model, chosen.endpoint, body["response"])
+            if cache.disk_dir is not None:
+                write = asyncio.create_task(cache.persist(cache_key, entry))
+                _cache_writes.add(write)
+                write.add_done_callback(_cache_writes.discard)
+    return body
+
+
+# query parameters the upload route uses for routing; everything else goes to the upstream
+UPLOAD_ROUTING_PARAMS = ("priority", "complexity", "context_tokens")
+# request headers relayed on uploads; hop-by-hop headers and the client's Host stay behind
+UPLOAD_FORWARD_HEADERS = ("content-type", "content-length", "content-encoding", "accept", "accept-language")
+
+
+def upload_route_request(task: TaskKind, request: Request) -> RouteRequest:
+    """Routing hints from ``?priority=`` style query parameters or ``X-FamilyAI-Priority`` style headers."""
+    hints: Dict[str, Any] = {}
+    for name in UPLOAD_ROUTING_PARAMS:
+        value = request.query_params.get(name) or request.headers.get(f"x-familyai-{name.replace('_', '-')}")
+        if value:
+            hints[name] = value
+    try:
+        return RouteRequest(task=task, **hints)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
+
+
+@app.post("/v1/upload/{task}", tags=["proxy"])
+async def upload(task: TaskKind, request: Request) -> StreamingResponse:
+    """Relay a multipart or binary body to the routed upstream without buffering it.
+
+    Unlike ``/v1/proxy`` the body is neither parsed nor re-encoded: chunks are
+    forwarded as they arrive and the upstream's reply streams back the same way.
+    A consumed body cannot be replayed, so there is no hedging and no fallback
+    once the upstream has been contacted.
+    """
+    scheduler = get_scheduler()
+    client_id = scheduler.identify(request.headers, request.client.host if request.client else None)
+    try:
+        scheduler.admit(client_id)
+    except AdmissionRejected as exc:
+        raise too_many_requests(exc) from None
+    token = current_client.set(client_id)
+    session = current_session.set(get_balancer().session_key(request.headers))
+    try:
+        with get_routing_config().pin():
+            return await upload_pinned(task, request)
+    finally:
+        current_session.reset(session)
+        current_client.reset(token)
+
+
+async def upload_pinned(task: TaskKind, request: Request) -> StreamingResponse:
+    routing = await resolve_route(upload_route_request(task, request))
+    candidates = route_candidates(routing)
+    candidate = replica_picker(candidates)()
+    if candidate is None:
+        raise upstreams_unavailable(candidates)
+
+    slots = AsyncExitStack()
+    slots.enter_context(get_balancer().track(candidate.endpoint))
+    try:
+        await slots.enter_async_context(get_scheduler().slot(candidate.endpoint))
+    except AdmissionRejected as exc:
+        await slots.aclose()
+        get_breakers().get(candidate.endpoint).release()
+        raise too_many_requests(exc) from None
+    except BaseException:
+        await slots.aclose()
+        get_breakers().get(candidate.endpoint).release()
+        raise
+    params = [(key, value) for key, value in request.query_params.multi_items() if key not in UPLOAD_ROUTING_PARAMS]
+    headers = {name: request.headers[name] for name in UPLOAD_FORWARD_HEADERS if name in request.headers}
+    client = get_pool().client_for(candidate.endpoint)
+    upstream_request = client.build_request(
+        "POST",
+        candidate.endpoint,
+        params=params,
+        headers=headers,
+        content=request.stream(),
+        timeout=model_timeout(candidate.model),
+    )
+    started = time.perf_counter()
+    try:
+        upstream = await send_streaming(client, upstream_request)
+    except HTTPException as exc:
+        await slots.aclose()
+        record_outcome(candidate, time.perf_counter() - started, "error" if exc.status_code >= 500 else "client_error")
+        raise
+    except BaseException:
+        await slots.aclose()
+        get_breakers().get(candidate.endpoint).release()
+        raise
+    slots.push_async_callback(upstream.aclose)
+
+    response_headers = routing_headers(candidate)
+    if "content-encoding" in upstream.headers:
+        response_headers["Content-Encoding"] = upstream.headers["content-encoding"]
+    if "content-length" in upstream.headers:
+        response_headers["Content-Length"] = upstream.headers["content-length"]
+    # first byte includes the upload itself: the upstream answers once it has read the body
+    return RelayResponse(
+        candidate,
+        upstream,
+        slots,
+        time.perf_counter() - started,
+        media_type=upstream.headers.get("content-type"),
+        headers=response_headers,
+    )
 
 
 @app.on_event("startup")
 async def warmup() -> None:
-    # Warm up cache and verify config structure
+    # Warm up cache; the first load validates the config structure and fails startup if broken
     config = get_config()
-    required_sections = {"models", "policies"}
-    if not required_sections.issubset(config):
-        raise RuntimeError("Routing configuration missing required sections")
-    # Optionally ping dependent services in the background
-    async with httpx.AsyncClient(timeout=5.0) as client:
-        tasks = []
-        for model in config["models"].values():
-            health_endpoint = model.get("health")
-            if health_endpoint:
-                tasks.append(client.get(health_endpoint))
-        if tasks:
-            await asyncio.gather(*tasks, return_exceptions=True)
+    readiness.set("routing_config", True, f"version {get_routing_config().stats()['version']}")
+    # Upstream health is probed in the background (this also opens the keep-alive pools),
+    # so a slow or dead upstream never holds up startup
+    upstream_health = get_upstream_health()
+    if upstream_health.enabled:
+        _background_tasks.append(
+            asyncio.create_task(upstream_health.run(get_config, lambda url: get_pool().client_for(url)))
+        )
+    _background_tasks.append(asyncio.create_task(get_routing_config().watch(poll_interval())))
+    if CONTROL_PLANE_URL:
+        interval = (config.get("recommendation_cache") or {}).get("version_poll_s", 5.0)
+        _background_tasks.append(asyncio.create_task(poll_catalog_version(float(interval))))
+        if get_feedback().enabled:
+            _background_tasks.append(asyncio.create_task(report_feedback(get_feedback().flush_s)))
+
+
+@app.on_event("shutdown")
+async def shutdown() -> None:
+    global _pool
+    while _background_tasks:
+        _background_tasks.pop().cancel()
+    if _cache_writes:
+        await asyncio.gather(*_cache_writes, return_exceptions=True)
+    if _pool is not None:
+        await _pool.aclose()
+        _pool = None
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Count-based circuit breaker with failure-rate and slow-call thresholds.
+
+    A call slower than ``slow_call_s`` counts as a failure even if it succeeded, so a
+    saturated upstream trips the breaker before callers start timing out.
+    """
+
+    def __init__(
+        self,
+        window: int = 20,
+        min_calls: int = 5,
+        failure_rate: float = 0.5,
+        slow_call_s: float = 30.0,
+        open_s: float = 15.0,
+        half_open_probes: int = 1,
+    ) -> None:
+        self.min_calls = max(1, int(min_calls))
+        self.failure_rate = float(failure_rate)
+        self.slow_call_s = float(slow_call_s)
+        self.open_s = float(open_s)
+        self.half_open_probes = max(1, int(half_open_probes))
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._probes = 0
+        self._outcomes: Deque[bool] = deque(maxlen=max(self.min_calls, int(window)))
+        self._latencies: Deque[float] = deque(maxlen=100)
+
+    def allow(self) -> bool:
+        """Return whether a call may be sent now; half-open probes are reserved here."""
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.open_s:
+                return False
+            self.state = HALF_OPEN
+            self._probes = 0
+        if self.state == HALF_OPEN:
+            if self._probes >= self.half_open_probes:
+                return False
+            self._probes += 1
+        return True
+
+    def retry_after(self) -> float:
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.open_s - (time.monotonic() - self.opened_at))
+
+    def record(self, success: bool, latency_s: float) -> None:
+        if success:
+            self._latencies.append(latency_s)
+        failed = not success or latency_s > self.slow_call_s
+        if self.state == HALF_OPEN:
+            self._probes = max(0, self._probes - 1)
+            if failed:
+                self._trip()
+            else:
+                self.state = CLOSED
+                self._outcomes.clear()
+            return
+        self._outcomes.append(not failed)
+        if len(self._outcomes) >= self.min_calls:
+            failures = self._outcomes.count(False)
+            if failures / len(self._outcomes) >= self.failure_rate:
+                self._trip()
+
+    def release(self) -> None:
+        """Give back a half-open probe slot for a call that was cancelled."""
+        if self.state == HALF_OPEN:
+            self._probes = max(0, self._probes - 1)
+
+    def _trip(self) -> None:
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self._outcomes.clear()
+
+    @property
+    def latency_samples(self) -> int:
+        return len(self._latencies)
+
+    def latency_quantile(self, quantile: float) -> Optional[float]:
+        if not self._latencies:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "recent_calls": len(self._outcomes),
+            "recent_failures": self._outcomes.count(False),
+            "p95_s": self.latency_quantile(0.95),
+            "retry_after_s": round(self.retry_after(), 3),
+        }
+
+
+class BreakerRegistry:
+    """Lazily create one breaker per upstream endpoint from the ``resilience`` config."""
+
+    def __init__(self, settings: Optional[Dict[str, Any]] = None) -> None:
+        settings = settings or {}
+        self.breaker_settings = dict(settings.get("breaker") or {})
+        hedge = settings.get("hedge") or {}
+        self.hedge_enabled = bool(hedge.get("enabled", False))
+        self.hedge_delay_s = hedge.get("delay_s")
+        self.hedge_min_delay_s = float(hedge.get("min_delay_s", 0.25))
+        self.hedge_initial_delay_s = float(hedge.get("initial_delay_s", 2.0))
+        self.hedge_min_samples = int(hedge.get("min_samples", 20))
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, endpoint: str) -> CircuitBreaker:
+        breaker = self._breakers.get(endpoint)
+        if breaker is None:
+            breaker = CircuitBreaker(**self.breaker_settings)
+            self._breakers[endpoint] = breaker
+        return breaker
+
+    def hedge_delay(self, endpoint: str) -> float:
+        """Delay before hedging: fixed if configured, otherwise the endpoint's observed p95."""
+        if self.hedge_delay_s is not None:
+            return float(self.hedge_delay_s)
+        breaker = self.get(endpoint)
+        if breaker.latency_samples < self.hedge_min_samples:
+            return self.hedge_initial_delay_s
+        return max(self.hedge_min_delay_s, breaker.latency_quantile(0.95) or 0.0)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {endpoint: breaker.stats() for endpoint, breaker in self._breakers.items()}
+
+
+async def hedge(
+    primary: Awaitable[T],
+    start_backup: Callable[[], Optional[Awaitable[T]]],
+    delay_s: float,
+) -> T:
+    """Await ``primary``; if it is still running after ``delay_s``, race it against a backup.
+
+    The first attempt to succeed wins and the other is cancelled. If both fail the
+    primary's exception is raised.
+    """
+    first = asyncio.ensure_future(primary)
+    tasks = [first]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay_s)
+        if done:
+            return first.result()
+        backup = start_backup()
+        if backup is None:
+            return await first
+        tasks.append(asyncio.ensure_future(backup))
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+        raise first.exception()  # type: ignore[misc]
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
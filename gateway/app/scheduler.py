@@ -0,0 +1,288 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import heapq
+import hmac
+import itertools
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Dict, List, Mapping, Optional, Tuple
+
+from prometheus_client import Counter, Histogram
+
+QUEUE_WAIT = Histogram(
+    "gateway_queue_wait_seconds",
+    "Time proxied requests waited for an upstream slot.",
+    ["endpoint"],
+    buckets=(0.001, 0.005, 0.025, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+ADMISSION_REJECTIONS = Counter(
+    "gateway_admission_rejections_total",
+    "Proxied requests turned away with 429 by the admission scheduler.",
+    ["reason"],
+)
+
+# client the current request is scheduled for; set by the proxy handler
+current_client: ContextVar[Optional[str]] = ContextVar("gateway_client", default=None)
+
+
+def key_name(key: str) -> str:
+    """Stable label for an API key that does not reveal it in stats."""
+    return "key:" + hashlib.sha256(key.encode("utf-8")).hexdigest()[:10]
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after_s: float, queue_position: Optional[int] = None) -> None:
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after_s = retry_after_s
+        self.queue_position = queue_position
+
+
+class TokenBucket:
+    """Classic token bucket; ``rate_per_s <= 0`` admits everything."""
+
+    def __init__(self, rate_per_s: float, burst: float) -> None:
+        self.rate_per_s = float(rate_per_s)
+        self.burst = max(1.0, float(burst))
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Take one token; returns 0 on success, else the seconds until one is available."""
+        if self.rate_per_s <= 0:
+            return 0.0
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate_per_s)
+        self.updated = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / self.rate_per_s
+
+    def idle(self, now: float) -> bool:
+        """Whether the bucket has refilled to its burst, so dropping it loses nothing."""
+        return self.rate_per_s <= 0 or self.tokens + (now - self.updated) * self.rate_per_s >= self.burst
+
+
+class Lane:
+    """Start-time fair queue in front of one upstream endpoint.
+
+    At most ``max_in_flight`` requests are sent at once. Waiting requests are
+    ordered by a virtual start tag: each client's tag advances by ``1 / weight``
+    per request, so a client with a long backlog only gets its share of the
+    slots while a newcomer is served next, instead of behind the whole backlog.
+    """
+
+    def __init__(self, endpoint: str, max_in_flight: int, max_queue: int, max_wait_s: float) -> None:
+        self.endpoint = endpoint
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.max_queue = max(0, int(max_queue))
+        self.max_wait_s = float(max_wait_s)
+        self.in_flight = 0
+        self.virtual_time = 0.0
+        self.served = 0
+        self.service_s = 1.0
+        self._finish: Dict[str, float] = {}
+        self._queue: List[Tuple[float, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._wait = QUEUE_WAIT.labels(endpoint)
+
+    def _tag(self, client: str, weight: float) -> float:
+        start = max(self.virtual_time, self._finish.get(client, 0.0))
+        self._finish[client] = start + 1.0 / weight
+        return start
+
+    def _waiting(self) -> int:
+        return sum(1 for _, _, future in self._queue if not future.done())
+
+    def retry_after(self, position: int) -> float:
+        """Rough time until ``position`` reaches the front, from the average service time."""
+        return max(1.0, math.ceil(position * self.service_s / self.max_in_flight))
+
+    async def acquire(self, client: str, weight: float) -> float:
+        """Wait for a slot; returns the time spent queued."""
+        waiting = self._waiting()
+        if waiting >= self.max_queue and self.in_flight >= self.max_in_flight:
+            raise AdmissionRejected("queue_full", self.retry_after(waiting + 1), waiting + 1)
+        start = self._tag(client, weight)
+        if self.in_flight < self.max_in_flight and not waiting:
+            self.in_flight += 1
+            self.virtual_time = max(self.virtual_time, start)
+            self._wait.observe(0.0)
+            return 0.0
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (start, next(self._seq), future))
+        queued_at = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.max_wait_s)
+        except asyncio.TimeoutError:
+            if not future.cancel():
+                self.release(0.0)
+            position = 1 + sum(1 for tag, _, other in self._queue if tag < start and not other.done())
+            raise AdmissionRejected("queue_timeout", self.retry_after(position), position) from None
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # the slot was handed over just as the caller went away
+                self.release(0.0)
+            else:
+                future.cancel()
+            raise
+        waited = time.monotonic() - queued_at
+        self._wait.observe(waited)
+        return waited
+
+    def release(self, held_s: float) -> None:
+        self.in_flight -= 1
+        if held_s > 0:
+            self.served += 1
+            self.service_s += 0.2 * (held_s - self.service_s)
+        while self._queue and self.in_flight < self.max_in_flight:
+            start, _, future = heapq.heappop(self._queue)
+            if future.done():
+                continue
+            self.in_flight += 1
+            self.virtual_time = max(self.virtual_time, start)
+            future.set_result(None)
+        if len(self._finish) > 1024:
+            # idle clients have nothing left to catch up on
+            self._finish = {client: tag for client, tag in self._finish.items() if tag > self.virtual_time}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queued": self._waiting(),
+            "served": self.served,
+            "avg_service_s": round(self.service_s, 4),
+        }
+
+
+class AdmissionScheduler:
+    """Per-client rate limits plus weighted fair queuing per upstream endpoint.
+
+    Clients are identified by the first configured header present (an API key
+    by default); keys listed under ``clients`` get a readable name, a weight and
+    their own rate, others are known by a short hash of the key, and requests
+    without any key by their address. A trusted proxy (web-ui) that calls with
+    the ``forwarded_user`` key gets one bucket per forwarded user under its own
+    policy; the user header is ignored with any other key.
+
+    At most ``max_clients`` buckets are kept: idle ones are dropped, and while
+    every tracked client is mid-burst, newcomers share one ``overflow`` bucket
+    instead of each starting with a full one.
+    """
+
+    def __init__(self, settings: Optional[Dict[str, Any]] = None) -> None:
+        settings = settings or {}
+        self.enabled = bool(settings.get("enabled", True))
+        self.client_headers = [header.lower() for header in settings.get("client_headers") or ["x-api-key", "authorization"]]
+        self.defaults = {"weight": 1.0, "rate_per_s": 0.0, "burst": 20, **(settings.get("default_client") or {})}
+        self.clients: Dict[str, Dict[str, Any]] = {}
+        for key, policy in (settings.get("clients") or {}).items():
+            self.clients[key] = {**self.defaults, "name": key_name(key), **(policy or {})}
+        self._named = {policy["name"]: policy for policy in self.clients.values()}
+        self.max_in_flight = int(settings.get("max_in_flight", 32))
+        self.max_queue = int(settings.get("max_queue", 256))
+        self.max_wait_s = float(settings.get("max_wait_s", 30.0))
+        self.endpoints: Dict[str, Dict[str, Any]] = dict(settings.get("endpoints") or {})
+        forwarded = settings.get("forwarded_user") or {}
+        self.user_header = str(forwarded.get("header", "")).lower()
+        self.user_key = os.getenv(forwarded["key_env"], "") if forwarded.get("key_env") else ""
+        self.max_clients = max(1, int(settings.get("max_clients", 4096)))
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._pruned_at = 0.0
+        self._lanes: Dict[str, Lane] = {}
+
+    def _forwards_users(self, key: str) -> bool:
+        if not (self.user_header and self.user_key):
+            return False
+        sent = key.encode("utf-8")
+        trusted = (self.user_key, f"Bearer {self.user_key}")
+        return any(hmac.compare_digest(sent, candidate.encode("utf-8")) for candidate in trusted)
+
+    def identify(self, headers: Mapping[str, str], address: Optional[str]) -> str:
+        for header in self.client_headers:
+            key = headers.get(header)
+            if key:
+                policy = self.clients.get(key)
+                name = policy["name"] if policy is not None else key_name(key)
+                user = headers.get(self.user_header) if self.user_header else None
+                if user and self._forwards_users(key):
+                    return f"{name}/user:{hashlib.sha256(user.encode('utf-8')).hexdigest()[:10]}"
+                return name
+        return f"addr:{address or 'unknown'}"
+
+    def _policy(self, client: str) -> Dict[str, Any]:
+        # forwarded users ("<proxy>/user:<hash>") share their proxy's policy
+        return self._named.get(client.split("/", 1)[0], self.defaults)
+
+    def _bucket(self, client: str) -> TokenBucket:
+        bucket = self._buckets.get(client)
+        if bucket is not None:
+            return bucket
+        if len(self._buckets) >= self.max_clients:
+            now = time.monotonic()
+            if now - self._pruned_at >= 1.0:
+                self._pruned_at = now
+                self._buckets = {name: kept for name, kept in self._buckets.items() if not kept.idle(now)}
+            if len(self._buckets) >= self.max_clients:
+                client = "overflow"
+                bucket = self._buckets.get(client)
+                if bucket is not None:
+                    return bucket
+        policy = self._policy(client)
+        bucket = self._buckets[client] = TokenBucket(policy["rate_per_s"], policy["burst"])
+        return bucket
+
+    def admit(self, client: str) -> None:
+        """Charge the client's token bucket, raising ``AdmissionRejected`` when it is empty."""
+        if not self.enabled:
+            return
+        wait_s = self._bucket(client).take()
+        if wait_s > 0:
+            ADMISSION_REJECTIONS.labels("rate_limited").inc()
+            raise AdmissionRejected("rate_limited", wait_s)
+
+    def lane(self, endpoint: str) -> Lane:
+        lane = self._lanes.get(endpoint)
+        if lane is None:
+            overrides = self.endpoints.get(endpoint) or {}
+            lane = self._lanes[endpoint] = Lane(
+                endpoint,
+                overrides.get("max_in_flight", self.max_in_flight),
+                overrides.get("max_queue", self.max_queue),
+                overrides.get("max_wait_s", self.max_wait_s),
+            )
+        return lane
+
+    @asynccontextmanager
+    async def slot(self, endpoint: str) -> AsyncIterator[None]:
+        """Hold one of ``endpoint``'s in-flight slots for the current client."""
+        if not self.enabled:
+            yield
+            return
+        client = current_client.get() or "anonymous"
+        lane = self.lane(endpoint)
+        try:
+            await lane.acquire(client, float(self._policy(client)["weight"]))
+        except AdmissionRejected as exc:
+            ADMISSION_REJECTIONS.labels(exc.reason).inc()
+            raise
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            lane.release(time.monotonic() - started)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "clients": sorted(self._buckets),
+            "endpoints": {endpoint: lane.stats() for endpoint, lane in self._lanes.items()},
+        }
+
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+from typing import Any, Dict, Optional
+
+# Characters per token measured on Qwen-family tokenizers; ASCII covers English prose
+# and code, "other" is dominated by CJK where one character is roughly one token.
+DEFAULT_FAMILY = {"ascii_chars_per_token": 3.5, "other_chars_per_token": 1.3, "message_overhead": 4}
+# longer non-ASCII strings are measured on evenly spaced samples instead of a full encode
+SAMPLE_ABOVE_CHARS = 32_768
+SAMPLE_WINDOWS = 32
+SAMPLE_WINDOW_CHARS = 512
+
+
+class TokenEstimator:
+    """Calibrated characters-per-token estimate of a prompt's size for one tokenizer family.
+
+    Pure-ASCII strings are measured in O(1) (CPython stores the flag and the
+    length); for other strings the share of multi-byte characters is derived from
+    a UTF-8 encode of the text, or of evenly spaced samples of it when it is long.
+    There is no tokenizer to load, so a 100K-token prompt is estimated in well
+    under a millisecond.
+    """
+
+    def __init__(
+        self,
+        ascii_chars_per_token: float = DEFAULT_FAMILY["ascii_chars_per_token"],
+        other_chars_per_token: float = DEFAULT_FAMILY["other_chars_per_token"],
+        message_overhead: int = DEFAULT_FAMILY["message_overhead"],
+    ) -> None:
+        self.ascii_chars_per_token = float(ascii_chars_per_token)
+        self.other_chars_per_token = float(other_chars_per_token)
+        self.message_overhead = int(message_overhead)
+
+    @classmethod
+    def for_family(cls, settings: Optional[Dict[str, Any]], family: Optional[str] = None) -> "TokenEstimator":
+        """Build from the ``token_estimation`` section of ``routing.yaml``."""
+        settings = settings or {}
+        families = settings.get("families") or {}
+        family = family or settings.get("default_family")
+        return cls(**{**DEFAULT_FAMILY, **(families.get(family) or {})})
+
+    def text_tokens(self, text: str) -> float:
+        length = len(text)
+        if text.isascii():
+            return length / self.ascii_chars_per_token
+        if length > SAMPLE_ABOVE_CHARS:
+            step = length // SAMPLE_WINDOWS
+            sample = "".join(text[start : start + SAMPLE_WINDOW_CHARS] for start in range(0, length, step))
+        else:
+            sample = text
+        # CJK characters take three UTF-8 bytes; accented Latin and Cyrillic take two
+        extra = len(sample.encode("utf-8", "surrogatepass")) - len(sample)
+        other = min(length, max(1, extra * length // (2 * len(sample))))
+        return (length - other) / self.ascii_chars_per_token + other / self.other_chars_per_token
+
+    def estimate(self, payload: Dict[str, Any]) -> Optional[int]:
+        """Prompt tokens plus the requested completion budget, or ``None`` without any text."""
+        messages = payload.get("messages")
+        prompt = payload.get("prompt")
+        if not messages and not prompt:
+            return None
+        tokens = 0.0
+        if isinstance(messages, list):
+            tokens += self.message_overhead * len(messages)
+            for message in messages:
+                content = message.get("content") if isinstance(message, dict) else None
+                if isinstance(content, str):
+                    tokens += self.text_tokens(content)
+                elif isinstance(content, list):
+                    # OpenAI-style content parts; images and audio are not counted
+                    for part in content:
+                        if isinstance(part, dict) and isinstance(part.get("text"), str):
+                            tokens += self.text_tokens(part["text"])
+        if isinstance(prompt, str):
+            tokens += self.text_tokens(prompt)
+        elif isinstance(prompt, list):
+            tokens += sum(self.text_tokens(part) for part in prompt if isinstance(part, str))
+        max_tokens = payload.get("max_tokens") or payload.get("max_completion_tokens")
+        if isinstance(max_tokens, int) and max_tokens > 0:
+            tokens += max_tokens
+        return int(tokens) + 1
+
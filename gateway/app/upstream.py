@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import logging
+from typing import Any, Dict, Mapping, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = {"connect": 2.0, "read": 120.0, "write": 30.0, "pool": 5.0}
+DEFAULT_LIMITS = {"max_connections": 32, "max_keepalive_connections": 16, "keepalive_expiry": 30.0}
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def upstream_key(url: str) -> str:
+    """Return the scheme://host:port origin that owns the connection pool for ``url``."""
+    parts = urlsplit(url)
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    return f"{parts.scheme}://{parts.hostname}:{port}"
+
+
+def build_timeout(*overrides: Any) -> httpx.Timeout:
+    """Merge timeout settings; each override may be a number (read timeout) or a mapping."""
+    values = dict(DEFAULT_TIMEOUT)
+    for override in overrides:
+        if override is None:
+            continue
+        if isinstance(override, (int, float)):
+            values["read"] = float(override)
+        elif isinstance(override, Mapping):
+            values.update({key: float(value) for key, value in override.items() if key in values})
+    return httpx.Timeout(**values)
+
+
+class UpstreamPool:
+    """Keep one keep-alive ``httpx.AsyncClient`` per upstream origin.
+
+    The gateway talks to a handful of origins (vLLM, whisper, piper, vision and the
+    control plane); sharing a client per origin gives each one its own connection
+    limit while avoiding a TCP handshake per request.
+    """
+
+    def __init__(self, settings: Optional[Dict[str, Any]] = None) -> None:
+        settings = settings or {}
+        self.timeout = build_timeout(settings.get("timeout"))
+        self.limits = {**DEFAULT_LIMITS, **{k: v for k, v in settings.items() if k in DEFAULT_LIMITS}}
+        self.per_upstream: Dict[str, Dict[str, Any]] = dict(settings.get("upstreams") or {})
+        self.http2 = bool(settings.get("http2", False))
+        if self.http2 and not _http2_available():
+            logger.warning("http2 requested but the 'h2' package is not installed; using HTTP/1.1")
+            self.http2 = False
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    def _limits_for(self, key: str) -> httpx.Limits:
+        host = key.split("://", 1)[-1]
+        overrides = self.per_upstream.get(key) or self.per_upstream.get(host) or {}
+        values = {**self.limits, **{k: v for k, v in overrides.items() if k in DEFAULT_LIMITS}}
+        return httpx.Limits(**values)
+
+    def client_for(self, url: str) -> httpx.AsyncClient:
+        key = upstream_key(url)
+        client = self._clients.get(key)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                limits=self._limits_for(key),
+                timeout=self.timeout,
+                http2=self.http2,
+            )
+            self._clients[key] = client
+        return client
+
+    async def aclose(self) -> None:
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
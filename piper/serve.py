@@ -1,66 +1,493 @@
 from __future__ import annotations
 
+import asyncio
 import base64
-import io
+import hashlib
+import json
 import os
-from typing import Dict
+import re
+import struct
+import threading
+import time
+import wave
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
 
 import numpy as np
-import soundfile
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from prometheus_client import Counter, Gauge, Histogram
+
+from familyai_common.metrics import install as install_metrics
+from familyai_common.offload import OffloadPool
+from familyai_common.readiness import READY, Readiness
+from familyai_common.readiness import install as install_readiness
 
 try:  # pragma: no cover - requires GPU runtime
     from piper import PiperVoice
-    from piper.voice import load_voice
 except Exception:  # pragma: no cover - fallback path for tests
     PiperVoice = None
-    load_voice = None
+
+VOICES_DIR = os.getenv("VOICES_DIR", "/voices")
+DEFAULT_VOICE = os.getenv("VOICE", "en_US-amy-low")
+VOICE_MODEL = os.getenv("VOICE_MODEL", "")  # explicit paths for the default voice
+VOICE_CONFIG = os.getenv("VOICE_CONFIG", "")
+VOICE_POOL_MB = float(os.getenv("VOICE_POOL_MB", "512"))
+VOICE_PRELOAD = [voice for voice in os.getenv("VOICE_PRELOAD", "").split(",") if voice.strip()]
+VOICE_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-][A-Za-z0-9_.-]*$")
+FALLBACK_SAMPLE_RATE = 22050
+PHRASE_CACHE_MB = float(os.getenv("PHRASE_CACHE_MB", "64"))
+PHRASE_CACHE_DIR = os.getenv("PHRASE_CACHE_DIR", "")
+PHRASE_CACHE_DISK_MB = float(os.getenv("PHRASE_CACHE_DISK_MB", "512"))
+SYNTHESIS_OPTIONS = ("speaker_id", "length_scale", "noise_scale", "noise_w", "sentence_silence")
+MEDIA_TYPES = {"wav": "audio/wav", "pcm": "audio/L16"}
+
+CACHE_LOOKUPS = Counter("piper_phrase_cache_lookups_total", "Phrase cache lookups by outcome.", ["result"])
+VOICE_LOOKUPS = Counter("piper_voice_lookups_total", "Voice pool lookups by outcome.", ["voice", "result"])
+VOICE_LOAD_SECONDS = Histogram(
+    "piper_voice_load_seconds", "Time to load a voice model.", ["voice"], buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+VOICE_POOL_BYTES = Gauge("piper_voice_pool_bytes", "Estimated memory held by resident voices.")
 
 app = FastAPI(title="FamilyAI Piper Service", version="0.1.0")
+install_metrics(app, "piper")
+offload = OffloadPool.from_env("piper", max_workers=2, max_queue=16)
+
+
+class VoiceConfig(NamedTuple):
+    model_path: Path
+    sample_rate: int
+    fingerprint: str  # voice id + config digest, so cached audio never outlives a voice swap
+
+
+class VoiceStats:
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.load_seconds = 0.0
+        self.last_load_s: Optional[float] = None
+
+
+def load_piper_voice(model_path: Path, config_path: Path) -> Any:
+    return PiperVoice.load(model_path, config_path=config_path)
+
+
+class VoicePool:
+    """Voices loaded on first use and kept in an LRU bounded by their ONNX size.
+
+    ``<voices_dir>/<id>.onnx`` with its ``.onnx.json`` config defines voice ``id``.
+    Loads run on the calling (offload) thread; a per-voice lock makes concurrent
+    first requests for the same voice share one load.
+    """
+
+    def __init__(
+        self,
+        voices_dir: str,
+        max_bytes: int,
+        default_voice: str,
+        loader: Callable[[Path, Path], Any] = load_piper_voice,
+        default_paths: Tuple[str, str] = ("", ""),
+    ) -> None:
+        self.voices_dir = Path(voices_dir)
+        self.max_bytes = max_bytes
+        self.default_voice = default_voice
+        self.loader = loader
+        self.default_paths = default_paths
+        self.bytes = 0
+        self._voices: "OrderedDict[str, Tuple[Any, int]]" = OrderedDict()
+        self._configs: Dict[str, Tuple[float, VoiceConfig]] = {}
+        self._stats: Dict[str, VoiceStats] = {}
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+
+    def paths(self, voice_id: str) -> Optional[Tuple[Path, Path]]:
+        if voice_id == self.default_voice and self.default_paths[0]:
+            model, config = (Path(path) for path in self.default_paths)
+        elif VOICE_ID_PATTERN.match(voice_id):
+            model = self.voices_dir / f"{voice_id}.onnx"
+            config = self.voices_dir / f"{voice_id}.onnx.json"
+        else:
+            return None
+        return (model, config) if model.exists() and config.exists() else None
+
+    def config(self, voice_id: str) -> Optional[VoiceConfig]:
+        """Sample rate and fingerprint from the JSON config, without loading the model."""
+        paths = self.paths(voice_id)
+        if paths is None:
+            return None
+        model, config_path = paths
+        mtime = config_path.stat().st_mtime
+        cached = self._configs.get(voice_id)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        raw = config_path.read_bytes()
+        rate = int(json.loads(raw).get("audio", {}).get("sample_rate", FALLBACK_SAMPLE_RATE))
+        entry = VoiceConfig(model, rate, f"{voice_id}:{hashlib.sha256(raw).hexdigest()[:16]}")
+        self._configs[voice_id] = (mtime, entry)
+        return entry
+
+    def available(self) -> List[str]:
+        found = {path.name[: -len(".onnx.json")] for path in self.voices_dir.glob("*.onnx.json")}
+        voices = {voice for voice in found if (self.voices_dir / f"{voice}.onnx").exists()}
+        if self.paths(self.default_voice) is not None:
+            voices.add(self.default_voice)
+        return sorted(voices)
+
+    def get(self, voice_id: str) -> Optional[Any]:
+        with self._lock:
+            stats = self._stats.setdefault(voice_id, VoiceStats())
+            entry = self._voices.get(voice_id)
+            if entry is not None:
+                self._voices.move_to_end(voice_id)
+                stats.hits += 1
+                VOICE_LOOKUPS.labels(voice_id, "hit").inc()
+                return entry[0]
+            stats.misses += 1
+            VOICE_LOOKUPS.labels(voice_id, "miss").inc()
+            load_lock = self._load_locks.setdefault(voice_id, threading.Lock())
+        with load_lock:
+            with self._lock:
+                entry = self._voices.get(voice_id)
+            if entry is not None:  # loaded by a concurrent request while we waited
+                return entry[0]
+            paths = self.paths(voice_id)
+            if paths is None:
+                return None
+            started = time.perf_counter()
+            voice = self.loader(*paths)
+            elapsed = time.perf_counter() - started
+            VOICE_LOAD_SECONDS.labels(voice_id).observe(elapsed)
+            with self._lock:
+                stats.loads += 1
+                stats.load_seconds += elapsed
+                stats.last_load_s = elapsed
+                self._insert(voice_id, voice, paths[0].stat().st_size)
+            return voice
 
-_voice: PiperVoice | None = None
+    def _insert(self, voice_id: str, voice: Any, size: int) -> None:
+        self._voices[voice_id] = (voice, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes and len(self._voices) > 1:
+            _, (_, evicted_size) = self._voices.popitem(last=False)
+            self.bytes -= evicted_size
+        VOICE_POOL_BYTES.set(self.bytes)
 
+    def preload(self, voice_ids: List[str]) -> None:
+        for voice_id in voice_ids:
+            self.get(voice_id.strip())
 
-def get_voice() -> PiperVoice | None:
-    global _voice
-    if _voice is not None:
-        return _voice
-    if PiperVoice is None or load_voice is None:
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            voices = {}
+            for voice_id, stats in self._stats.items():
+                lookups = stats.hits + stats.misses
+                voices[voice_id] = {
+                    "resident": voice_id in self._voices,
+                    "bytes": self._voices[voice_id][1] if voice_id in self._voices else 0,
+                    "hits": stats.hits,
+                    "misses": stats.misses,
+                    "hit_rate": round(stats.hits / lookups, 4) if lookups else 0.0,
+                    "loads": stats.loads,
+                    "last_load_s": round(stats.last_load_s, 4) if stats.last_load_s is not None else None,
+                    "avg_load_s": round(stats.load_seconds / stats.loads, 4) if stats.loads else None,
+                }
+            return {"bytes": self.bytes, "max_bytes": self.max_bytes, "resident": list(self._voices), "voices": voices}
+
+
+voice_pool = VoicePool(VOICES_DIR, int(VOICE_POOL_MB * 1024 * 1024), DEFAULT_VOICE, default_paths=(VOICE_MODEL, VOICE_CONFIG))
+
+
+def resolve_voice(voice_id: str) -> Optional[VoiceConfig]:
+    """Config of a known voice; ``None`` means the sine fallback. Unknown explicit voices are a 404."""
+    if PiperVoice is None:
         return None
-    voice_path = os.getenv("VOICE_MODEL", "/voices/en_US-amy-low.onnx")
-    config_path = os.getenv("VOICE_CONFIG", "/voices/en_US-amy-low.onnx.json")
-    if not os.path.exists(voice_path) or not os.path.exists(config_path):
+    config = voice_pool.config(voice_id)
+    if config is None and voice_id != DEFAULT_VOICE:
+        raise HTTPException(status_code=404, detail=f"Unknown voice '{voice_id}'")
+    return config
+
+
+def get_voice(voice_id: str = DEFAULT_VOICE) -> Any:
+    if PiperVoice is None:
         return None
-    _voice = load_voice(voice_path, config_path)
-    return _voice
+    return voice_pool.get(voice_id)
+
+
+SINE_FALLBACK = "no Piper voice; speaking with the sine fallback"
+
 
+def load_voices() -> Optional[str]:
+    """Load the default voice and ``VOICE_PRELOAD`` in the background after startup."""
+    if PiperVoice is None:
+        return SINE_FALLBACK
+    default = get_voice()
+    voice_pool.preload(VOICE_PRELOAD)
+    return None if default is not None else SINE_FALLBACK
 
-def synthesize_with_fallback(text: str) -> bytes:
-    voice = get_voice()
+
+readiness = Readiness("piper")
+readiness.load("voices", load_voices, retry_s=float(os.getenv("VOICE_LOAD_RETRY_S", "30")))
+install_readiness(app, readiness)
+
+
+def split_sentences(text: str) -> List[str]:
+    return [sentence for sentence in re.split(r"(?<=[.!?])\s+", text.strip()) if sentence]
+
+
+def synthesize_chunks(text: str, options: Dict[str, Any], voice_id: str = DEFAULT_VOICE) -> Iterator[bytes]:
+    """Yield 16-bit mono PCM one sentence at a time."""
+    voice = get_voice(voice_id)
     if voice is not None:
-        audio = voice.synthesize(text)
-        return audio
-    # Fallback: generate simple sine wave stub so downstream systems keep working
-    duration = max(1.0, min(len(text) / 12.0, 5.0))
-    sample_rate = 22050
-    t = np.linspace(0, duration, int(sample_rate * duration), False)
-    tone = 0.1 * np.sin(2 * np.pi * 220 * t)
-    buffer = io.BytesIO()
-    soundfile.write(buffer, tone, sample_rate, format="WAV")
-    return buffer.getvalue()
+        yield from voice.synthesize_stream_raw(text, **options)
+        return
+    # Fallback: a short sine tone per sentence so downstream systems keep working
+    for sentence in split_sentences(text):
+        duration = max(0.5, min(len(sentence) / 12.0, 5.0))
+        t = np.linspace(0, duration, int(FALLBACK_SAMPLE_RATE * duration), False)
+        yield (0.1 * np.sin(2 * np.pi * 220 * t) * 32767).astype("<i2").tobytes()
+
+
+def wav_header(rate: int, data_bytes: Optional[int] = None) -> bytes:
+    """RIFF header for 16-bit mono PCM; an unknown length uses the streaming 0xFFFFFFFF sizes."""
+    data_size = 0xFFFFFFFF if data_bytes is None else data_bytes
+    riff_size = 0xFFFFFFFF if data_bytes is None else 36 + data_bytes
+    return (
+        b"RIFF" + struct.pack("<I", riff_size) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, 1, rate, rate * 2, 2, 16)
+        + b"data" + struct.pack("<I", data_size)
+    )
+
+
+class PhraseCache:
+    """Content-addressed LRU of synthesized PCM, bounded by bytes.
+
+    Entries evicted from memory spill to ``disk_dir`` as WAV files (bounded by
+    ``disk_max_bytes``, oldest first) and are promoted back on the next hit. The
+    in-memory LRU is only touched on the event loop; disk reads, writes and the
+    spill directory scan run in the default executor.
+    """
+
+    def __init__(self, max_bytes: int, disk_dir: str = "", disk_max_bytes: int = 0) -> None:
+        self.max_bytes = max_bytes
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.disk_max_bytes = disk_max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[int, bytes]]" = OrderedDict()
+        self._disk_lock = threading.Lock()
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(text: str, voice: str, options: Dict[str, Any]) -> str:
+        canonical = json.dumps({"text": text, "voice": voice, "options": options}, sort_keys=True)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[Tuple[int, bytes]]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            CACHE_LOOKUPS.labels("memory").inc()
+            return entry
+        if self.disk_dir is not None:
+            entry = await asyncio.get_running_loop().run_in_executor(None, self._read_disk, key)
+        if entry is not None:
+            self.disk_hits += 1
+            CACHE_LOOKUPS.labels("disk").inc()
+            await self.put(key, *entry)
+            return entry
+        self.misses += 1
+        CACHE_LOOKUPS.labels("miss").inc()
+        return None
+
+    async def put(self, key: str, rate: int, pcm: bytes) -> None:
+        spilled = self._remember(key, rate, pcm)
+        if spilled and self.disk_dir is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self._spill, spilled)
+
+    def _remember(self, key: str, rate: int, pcm: bytes) -> List[Tuple[str, int, bytes]]:
+        """Insert into the memory LRU; returns the entries that no longer fit there."""
+        if len(pcm) > self.max_bytes:
+            return [(key, rate, pcm)]
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.bytes -= len(previous[1])
+        self._entries[key] = (rate, pcm)
+        self.bytes += len(pcm)
+        spilled = []
+        while self.bytes > self.max_bytes:
+            evicted_key, (evicted_rate, evicted_pcm) = self._entries.popitem(last=False)
+            self.bytes -= len(evicted_pcm)
+            spilled.append((evicted_key, evicted_rate, evicted_pcm))
+        return spilled
+
+    def _path(self, key: str) -> Optional[Path]:
+        return self.disk_dir / f"{key}.wav" if self.disk_dir is not None else None
+
+    def _read_disk(self, key: str) -> Optional[Tuple[int, bytes]]:
+        path = self._path(key)
+        if path is None or not path.exists():
+            return None
+        try:
+            with wave.open(str(path), "rb") as wav_file:
+                entry = wav_file.getframerate(), wav_file.readframes(wav_file.getnframes())
+            os.utime(path)  # disk eviction is oldest-first by mtime
+            return entry
+        except (OSError, EOFError, wave.Error):
+            return None
+
+    def _spill(self, entries: List[Tuple[str, int, bytes]]) -> None:
+        # executor threads: one spill at a time, so the trim sees a settled directory
+        with self._disk_lock:
+            written = [self._write_disk(key, rate, pcm) for key, rate, pcm in entries]
+            if any(written):
+                self._trim_disk()
+
+    def _write_disk(self, key: str, rate: int, pcm: bytes) -> bool:
+        path = self._path(key)
+        if path is None or len(pcm) > self.disk_max_bytes or path.exists():
+            return False
+        partial = path.with_suffix(".tmp")
+        partial.write_bytes(wav_header(rate, len(pcm)) + pcm)
+        partial.replace(path)
+        return True
+
+    def _trim_disk(self) -> None:
+        files = sorted((item.stat().st_mtime, item.stat().st_size, item) for item in self.disk_dir.glob("*.wav"))
+        total = sum(size for _, size, _ in files)
+        for _, size, stale in files:
+            if total <= self.disk_max_bytes:
+                break
+            total -= size
+            stale.unlink(missing_ok=True)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            "disk_dir": str(self.disk_dir) if self.disk_dir is not None else None,
+        }
+
+
+phrase_cache = PhraseCache(int(PHRASE_CACHE_MB * 1024 * 1024), PHRASE_CACHE_DIR, int(PHRASE_CACHE_DISK_MB * 1024 * 1024))
+
+
+def synthesize_with_fallback(text: str, options: Optional[Dict[str, Any]] = None, voice_id: str = DEFAULT_VOICE) -> bytes:
+    return b"".join(synthesize_chunks(text, options or {}, voice_id))
+
+
+def encode(fmt: str, rate: int, pcm: bytes) -> bytes:
+    return wav_header(rate, len(pcm)) + pcm if fmt == "wav" else pcm
+
+
+async def stream_speech(
+    text: str, options: Dict[str, Any], voice_id: str, rate: int, fmt: str, key: str
+) -> StreamingResponse:
+    """Synthesize on the offload pool and forward each sentence as soon as it is ready."""
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    stop = threading.Event()
+
+    def produce() -> None:
+        try:
+            for chunk in synthesize_chunks(text, options, voice_id):
+                if stop.is_set():
+                    return
+                loop.call_soon_threadsafe(queue.put_nowait, chunk)
+        except Exception as exc:  # forwarded to the response body
+            loop.call_soon_threadsafe(queue.put_nowait, exc)
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, None)
+
+    job = offload.submit(produce)  # raises 429 before any byte is sent
+
+    async def body() -> Any:
+        chunks = []
+        try:
+            if fmt == "wav":
+                yield wav_header(rate)
+            while True:
+                chunk = await queue.get()
+                if chunk is None:
+                    break
+                if isinstance(chunk, Exception):
+                    raise chunk
+                chunks.append(chunk)
+                yield chunk
+            await phrase_cache.put(key, rate, b"".join(chunks))
+        finally:
+            stop.set()
+            job.cancel()
+
+    return StreamingResponse(body(), media_type=MEDIA_TYPES[fmt], headers={"X-Sample-Rate": str(rate), "X-Cache": "miss"})
 
 
 @app.get("/health", tags=["health"])
-def health() -> Dict[str, str]:
-    status = "ok" if get_voice() is not None else "degraded"
-    return {"status": status}
+async def health() -> Dict[str, str]:
+    # liveness only: reports the voice load without waiting for it
+    state = readiness.state("voices")
+    if state is None or state.status != READY:
+        return {"status": state.status if state is not None else "starting"}
+    return {"status": "degraded" if state.detail == SINE_FALLBACK else "ok"}
+
+
+@app.get("/v1/cache", tags=["tts"])
+def cache_stats() -> Dict[str, Any]:
+    return phrase_cache.stats()
+
+
+@app.get("/v1/voices", tags=["tts"])
+def list_voices() -> Dict[str, Any]:
+    return {"default": DEFAULT_VOICE, "available": voice_pool.available(), "pool": voice_pool.stats()}
 
 
 @app.post("/v1/speak", tags=["tts"])
-def speak(request: Dict[str, str]) -> Dict[str, str]:
-    text = request.get("text")
+async def speak(body: Dict[str, Any], request: Request) -> Any:
+    """Synthesize ``text``.
+
+    ``voice`` picks a voice id (default ``VOICE``). By default the WAV is returned
+    base64-encoded in JSON. With ``"stream": true`` the raw audio (``format``:
+    ``wav`` or ``pcm``) is streamed sentence by sentence.
+    """
+    text = body.get("text")
     if not text:
         raise HTTPException(status_code=400, detail="'text' field is required")
-    audio_bytes = synthesize_with_fallback(text)
-    payload = base64.b64encode(audio_bytes).decode("utf-8")
-    return {"audio_base64": payload, "mime_type": "audio/wav"}
+    fmt = body.get("format", "wav")
+    if fmt not in MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"'format' must be one of {sorted(MEDIA_TYPES)}")
+    options = {name: body[name] for name in SYNTHESIS_OPTIONS if body.get(name) is not None}
+    voice_id = str(body.get("voice") or DEFAULT_VOICE)
+    voice = resolve_voice(voice_id)
+    rate = voice.sample_rate if voice is not None else FALLBACK_SAMPLE_RATE
+    key = PhraseCache.key(text, voice.fingerprint if voice is not None else "fallback", options)
+    cached = await phrase_cache.get(key)
+    stream = bool(body.get("stream"))
+
+    if cached is None and stream:
+        return await stream_speech(text, options, voice_id, rate, fmt, key)
+    if cached is None:
+        pcm = await offload.run(synthesize_with_fallback, text, options, voice_id, request=request)
+        await phrase_cache.put(key, rate, pcm)
+    else:
+        rate, pcm = cached
+    if stream:
+        headers = {"X-Sample-Rate": str(rate), "X-Cache": "hit"}
+        return StreamingResponse(iter([encode(fmt, rate, pcm)]), media_type=MEDIA_TYPES[fmt], headers=headers)
+    payload = base64.b64encode(encode("wav", rate, pcm)).decode("utf-8")
+    return {"audio_base64": payload, "mime_type": "audio/wav", "cached": cached is not None}
+
+
+@app.on_event("shutdown")
+def stop_offload() -> None:
+    offload.shutdown()
@@ -2,15 +2,15 @@
 set -euo pipefail
 
 EXTERNAL_URLS=(
-  "${GATEWAY_HEALTH_URL:-http://localhost:8080/health}"
-  "${CONTROL_PLANE_HEALTH_URL:-http://localhost:9000/health}"
+  "${GATEWAY_HEALTH_URL:-http://localhost:8080/health/ready}"
+  "${CONTROL_PLANE_HEALTH_URL:-http://localhost:9000/health/ready}"
 )
 
 INTERNAL_ENDPOINTS=(
   "http://vllm:8000/health"
-  "http://vision:8300/health"
-  "http://whisper:8500/health"
-  "http://piper:8600/health"
+  "http://vision:8300/health/ready"
+  "http://whisper:8500/health/ready"
+  "http://piper:8600/health/ready"
 )
 
 echo "== External endpoints =="
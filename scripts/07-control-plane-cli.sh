@@ -14,6 +14,7 @@ Commands:
   recommend <task>      Ask for recommendation (optional flags: --context N --priority MODE --allow-cloud [true|false])
   activate <profile>    Activate routing profile
   download <model_id>   Queue a model download job
+  downloads             Show download job progress
 USAGE
 }
 
@@ -79,6 +80,9 @@ case "$CMD" in
       -H "Content-Type: application/json" \
       -d "{\"model_id\": \"$MODEL\"}" | jq .
     ;;
+  downloads)
+    curl -fsS "$BASE_URL/downloads" | jq .
+    ;;
   help|*)
     usage
     ;;
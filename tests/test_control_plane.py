@@ -21,7 +21,7 @@ def setup_function(_function):
     state_path = ROOT / "control-plane" / "config" / "state.json"
     if state_path.exists():
         state_path.unlink()
-    module.get_config.cache_clear()  # type: ignore
+    module.reset_config()  # type: ignore
 
 
 def test_list_models_contains_ids():
@@ -56,3 +56,326 @@ def test_activate_profile_updates_state():
     # state file should reflect change
     state_path = Path(__file__).resolve().parents[1] / "control-plane" / "config" / "state.json"
     assert json.loads(state_path.read_text())["active_profile"] == "default"
+
+
+def test_recommend_reports_catalog_version():
+    version = client.get("/version")
+    assert version.status_code == 200
+    etag = version.headers["etag"]
+    assert etag == f'"{version.json()["version"]}"'
+    body = {"task": "chat", "context_tokens": 1024, "priority": "balanced", "allow_cloud": True}
+    assert client.post("/recommend", json=body).headers["etag"] == etag
+
+
+def test_recommend_batch_scores_each_request():
+    body = {
+        "requests": [
+            {"task": "chat", "context_tokens": 1024, "priority": "speed", "allow_cloud": False},
+            {"task": "code", "context_tokens": 100_000, "priority": "quality"},
+            {"task": "code", "context_tokens": 10_000_000},
+            {"task": "unknown"},
+        ]
+    }
+    response = client.post("/recommend/batch", json=body)
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert results[0]["recommendation"]["model"]["id"] == "qwen3_4b_local"
+    assert results[1]["recommendation"]["model"]["id"] == "qwen3_coder_30b_a3b_local"
+    assert results[2]["status"] == 503
+    assert results[3]["status"] == 404
+
+
+def test_catalog_index_respects_context_and_cloud_filters():
+    catalog = module.get_catalog()  # type: ignore
+    assert catalog is module.get_catalog()  # type: ignore
+    request = module.RecommendationRequest(task="chat", context_tokens=16_384, priority="quality", allow_cloud=False)  # type: ignore
+    assert catalog.best(request) is None
+    request.allow_cloud = True
+    assert catalog.best(request).descriptor.id == "openrouter_qwen72b_cloud"
+    speed = catalog.candidates("chat", "speed")
+    assert [record.score for record in speed] == sorted((record.score for record in speed), reverse=True)
+
+
+def test_recommend_lists_ranked_alternatives():
+    body = {"task": "chat", "context_tokens": 1024, "priority": "speed", "allow_cloud": True}
+    data = client.post("/recommend", json=body).json()
+    ids = [data["model"]["id"]] + [model["id"] for model in data["alternatives"]]
+    assert ids == ["qwen3_4b_local", "qwen3_8b_local", "qwen3_32b_local", "openrouter_qwen72b_cloud"]
+
+
+def test_metrics_endpoint_exposes_request_histogram():
+    client.get("/health")
+    text = client.get("/metrics").text
+    assert 'route="/health",service="control-plane",status="200"' in text
+
+
+def test_models_config_reloads_after_update_and_external_edit(tmp_path, monkeypatch):
+    import yaml
+
+    config_path = tmp_path / "models.yaml"
+    config_path.write_text((ROOT / "control-plane" / "config" / "models.yaml").read_text(encoding="utf-8"), encoding="utf-8")
+    monkeypatch.setattr(module, "CONFIG_PATH", config_path)
+    monkeypatch.setattr(module, "STATE_PATH", tmp_path / "state.json")
+    module.reset_config()  # type: ignore
+    before = client.get("/version").json()["version"]
+
+    response = client.post("/profiles/default/routing", json={"task": "chat", "model_id": "qwen3_4b_local"})
+    assert response.status_code == 200
+    profiles = {profile["name"]: profile for profile in client.get("/profiles").json()["profiles"]}
+    assert profiles["default"]["routing"]["chat"] == "qwen3_4b_local"
+    assert module.get_models_config().current.version == 2  # type: ignore
+
+    edited = yaml.safe_load(config_path.read_text(encoding="utf-8"))
+    edited["models"]["qwen3_8b_local"]["label"] = "Edited by hand"
+    config_path.write_text(yaml.safe_dump(edited), encoding="utf-8")
+    assert module.get_models_config().check() is True  # type: ignore
+    labels = {model["id"]: model["label"] for model in client.get("/models").json()}
+    assert labels["qwen3_8b_local"] == "Edited by hand"
+    assert client.get("/version").json()["version"] != before
+
+    edited["models"]["broken"] = {"provider": "local"}  # missing required fields
+    config_path.write_text(yaml.safe_dump(edited), encoding="utf-8")
+    assert module.get_models_config().check() is False  # type: ignore
+    assert client.get("/config").json()["version"] == 3
+    module.reset_config()  # type: ignore
+
+
+def test_concurrent_admin_writes_are_atomic_and_journaled(tmp_path, monkeypatch):
+    import threading
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    import yaml
+
+    config = yaml.safe_load((ROOT / "control-plane" / "config" / "models.yaml").read_text(encoding="utf-8"))
+    config["profiles"]["travel"] = {"routing": {"chat": "qwen3_4b_local"}}
+    config_path = tmp_path / "models.yaml"
+    state_path = tmp_path / "state.json"
+    config_path.write_text(yaml.safe_dump(config), encoding="utf-8")
+    monkeypatch.setattr(module, "CONFIG_PATH", config_path)
+    monkeypatch.setattr(module, "STATE_PATH", state_path)
+    monkeypatch.setenv("STORE_JOURNAL", "1")
+    module.reset_config()  # type: ignore
+
+    stop = threading.Event()
+    torn: list = []
+
+    def watch_files():
+        # every observable version of either file must parse completely
+        while not stop.is_set():
+            for path, parse in ((state_path, json.loads), (config_path, yaml.safe_load)):
+                try:
+                    text = path.read_text(encoding="utf-8")
+                except FileNotFoundError:
+                    continue
+                try:
+                    assert isinstance(parse(text), dict)
+                except Exception as exc:  # pragma: no cover - only on corruption
+                    torn.append(exc)
+
+    def activate(index):
+        return module.activate_profile("travel" if index % 2 else "default")  # type: ignore
+
+    def route(index):
+        body = module.UpdateRoutingRequest(task=f"task_{index}", model_id="qwen3_4b_local")  # type: ignore
+        return module.update_routing("default", body)  # type: ignore
+
+    watcher = threading.Thread(target=watch_files)
+    watcher.start()
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        futures = [pool.submit(activate if index % 3 else route, index) for index in range(150)]
+        results = [future.result() for future in futures]
+    stop.set()
+    watcher.join()
+
+    assert torn == []
+    assert all(result["status"] == "ok" for result in results)
+    routed = {f"task_{index}" for index in range(150) if index % 3 == 0}
+    on_disk = yaml.safe_load(config_path.read_text(encoding="utf-8"))["profiles"]["default"]["routing"]
+    assert routed <= set(on_disk)  # no lost updates
+    assert routed <= set(module.get_config()["profiles"]["default"]["routing"])  # type: ignore
+    assert json.loads(state_path.read_text(encoding="utf-8")) == module.get_state()  # type: ignore
+    assert list(tmp_path.glob("*.tmp")) == []
+
+    state_history = client.get("/history/state", params={"limit": 1000}).json()
+    assert [entry["version"] for entry in state_history["entries"]] == list(range(1, 101))
+    models_history = client.get("/history/models", params={"limit": 1000}).json()
+    assert [entry["version"] for entry in models_history["entries"]] == list(range(1, 51))
+
+    restored = client.post("/history/models/1/restore")
+    assert restored.status_code == 200 and restored.json()["version"] == 51
+    first_task = models_history["entries"][0]["action"].rsplit(".", 1)[1]
+    assert set(module.get_config()["profiles"]["default"]["routing"]) & routed == {first_task}  # type: ignore
+    assert client.post("/history/models/999/restore").status_code == 404
+
+    reads = 20_000
+    started = time.perf_counter()
+    for _ in range(reads):
+        module.config_version()  # type: ignore
+    per_read_us = (time.perf_counter() - started) / reads * 1e6
+    assert per_read_us < 50, per_read_us
+    module.reset_config()  # type: ignore
+
+
+def test_state_read_sees_external_edits_and_journal_is_compacted(tmp_path):
+    import os
+
+    from familyai_common.store import DocumentStore
+
+    path = tmp_path / "state.json"
+    journal = tmp_path / "state.json.journal.jsonl"
+    store = DocumentStore(path, "state-test", default={"active_profile": "default"}, journal_path=journal)
+    store.journal.max_entries = 8  # type: ignore[union-attr]
+    for index in range(30):
+        store.update(f"set:{index}", lambda document, index=index: document.update(counter=index))
+    assert store.read()["counter"] == 29
+
+    # edited by hand: same version, different file
+    path.write_text(json.dumps({"active_profile": "travel", "counter": 29}), encoding="utf-8")
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert store.read()["active_profile"] == "travel"
+
+    lines = journal.read_text(encoding="utf-8").splitlines()
+    assert 8 <= len(lines) <= 10
+    assert [entry["version"] for entry in store.history(limit=100)][-1] == 30
+    assert DocumentStore(path, "state-test", journal_path=journal).version == 30
+
+
+def test_download_endpoint_runs_jobs_and_reports_progress(tmp_path, monkeypatch):
+    import hashlib
+    import time
+
+    from test_downloads import FileServer
+
+    weights = bytes(range(256)) * 1024
+    server = FileServer({"qwen3_4b/model.safetensors": weights})
+    monkeypatch.setenv("MODEL_DOWNLOAD_DIR", str(tmp_path))
+    monkeypatch.setenv("DOWNLOAD_CHUNK_MB", "0.0625")
+    monkeypatch.setattr(module, "_downloader", None)
+    try:
+        body = {
+            "model_id": "qwen3_4b_local",
+            "files": [{"url": server.url("qwen3_4b/model.safetensors"), "sha256": hashlib.sha256(weights).hexdigest()}],
+        }
+        scheduled = client.post("/models/qwen3_4b_local/download", json=body)
+        assert scheduled.status_code == 200
+        job_id = scheduled.json()["job_id"]
+        deadline = time.monotonic() + 10
+        while client.get(f"/downloads/{job_id}").json()["status"] not in ("done", "failed"):
+            assert time.monotonic() < deadline
+            time.sleep(0.02)
+        listing = client.get("/downloads").json()
+    finally:
+        module.get_downloader().shutdown(wait=True)  # type: ignore
+        server.close()
+    job = next(job for job in listing["jobs"] if job["id"] == job_id)
+    assert job["status"] == "done" and job["progress"] == 1.0
+    assert listing["chunk_bytes"] == 64 * 1024
+    assert (tmp_path / "qwen3_4b_local" / "model.safetensors").read_bytes() == weights
+    assert client.get("/downloads/missing").status_code == 404
+
+    # without a source the endpoint still leaves a marker for an external puller
+    assert client.post("/models/qwen3_8b_local/download", json={"model_id": "qwen3_8b_local"}).json()["status"] == "scheduled"
+    assert (tmp_path / "qwen3_8b_local.pending").exists()
+
+
+def test_download_credentials_only_go_to_configured_sources(tmp_path, monkeypatch):
+    import time
+
+    import yaml
+
+    from test_downloads import FileServer
+
+    server = FileServer({"model.bin": b"weights", "elsewhere.bin": b"other"})
+    config = yaml.safe_load((ROOT / "control-plane" / "config" / "models.yaml").read_text(encoding="utf-8"))
+    config["models"]["qwen3_4b_local"]["download"] = {"auth_env": "HF_TOKEN", "files": [{"url": server.url("model.bin")}]}
+    config_path = tmp_path / "models.yaml"
+    config_path.write_text(yaml.safe_dump(config), encoding="utf-8")
+    monkeypatch.setattr(module, "CONFIG_PATH", config_path)
+    monkeypatch.setenv("HF_TOKEN", "secret")
+    monkeypatch.setenv("MODEL_DOWNLOAD_DIR", str(tmp_path / "downloads"))
+    monkeypatch.setattr(module, "_downloader", None)
+    module.reset_config()  # type: ignore
+
+    def run(body):
+        job_id = client.post("/models/qwen3_4b_local/download", json=body).json()["job_id"]
+        deadline = time.monotonic() + 10
+        while client.get(f"/downloads/{job_id}").json()["status"] not in ("done", "failed"):
+            assert time.monotonic() < deadline
+            time.sleep(0.02)
+
+    try:
+        run({"model_id": "qwen3_4b_local"})
+        configured = list(server.authorizations)
+        server.authorizations.clear()
+        run({"model_id": "qwen3_4b_local", "files": [{"url": server.url("elsewhere.bin")}]})
+    finally:
+        module.get_downloader().shutdown(wait=True)  # type: ignore
+        server.close()
+        module.reset_config()  # type: ignore
+    assert configured and set(configured) == {"Bearer secret"}
+    # a caller-supplied URL never sees the configured token
+    assert server.authorizations and set(server.authorizations) == {None}
+
+
+def test_residency_prefers_resident_models_and_queues_over_budget_loads(monkeypatch):
+    monkeypatch.setattr(module, "_residency", module.ResidencyTracker(22, protected=module.protected_models))  # type: ignore
+    quality = {"task": "chat", "context_tokens": 1024, "priority": "quality", "allow_cloud": False}
+    etag = client.post("/recommend", json=quality).headers["etag"]
+
+    assert client.post("/residency/qwen3_8b_local/load").json()["action"] == "load"
+    assert client.post("/residency/qwen3_4b_local/load").json()["action"] == "load"
+    assert client.get("/residency/qwen3_32b_local/plan").json() == {"action": "evict", "evict": ["qwen3_4b_local"], "free_gb": 16.0}
+    data = client.post("/recommend", json=quality)
+    assert data.headers["etag"] != etag
+    assert data.json()["model"]["id"] == "qwen3_32b_local"
+    assert data.json()["placement"]["evict"] == ["qwen3_4b_local"]
+
+    # the default profile routes code to the 30B coder, so it may not be evicted for the 32B chat model
+    loaded = client.post("/residency/qwen3_coder_30b_a3b_local/load").json()
+    assert loaded["action"] == "load" and loaded["evicted"] == []
+    queued = client.post("/residency/qwen3_32b_local/load")
+    assert queued.status_code == 202 and queued.json()["position"] == 1
+    data = client.post("/recommend", json=quality).json()
+    assert data["model"]["id"] == "qwen3_8b_local"
+    assert data["placement"]["action"] == "resident"
+    assert any(line.startswith("Resident") for line in data["rationale"])
+
+    assert client.post("/residency/qwen3_coder_30b_a3b_local/evict").status_code == 200
+    state = client.get("/residency").json()
+    assert [entry["model"] for entry in state["resident"]] == ["qwen3_8b_local", "qwen3_32b_local"]
+    assert state["queue"] == [] and state["free_gb"] == 0.0
+    assert state["decisions"][-1]["reason"] == "dequeued"
+    assert client.post("/residency/qwen3_4b_local/evict").status_code == 404
+
+    monkeypatch.setattr(module, "_residency", module.ResidencyTracker(16, protected=module.protected_models))  # type: ignore
+    assert client.post("/residency/qwen3_32b_local/load").status_code == 409
+    assert client.post("/residency/openrouter_qwen72b_cloud/load").status_code == 400
+    no_room = client.post("/recommend", json={**quality, "context_tokens": 8192})
+    assert no_room.json()["model"]["id"] == "qwen3_8b_local"  # the 32B is skipped, not recommended
+
+
+def test_live_latency_feedback_steers_speed_ranking_and_goes_cold():
+    speed = {"task": "chat", "context_tokens": 1024, "priority": "speed", "allow_cloud": False}
+    assert client.post("/recommend", json=speed).json()["model"]["id"] == "qwen3_4b_local"
+
+    observations = [{"model": "qwen3_4b_local", "latency_ms": 2800 + index * 10, "ok": True} for index in range(20)]
+    observations += [{"model": "qwen3_8b_local", "latency_ms": 380, "ok": index % 4 != 0} for index in range(20)]
+    observations.append({"model": "not-in-catalog", "latency_ms": 1.0})
+    assert client.post("/feedback", json={"observations": observations}).json() == {"accepted": 40, "ignored": 1}
+
+    data = client.post("/recommend", json=speed).json()
+    assert data["model"]["id"] == "qwen3_8b_local"
+    assert any(line.startswith("Live p50=") and "errors=25%" in line for line in data["rationale"])
+    assert data["alternatives"][-1]["id"] == "qwen3_4b_local"  # backed up: now behind the 32B's static 1.6 s
+    live = client.get("/latency").json()["models"]
+    assert 2700 < live["qwen3_4b_local"]["p95_ms"] < 3300
+    assert set(live) == {"qwen3_4b_local", "qwen3_8b_local"}
+
+    sketch = module.LatencySketch(half_life_s=10)  # type: ignore
+    for index in range(100):
+        sketch.add(100 + index, True, now=0.0)
+    warm = sketch.snapshot(now=0.0)
+    assert abs(warm.p50_ms - 150) / 150 < 0.08 and warm.error_rate == 0.0
+    assert sketch.snapshot(now=60.0) is None  # decayed below LATENCY_MIN_SAMPLES: back to static latency
@@ -0,0 +1,198 @@
+import hashlib
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from familyai_common.downloads import DownloadFile, DownloadScheduler  # noqa: E402
+
+CHUNK = 64 * 1024
+
+
+class FileServer:
+    """Minimal static file server with optional ``Range`` support and injected failures."""
+
+    def __init__(self, files: Dict[str, bytes], ranges: bool = True) -> None:
+        self.files = files
+        self.ranges = ranges
+        self.failing_starts: set = set()
+        self.served = 0
+        self.authorizations: list = []
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_HEAD(self):
+                server.authorizations.append(self.headers.get("Authorization"))
+                body = server.files[self.path.lstrip("/")]
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(body)))
+                if server.ranges:
+                    self.send_header("Accept-Ranges", "bytes")
+                self.end_headers()
+
+            def do_GET(self):
+                server.authorizations.append(self.headers.get("Authorization"))
+                body = server.files[self.path.lstrip("/")]
+                header = self.headers.get("Range")
+                if header and server.ranges:
+                    start, end = (int(value) for value in header.split("=", 1)[1].split("-"))
+                    if start in server.failing_starts:
+                        self.send_error(500)
+                        return
+                    payload = body[start : end + 1]
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{len(body)}")
+                else:
+                    payload = body
+                    self.send_response(200)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+                with server.lock:
+                    server.served += len(payload)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def url(self, name: str) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/{name}"
+
+    def close(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def wait(job, timeout_s: float = 10.0):
+    deadline = time.monotonic() + timeout_s
+    while job.status in ("queued", "running", "verifying"):
+        assert time.monotonic() < deadline, job.snapshot()
+        time.sleep(0.01)
+    return job
+
+
+def sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def test_parallel_ranged_download_verifies_checksum(tmp_path):
+    weights, tokenizer = os.urandom(16 * CHUNK + 123), b'{"vocab": {}}'
+    server = FileServer({"model.bin": weights, "tokenizer.json": tokenizer})
+    scheduler = DownloadScheduler(tmp_path, chunk_workers=4, chunk_bytes=CHUNK)
+    try:
+        files = [
+            DownloadFile(server.url("model.bin"), "model.bin", sha256(weights)),
+            DownloadFile(server.url("tokenizer.json"), "tokenizer.json"),
+        ]
+        job = wait(scheduler.submit("demo", files))
+        assert scheduler.submit("demo", files) is not job  # finished jobs are not deduplicated
+    finally:
+        scheduler.shutdown(wait=True)
+        server.close()
+    snapshot = job.snapshot()
+    assert snapshot["status"] == "done", snapshot
+    assert snapshot["bytes_done"] == snapshot["bytes_total"] == len(weights) + len(tokenizer)
+    assert (tmp_path / "demo" / "model.bin").read_bytes() == weights
+    assert sorted(path.name for path in (tmp_path / "demo").iterdir()) == ["model.bin", "tokenizer.json"]
+
+
+def test_interrupted_download_resumes_missing_chunks_only(tmp_path):
+    weights = os.urandom(10 * CHUNK)
+    server = FileServer({"model.bin": weights})
+    server.failing_starts = {3 * CHUNK}
+    files = [DownloadFile(server.url("model.bin"), "model.bin", sha256(weights))]
+    # one chunk worker, so exactly the three chunks before the failing one complete
+    first = DownloadScheduler(tmp_path, chunk_workers=1, chunk_bytes=CHUNK, retries=1, backoff_s=0)
+    try:
+        failed = wait(first.submit("demo", files))
+        assert failed.status == "failed"
+        assert (tmp_path / "demo" / "model.bin.part.json").exists()
+        assert not (tmp_path / "demo" / "model.bin").exists()
+
+        server.failing_starts = set()
+        server.served = 0
+        second = DownloadScheduler(tmp_path, chunk_bytes=CHUNK)
+        resumed = wait(second.submit("demo", files))
+        second.shutdown(wait=True)
+    finally:
+        first.shutdown(wait=True)
+        server.close()
+    assert resumed.status == "done", resumed.snapshot()
+    assert resumed.resumed_bytes == 3 * CHUNK
+    assert server.served == 7 * CHUNK
+    assert (tmp_path / "demo" / "model.bin").read_bytes() == weights
+    assert not (tmp_path / "demo" / "model.bin.part.json").exists()
+
+
+def test_checksum_mismatch_discards_the_download(tmp_path):
+    server = FileServer({"model.bin": os.urandom(3 * CHUNK)})
+    scheduler = DownloadScheduler(tmp_path, chunk_bytes=CHUNK)
+    try:
+        job = wait(scheduler.submit("demo", [DownloadFile(server.url("model.bin"), "model.bin", "0" * 64)]))
+    finally:
+        scheduler.shutdown(wait=True)
+        server.close()
+    assert job.status == "failed"
+    assert "Checksum mismatch" in job.error
+    assert list((tmp_path / "demo").iterdir()) == []
+
+
+def test_existing_file_is_verified_before_it_is_skipped(tmp_path):
+    weights = os.urandom(4 * CHUNK)
+    server = FileServer({"model.bin": weights})
+    (tmp_path / "demo").mkdir()
+    # same size as the real file, wrong bytes: an earlier copy that was corrupted in place
+    (tmp_path / "demo" / "model.bin").write_bytes(bytes(len(weights)))
+    scheduler = DownloadScheduler(tmp_path, chunk_bytes=CHUNK, retention_s=0.05)
+    try:
+        job = wait(scheduler.submit("demo", [DownloadFile(server.url("model.bin"), "model.bin", sha256(weights))]))
+        again = wait(scheduler.submit("demo", [DownloadFile(server.url("model.bin"), "model.bin", sha256(weights))]))
+        time.sleep(0.1)
+        listed = scheduler.jobs()
+    finally:
+        scheduler.shutdown(wait=True)
+        server.close()
+    assert job.status == "done" and job.resumed_bytes == 0
+    assert (tmp_path / "demo" / "model.bin").read_bytes() == weights
+    assert again.status == "done" and again.resumed_bytes == len(weights)
+    # finished jobs are dropped once the retention window has passed
+    assert listed == [] and scheduler.get(job.id) is None
+
+
+def test_bandwidth_limit_and_servers_without_ranges(tmp_path):
+    payload = os.urandom(8 * CHUNK)
+    server = FileServer({"model.bin": payload}, ranges=False)
+    scheduler = DownloadScheduler(tmp_path, chunk_bytes=CHUNK, rate_limit_bps=len(payload))
+    try:
+        started = time.perf_counter()
+        job = wait(scheduler.submit("demo", [DownloadFile(server.url("model.bin"), "model.bin", sha256(payload))]))
+        elapsed = time.perf_counter() - started
+    finally:
+        scheduler.shutdown(wait=True)
+        server.close()
+    assert job.status == "done", job.snapshot()
+    # a quarter second of burst, the rest paced at the configured rate
+    assert elapsed >= 0.6
+    assert (tmp_path / "demo" / "model.bin").read_bytes() == payload
+
+
+def test_rejects_file_names_outside_the_model_directory(tmp_path):
+    scheduler = DownloadScheduler(tmp_path)
+    try:
+        for name in ("../escape.bin", ".hidden", ""):
+            with pytest.raises(ValueError):
+                scheduler.submit("demo", [DownloadFile("http://127.0.0.1/x", name)])
+    finally:
+        scheduler.shutdown()
@@ -1,20 +1,78 @@
+import asyncio
+import json
 import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from importlib import reload
 
 import pytest
+import yaml
 from fastapi.testclient import TestClient
 
 from gateway.app import main
+from gateway.app.resilience import CircuitBreaker, hedge
+from gateway.app.scheduler import AdmissionRejected, AdmissionScheduler
+from gateway.app.tokens import TokenEstimator
+from gateway.app.upstream import UpstreamPool, build_timeout, upstream_key
 
 
 @pytest.fixture(autouse=True)
-def set_config(tmp_path):
+def set_config(monkeypatch):
     config_path = os.path.join(os.path.dirname(__file__), "fixtures", "routing_policy.yaml")
-    os.environ["ROUTING_CONFIG"] = config_path
-    main.get_config.cache_clear()
+    monkeypatch.setenv("ROUTING_CONFIG", config_path)
+    main.reset_config()
     globals()["main"] = reload(main)
     yield
-    main.get_config.cache_clear()
+    main.reset_config()
+
+
+@pytest.fixture
+def routing_config(tmp_path, monkeypatch):
+    """Load a routing.yaml written from ``config``; returns its path."""
+    config_path = tmp_path / "routing.yaml"
+
+    def load(config):
+        config_path.write_text(yaml.safe_dump(config), encoding="utf-8")
+        monkeypatch.setenv("ROUTING_CONFIG", str(config_path))
+        main.reset_config()
+        return config_path
+
+    return load
+
+
+@pytest.fixture
+def fake_upstream(routing_config):
+    """Serve ``handler`` on a local port and, given ``models``, route them to it.
+
+    Each ``models`` entry is a routing.yaml model whose ``endpoint`` and
+    ``health`` are paths on the server (endpoint defaults to
+    ``/v1/chat/completions``, kind to ``chat``). ``policies`` defaults to every
+    chat tier on the first model; other keywords are extra config sections.
+    Returns the server's base URL; servers stop when the test ends.
+    """
+    servers = []
+
+    def start(handler, models=None, policies=None, **sections):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        if models is not None:
+            entries = {}
+            for model_id, entry in models.items():
+                entry = {"kind": "chat", **entry, "endpoint": base + entry.get("endpoint", "/v1/chat/completions")}
+                if "health" in entry:
+                    entry["health"] = base + entry["health"]
+                entries[model_id] = entry
+            first = next(iter(models))
+            default_policies = {"chat": {"default": first, "balanced": first, "complex": first}}
+            routing_config({"models": entries, "policies": policies or default_policies, **sections})
+        return base
+
+    yield start
+    for server in servers:
+        server.shutdown()
 
 
 def test_route_chat_balanced():
@@ -43,3 +101,1013 @@ def test_health_endpoint():
     response = client.get("/health")
     assert response.status_code == 200
     assert response.json()["status"] in {"ok", "degraded"}
+
+
+class _EchoUpstream(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    peers: list = []
+
+    def log_message(self, *_args):
+        pass
+
+    def do_POST(self):
+        self.peers.append(self.client_address[1])
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        reply = json.dumps({"echo": json.loads(body)}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+
+@pytest.fixture
+def echo_upstream(fake_upstream):
+    handler = type("Handler", (_EchoUpstream,), {"peers": []})
+    fake_upstream(
+        handler, {"fast": {"timeout": {"read": 1.5}}}, http_client={"max_connections": 4, "timeout": {"read": 5.0}}
+    )
+    return handler
+
+
+def test_proxy_reuses_pooled_connection(echo_upstream):
+    with TestClient(main.app) as client:
+        for _ in range(3):
+            response = client.post("/v1/proxy", json={"task": "chat", "payload": {"prompt": "hi"}})
+            assert response.status_code == 200
+            assert response.json()["response"] == {"echo": {"prompt": "hi"}}
+    # keep-alive: every proxied call travelled over the same TCP connection
+    assert len(echo_upstream.peers) == 3
+    assert len(set(echo_upstream.peers)) == 1
+
+
+def test_model_timeout_overrides_defaults(echo_upstream):
+    timeout = main.model_timeout("fast")
+    assert timeout.read == 1.5
+    assert timeout.connect == build_timeout().connect
+
+
+def test_upstream_pool_shares_client_per_origin():
+    pool = UpstreamPool({"upstreams": {"vllm:8000": {"max_connections": 64}}})
+    chat = pool.client_for("http://vllm:8000/v1/chat/completions")
+    assert chat is pool.client_for("http://vllm:8000/v1/completions")
+    assert chat is not pool.client_for("http://whisper:8500/v1/transcribe")
+    assert upstream_key("https://openrouter.ai/api") == "https://openrouter.ai:443"
+    assert pool._limits_for("http://vllm:8000").max_connections == 64
+
+
+class _SSEUpstream(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    delay = 0.4
+
+    def log_message(self, *_args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for index, event in enumerate(["data: {\"token\": \"Hel\"}", "data: {\"token\": \"lo\"}", "data: [DONE]"]):
+            if index:
+                time.sleep(self.delay)
+            chunk = f"{event}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(chunk):x}\r\n".encode("ascii") + chunk + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+
+@pytest.fixture
+def sse_upstream(fake_upstream):
+    return fake_upstream(_SSEUpstream, {"fast": {}}) + "/v1/chat/completions"
+
+
+class _DyingSSEUpstream(_SSEUpstream):
+    """Sends one event, then drops the connection without ending the chunked body."""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        chunk = b'data: {"token": "Hel"}\n\n'
+        self.wfile.write(f"{len(chunk):x}\r\n".encode("ascii") + chunk + b"\r\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+
+@pytest.mark.parametrize(
+    "path, request_kwargs",
+    [
+        ("/v1/proxy", {"json": {"task": "chat", "payload": {"stream": True, "messages": [{"role": "user", "content": "hi"}]}}}),
+        ("/v1/upload/chat", {"content": b"raw upload", "headers": {"Content-Type": "text/plain"}}),
+    ],
+)
+def test_stream_cut_mid_body_releases_lane_and_replica(fake_upstream, path, request_kwargs):
+    resilience = {"breaker": {"min_calls": 1, "failure_rate": 0.5, "open_s": 60}}
+    endpoint = fake_upstream(_DyingSSEUpstream, {"fast": {}}, resilience=resilience) + "/v1/chat/completions"
+    with TestClient(main.app) as client:
+        with pytest.raises(Exception):
+            with client.stream("POST", path, **request_kwargs) as response:
+                b"".join(response.iter_raw())
+        upstreams = client.get("/v1/upstreams").json()
+
+    lane = upstreams["scheduler"]["endpoints"][endpoint]
+    assert lane["in_flight"] == 0 and lane["queued"] == 0
+    assert upstreams["balancer"]["replicas"][endpoint]["outstanding"] == 0
+    # the cut-off body counts against the upstream, not as a success at first byte
+    assert upstreams["breakers"][endpoint]["state"] == "open"
+
+
+async def _asgi_post(app, path, body):
+    """Drive the ASGI app directly so each body chunk is timestamped as it is sent."""
+    raw = json.dumps(body).encode("utf-8")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode("ascii"),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(raw)).encode())],
+        "client": ("127.0.0.1", 50000),
+        "server": ("testserver", 80),
+    }
+    finished = asyncio.Event()
+    request_sent = False
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": raw, "more_body": False}
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    started = time.perf_counter()
+    messages = []
+
+    async def send(message):
+        messages.append((time.perf_counter() - started, message))
+
+    await app(scope, receive, send)
+    finished.set()
+    await main.get_pool().aclose()
+    return messages
+
+
+def test_proxy_streams_sse_before_upstream_finishes(sse_upstream):
+    body = {"task": "chat", "payload": {"stream": True, "messages": [{"role": "user", "content": "hi"}]}}
+    messages = asyncio.run(_asgi_post(main.app, "/v1/proxy", body))
+
+    start = messages[0][1]
+    assert start["status"] == 200
+    headers = {key.decode(): value.decode() for key, value in start["headers"]}
+    assert headers["x-familyai-model"] == "fast"
+    assert headers["x-familyai-endpoint"] == sse_upstream
+    assert headers["content-type"].startswith("text/event-stream")
+
+    chunks = [(at, message["body"]) for at, message in messages[1:] if message.get("body")]
+    first_byte, total = chunks[0][0], messages[-1][0]
+    assert b"Hel" in chunks[0][1]
+    assert b"".join(chunk for _, chunk in chunks).endswith(b"data: [DONE]\n\n")
+    # the first event is relayed immediately instead of after the whole generation
+    assert total >= 2 * _SSEUpstream.delay
+    assert first_byte < _SSEUpstream.delay
+
+
+class _FakeControlPlane(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    version = "v1"
+    context = None
+    recommend_calls: list = []
+    feedback: list = []
+
+    def log_message(self, *_args):
+        pass
+
+    def _reply(self, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", f'"{self.version}"')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._reply({"version": self.version})
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        if self.path == "/feedback":
+            self.feedback.extend(request["observations"])
+            self._reply({"accepted": len(request["observations"]), "ignored": 0})
+            return
+        self.recommend_calls.append(request)
+        model = {"id": "accurate", "provider": "local", "endpoint": "http://localhost:2", "context": self.context}
+        self._reply({"model": model, "score": 1.0, "rationale": ["fake"]})
+
+
+@pytest.fixture
+def control_plane(fake_upstream, routing_config, monkeypatch):
+    handler = type("Handler", (_FakeControlPlane,), {"recommend_calls": [], "feedback": [], "version": "v1"})
+    monkeypatch.setattr(main, "CONTROL_PLANE_URL", fake_upstream(handler))
+    routing_config(
+        {
+            "recommendation_cache": {"max_entries": 8, "ttl_s": 60},
+            "models": {"fast": {"endpoint": "http://localhost:1", "kind": "chat"}},
+            "policies": {"chat": {"control_plane_profile": "default", "balanced": "fast", "complex": "fast"}},
+        }
+    )
+    return handler
+
+
+def test_context_bucket_rounds_up():
+    assert main.context_bucket(None) == 0
+    assert main.context_bucket(10) == 1024
+    assert main.context_bucket(5000) == 8192
+    assert main.context_bucket(8192) == 8192
+
+
+def test_recommendations_are_cached_per_bucket(control_plane):
+    with TestClient(main.app) as client:
+        for tokens in (5000, 6000, 8000):
+            response = client.post("/v1/route", json={"task": "chat", "context_tokens": tokens})
+            assert response.status_code == 200
+            assert response.json()["model"] == "accurate"
+            assert response.json()["metadata"]["source"] == "control-plane"
+        client.post("/v1/route", json={"task": "chat", "context_tokens": 9000})
+        stats = client.get("/v1/cache").json()["recommendations"]
+
+    # the control plane sees the real context; only the cache key is bucketed
+    assert [call["context_tokens"] for call in control_plane.recommend_calls] == [5000, 9000]
+    assert stats["hits"] == 2
+    assert stats["misses"] == 2
+    assert stats["version"] == '"v1"'
+
+
+def test_cached_pick_must_fit_the_whole_context_bucket(control_plane):
+    control_plane.context = 12000
+    with TestClient(main.app) as client:
+        for tokens in (9000, 10000):
+            assert client.post("/v1/route", json={"task": "chat", "context_tokens": tokens}).status_code == 200
+        control_plane.context = 16384
+        for tokens in (11000, 15000):
+            assert client.post("/v1/route", json={"task": "chat", "context_tokens": tokens}).status_code == 200
+
+    # a 12k model fits 9000 and 10000 tokens but not the 16k bucket, so it is never reused from cache
+    assert [call["context_tokens"] for call in control_plane.recommend_calls] == [9000, 10000, 11000]
+
+
+def test_recommendation_cache_drops_entries_on_new_version(control_plane):
+    with TestClient(main.app) as client:
+        client.post("/v1/route", json={"task": "chat"})
+        client.post("/v1/route", json={"task": "chat"})
+        assert len(control_plane.recommend_calls) == 1
+
+        control_plane.version = "v2"
+        client.portal.call(main.refresh_catalog_version)
+        client.post("/v1/route", json={"task": "chat"})
+        stats = client.get("/v1/cache").json()["recommendations"]
+
+    assert len(control_plane.recommend_calls) == 2
+    assert stats["invalidations"] == 1
+    assert stats["version"] == '"v2"'
+
+
+class _FlakyUpstream(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    name = "upstream"
+    status = 200
+    health_status = 200
+    delay = 0.0
+    calls: list = []
+
+    def log_message(self, *_args):
+        pass
+
+    def do_GET(self):
+        self.send_response(self.health_status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.calls.append(self.name)
+        time.sleep(self.delay)
+        reply = json.dumps({"served_by": self.name}).encode("utf-8")
+        self.send_response(self.status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+
+@pytest.fixture
+def flaky_pair(fake_upstream, routing_config):
+    calls = []
+    handlers = {name: type(name, (_FlakyUpstream,), {"name": name, "calls": calls}) for name in ("primary", "backup")}
+    models = {}
+    for name, handler in handlers.items():
+        base = fake_upstream(handler)
+        models[name] = {"endpoint": f"{base}/v1/chat/completions", "health": f"{base}/health/ready", "kind": "chat"}
+
+    def configure(resilience, **sections):
+        routing_config(
+            {
+                "resilience": resilience,
+                "models": models,
+                "policies": {"chat": {"balanced": "primary", "complex": "primary", "fallbacks": ["backup"]}},
+                **sections,
+            }
+        )
+        return handlers, calls
+
+    return configure
+
+
+def test_circuit_breaker_opens_and_recovers_through_half_open_probe():
+    breaker = CircuitBreaker(min_calls=2, failure_rate=0.5, open_s=0.05, slow_call_s=1.0)
+    breaker.record(True, 0.01)
+    breaker.record(True, 2.0)  # slow call counts as a failure
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()  # half-open probe
+    assert not breaker.allow()  # only one probe at a time
+    breaker.record(True, 0.01)
+    assert breaker.state == "closed"
+
+
+def test_hedge_returns_fastest_success():
+    async def answer(value, delay):
+        await asyncio.sleep(delay)
+        return value
+
+    async def scenario():
+        fast = await hedge(answer("primary", 0.0), lambda: answer("backup", 0.0), delay_s=0.5)
+        hedged = await hedge(answer("primary", 1.0), lambda: answer("backup", 0.01), delay_s=0.05)
+        return fast, hedged
+
+    assert asyncio.run(scenario()) == ("primary", "backup")
+
+
+def test_cancelled_queued_half_open_attempt_gives_back_its_probe(flaky_pair):
+    flaky_pair({"breaker": {"min_calls": 1, "open_s": 60}}, scheduler={"max_in_flight": 1})
+    endpoint = main.get_config()["models"]["primary"]["endpoint"]
+    candidate = main.RouteResponse(model="primary", endpoint=endpoint, metadata={})
+    breaker = main.get_breakers().get(endpoint)
+    breaker.state, breaker.opened_at = "open", time.monotonic() - 120
+
+    async def scenario():
+        scheduler = main.get_scheduler()
+        async with scheduler.slot(endpoint):
+            assert breaker.allow()  # the half-open probe, as reserved by pick_replica
+            # e.g. the losing hedge backup, cancelled while it waits behind the busy slot
+            attempt = asyncio.ensure_future(main.attempt_upstream(candidate, {"prompt": "hi"}, []))
+            while not scheduler.lane(endpoint).stats()["queued"]:
+                await asyncio.sleep(0.01)
+            attempt.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await attempt
+
+    asyncio.run(scenario())
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert main.get_balancer().stats()["replicas"][endpoint]["outstanding"] == 0
+
+
+def test_stream_open_failures_release_lane_replica_and_probe(flaky_pair, monkeypatch):
+    from contextlib import AsyncExitStack
+
+    flaky_pair({"breaker": {"min_calls": 1, "open_s": 60}}, scheduler={"max_in_flight": 1})
+    endpoint = main.get_config()["models"]["primary"]["endpoint"]
+    routing = main.RouteResponse(model="primary", endpoint=endpoint, metadata={})
+    monkeypatch.setattr(main, "route_candidates", lambda _routing: [routing])
+    breaker = main.get_breakers().get(endpoint)
+
+    async def broken_open(*_args):
+        raise RuntimeError("connection pool closed")
+
+    async def scenario():
+        scheduler = main.get_scheduler()
+        breaker.state, breaker.opened_at = "open", time.monotonic() - 120
+        async with scheduler.slot(endpoint):
+            opening = asyncio.ensure_future(main.open_stream_with_fallback(routing, {}, AsyncExitStack()))
+            while not scheduler.lane(endpoint).stats()["queued"]:
+                await asyncio.sleep(0.01)
+            opening.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await opening
+        cancelled = breaker.allow()
+        breaker.release()
+        monkeypatch.setattr(main, "open_stream", broken_open)
+        with pytest.raises(RuntimeError):
+            await main.open_stream_with_fallback(routing, {}, AsyncExitStack())
+        return cancelled, breaker.allow(), scheduler.lane(endpoint).stats()
+
+    cancelled, failed, lane = asyncio.run(scenario())
+    assert cancelled and failed
+    assert lane["in_flight"] == 0 and lane["queued"] == 0
+    assert main.get_balancer().stats()["replicas"][endpoint]["outstanding"] == 0
+
+
+def test_proxy_falls_back_and_skips_open_circuit(flaky_pair):
+    handlers, calls = flaky_pair({"breaker": {"min_calls": 2, "failure_rate": 0.5, "open_s": 60}})
+    handlers["primary"].status = 500
+    with TestClient(main.app) as client:
+        for _ in range(3):
+            response = client.post("/v1/proxy", json={"task": "chat", "payload": {"prompt": "hi"}})
+            assert response.status_code == 200
+            assert response.json()["model"] == "backup"
+            assert response.json()["response"] == {"served_by": "backup"}
+        breakers = client.get("/v1/upstreams").json()["breakers"]
+
+    # two failures trip the primary's breaker; the third request goes straight to the backup
+    assert calls == ["primary", "backup", "primary", "backup", "backup"]
+    assert {entry["state"] for entry in breakers.values()} == {"open", "closed"}
+
+
+def test_proxy_returns_503_when_every_circuit_is_open(flaky_pair):
+    handlers, _ = flaky_pair({"breaker": {"min_calls": 1, "failure_rate": 0.5, "open_s": 60}})
+    handlers["primary"].status = 500
+    handlers["backup"].status = 503
+    with TestClient(main.app) as client:
+        first = client.post("/v1/proxy", json={"task": "chat", "payload": {"prompt": "hi"}})
+        second = client.post("/v1/proxy", json={"task": "chat", "payload": {"prompt": "hi"}})
+    assert first.status_code == 502
+    assert second.status_code == 503
+    assert int(second.headers["retry-after"]) >= 1
+
+
+class _SingleModelUpstream(BaseHTTPRequestHandler):
+    """One vLLM-style endpoint that only has ``served`` loaded."""
+
+    protocol_version = "HTTP/1.1"
+    served = "light-served"
+    models: list = []
+
+    def log_message(self, *_args):
+        pass
+
+    def do_POST(self):
+        model = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0)))).get("model")
+        self.models.append(model)
+        status, reply = (200, {"served": model}) if model == self.served else (500, {"error": "not loaded"})
+        body = json.dumps(reply).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def test_proxy_falls_back_to_lightweight_model_on_shared_endpoint(fake_upstream):
+    handler = type("Handler", (_SingleModelUpstream,), {"models": []})
+    fake_upstream(
+        handler,
+        {"big": {}, "light": {"served_model": "light-served"}},
+        policies={"chat": {"balanced": "big", "complex": "big", "fallbacks": ["light"]}},
+    )
+    with TestClient(main.app) as client:
+        response = client.post("/v1/proxy", json={"task": "chat", "payload": {"model": "big", "prompt": "hi"}})
+
+    assert response.status_code == 200
+    assert response.json()["model"] == "light"
+    assert response.json()["attempts"] == ["big", "light"]
+    assert handler.models == ["big", "light-served"]
+
+
+def test_proxy_skips_upstream_failing_health_checks(flaky_pair):
+    handlers, calls = flaky_pair({}, health={"interval_s": 0.05, "failures_to_down": 1})
+    handlers["primary"].health_status = 503
+
+    def wait_for(down):
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            health = client.get("/v1/upstreams").json()["health"]
+            if health["probes"] and bool(health["down"]) == down:
+                return health
+            time.sleep(0.01)
+        raise AssertionError("health probe did not settle")
+
+    with TestClient(main.app) as client:
+        # the gateway is ready as soon as its config loads; upstream state is informational
+        assert client.get("/health/live").status_code == 200
+        wait_for(down=True)
+        ready = client.get("/health/ready")
+        skipped = client.post("/v1/proxy", json={"task": "chat", "payload": {"prompt": "hi"}})
+        handlers["primary"].health_status = 200
+        wait_for(down=False)
+        recovered = client.post("/v1/proxy", json={"task": "chat", "payload": {"prompt": "hi"}})
+
+    assert ready.status_code == 200
+    dependencies = ready.json()["dependencies"]
+    assert dependencies["routing_config"]["status"] == "ready"
+    assert {entry["status"] for name, entry in dependencies.items() if name.startswith("upstream:")} == {"ready", "down"}
+    # the down primary was never contacted, so there was no timeout to sit through
+    assert skipped.json()["model"] == "backup"
+    assert skipped.json()["attempts"] == ["backup"]
+    assert recovered.json()["model"] == "primary"
+    assert calls == ["backup", "primary"]
+
+
+def test_proxy_hedges_slow_primary(flaky_pair):
+    handlers, _ = flaky_pair({"hedge": {"enabled": True, "delay_s": 0.1}})
+    handlers["primary"].delay = 1.5
+    with TestClient(main.app) as client:
+        started = time.perf_counter()
+        response = client.post("/v1/proxy", json={"task": "chat", "payload": {"prompt": "hi"}})
+        elapsed = time.perf_counter() - started
+    assert response.status_code == 200
+    assert response.json()["model"] == "backup"
+    assert response.json()["attempts"] == ["primary", "backup"]
+    assert elapsed < 1.0
+
+
+def test_metrics_record_route_latency_and_upstream_calls(echo_upstream):
+    with TestClient(main.app) as client:
+        client.post("/v1/proxy", json={"task": "chat", "payload": {"prompt": "hi"}})
+        client.get("/does-not-exist")
+        response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    assert 'http_request_duration_seconds_bucket{le="0.005",method="POST",route="/v1/proxy",service="gateway",status="200"}' in text
+    assert 'route="unmatched"' in text
+    assert 'upstream_request_duration_seconds_count{model="fast",outcome="ok",service="gateway"}' in text
+    assert 'http_requests_in_flight{service="gateway"}' in text
+
+
+def test_routing_config_reload_under_load_has_no_failed_requests(echo_upstream, tmp_path, monkeypatch):
+    import httpx
+
+    endpoint = yaml.safe_load(open(os.environ["ROUTING_CONFIG"]))["models"]["fast"]["endpoint"]
+    variants = [
+        {
+            "models": {"fast": {"endpoint": endpoint}, "other": {"endpoint": endpoint}},
+            "policies": {"chat": {"default": target, "balanced": target, "complex": target}},
+        }
+        for target in ("fast", "other")
+    ]
+    config_path = tmp_path / "reloading.yaml"
+    config_path.write_text(yaml.safe_dump(variants[0]), encoding="utf-8")
+    monkeypatch.setenv("ROUTING_CONFIG", str(config_path))
+    main.reset_config()
+    assert main.get_routing_config().current.version == 1  # loaded at startup in production
+    stop = threading.Event()
+
+    def rewrite():
+        # plain in-place writes, so the watcher also sees truncated and unparsable files
+        index = 0
+        while not stop.is_set():
+            index += 1
+            text = "models: [" if index % 5 == 0 else yaml.safe_dump(variants[index % 2])
+            with open(config_path, "w", encoding="utf-8") as handle:
+                handle.write(text[: len(text) // 2])
+                handle.flush()
+                time.sleep(0.001)
+                handle.write(text[len(text) // 2 :])
+            time.sleep(0.005)
+
+    async def scenario():
+        watcher = asyncio.create_task(main.get_routing_config().watch(0.002))
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://gateway") as client:
+
+            async def call(index):
+                return await client.post("/v1/proxy", json={"task": "chat", "payload": {"n": index}})
+
+            responses = []
+            for batch in range(20):
+                responses += await asyncio.gather(*(call(batch * 10 + index) for index in range(10)))
+        watcher.cancel()
+        await main.get_pool().aclose()
+        return responses
+
+    writer = threading.Thread(target=rewrite)
+    writer.start()
+    try:
+        responses = asyncio.run(scenario())
+    finally:
+        stop.set()
+        writer.join()
+        main._pool = None
+    assert [response.status_code for response in responses] == [200] * 200
+    assert {response.json()["model"] for response in responses} == {"fast", "other"}
+    assert main.get_routing_config().current.version > 2
+
+
+def test_pinned_request_keeps_its_snapshot_across_reload(routing_config):
+    config = {"models": {"fast": {"endpoint": "http://a"}}, "policies": {"chat": {"default": "fast"}}}
+    config_path = routing_config(config)
+    watcher = main.get_routing_config()
+    with watcher.pin() as snapshot:
+        config["models"]["fast"]["endpoint"] = "http://b"
+        config_path.write_text(yaml.safe_dump(config), encoding="utf-8")
+        assert watcher.check() is True
+        assert main.get_config()["models"]["fast"]["endpoint"] == "http://a"
+        assert watcher.current is snapshot
+    assert main.get_config()["models"]["fast"]["endpoint"] == "http://b"
+    assert watcher.current.version == 2
+
+    config_path.write_text("policies: {}\n", encoding="utf-8")
+    assert watcher.check() is False  # rejected: no models section
+    assert watcher.current.version == 2
+    assert "models" in watcher.stats()["last_error"]
+
+
+def test_proxy_reports_upstream_outcomes_to_control_plane(flaky_pair, fake_upstream, monkeypatch):
+    handlers, _ = flaky_pair({"breaker": {"min_calls": 10}})
+    handlers["primary"].status = 500
+    control_plane = type("Handler", (_FakeControlPlane,), {"recommend_calls": [], "feedback": [], "version": "v1"})
+    url = fake_upstream(control_plane)
+    monkeypatch.setattr(main, "CONTROL_PLANE_URL", url)
+    with TestClient(main.app) as client:
+        for _ in range(2):
+            assert client.post("/v1/proxy", json={"task": "chat", "payload": {"prompt": "hi"}}).status_code == 200
+        feedback = main.get_feedback()
+        sent = client.portal.call(feedback.flush, main.get_pool().client_for(url), f"{url}/feedback")
+        stats = client.get("/v1/upstreams").json()["feedback"]
+    assert sent == 4
+    assert [(entry["model"], entry["ok"]) for entry in control_plane.feedback] == [("primary", False), ("backup", True)] * 2
+    assert all(entry["latency_ms"] >= 0 for entry in control_plane.feedback)
+    assert stats == {"enabled": True, "pending": 0, "sent": 4, "dropped": 0, "failed_flushes": 0}
+
+
+def test_token_estimator_handles_ascii_cjk_and_content_parts():
+    estimator = TokenEstimator(ascii_chars_per_token=4, other_chars_per_token=1, message_overhead=4)
+    assert estimator.estimate({"prompt": "a" * 4000}) == 1001
+    assert estimator.estimate({"prompt": "数学" * 100}) == 201
+    messages = [
+        {"role": "system", "content": "x" * 400},
+        {"role": "user", "content": [{"type": "text", "text": "y" * 400}, {"type": "image_url", "image_url": {"url": "data:"}}]},
+    ]
+    assert estimator.estimate({"messages": messages, "max_tokens": 512}) == 8 + 200 + 512 + 1
+    assert estimator.estimate({"input": "no text fields"}) is None
+    family = TokenEstimator.for_family({"default_family": "dense", "families": {"dense": {"ascii_chars_per_token": 2}}})
+    assert family.ascii_chars_per_token == 2 and family.message_overhead == 4
+
+
+def test_route_estimates_context_tokens_from_payload(routing_config, control_plane):
+    config = {
+        "models": {
+            "short": {"endpoint": "http://localhost:1", "kind": "code"},
+            "long": {"endpoint": "http://localhost:2", "kind": "code"},
+            "fast": {"endpoint": "http://localhost:1", "kind": "chat"},
+        },
+        "policies": {
+            "code": {"default": "short", "long_context": "long", "thresholds": {"context_tokens": 8000}},
+            "chat": {"control_plane_profile": "default", "balanced": "fast", "complex": "fast"},
+        },
+    }
+    routing_config(config)
+    client = TestClient(main.app)
+
+    small = client.post("/v1/route", json={"task": "code", "payload": {"prompt": "def add(a, b):"}}).json()
+    large = client.post("/v1/route", json={"task": "code", "payload": {"prompt": "x = 1\n" * 6000}}).json()
+    explicit = client.post("/v1/route", json={"task": "code", "context_tokens": 100, "payload": {"prompt": "x" * 60000}}).json()
+    assert (small["model"], large["model"], explicit["model"]) == ("short", "long", "short")
+    assert large["metadata"]["estimated_context_tokens"] > 8000
+    assert "estimated_context_tokens" not in explicit["metadata"]
+
+    chat = client.post("/v1/route", json={"task": "chat", "payload": {"messages": [{"role": "user", "content": "hi " * 10000}]}})
+    assert chat.json()["metadata"]["estimated_context_tokens"] > 8192
+    assert control_plane.recommend_calls[-1]["context_tokens"] == chat.json()["metadata"]["estimated_context_tokens"]
+
+
+def test_response_cache_serves_deterministic_requests_and_survives_restart(echo_upstream, tmp_path):
+    config_path = os.environ["ROUTING_CONFIG"]
+    config = yaml.safe_load(open(config_path, encoding="utf-8"))
+    config["response_cache"] = {"max_entries": 8, "ttl_s": 60, "disk_dir": str(tmp_path / "responses")}
+    with open(config_path, "w", encoding="utf-8") as handle:
+        yaml.safe_dump(config, handle)
+    main.reset_config()
+
+    deterministic = {"task": "chat", "payload": {"prompt": "2+2?", "temperature": 0, "max_tokens": 8}}
+    reordered = {"task": "chat", "payload": {"max_tokens": 8, "temperature": 0.0, "prompt": "2+2?"}}
+    with TestClient(main.app) as client:
+        first = client.post("/v1/proxy", json=deterministic).json()
+        second = client.post("/v1/proxy", json=reordered).json()
+        bypass = client.post("/v1/proxy", json={**deterministic, "cache": False}).json()
+        sampled = {"task": "chat", "payload": {"prompt": "a poem", "temperature": 0.8}}
+        client.post("/v1/proxy", json=sampled)
+        client.post("/v1/proxy", json=sampled)
+        forced = {**sampled, "cache": True}
+        client.post("/v1/proxy", json=forced)
+        forced_hit = client.post("/v1/proxy", json=forced).json()
+
+        proxy_body = main.ProxyRequest(**deterministic)
+        timings = []
+        for _ in range(50):
+            started = time.perf_counter()
+            client.portal.call(main.proxy_pinned, proxy_body)
+            timings.append(time.perf_counter() - started)
+        stats = client.get("/v1/cache").json()["responses"]
+
+    assert first["cache"]["status"] == "miss"
+    assert second["cache"] == {"status": "hit", "key": first["cache"]["key"], "age_s": second["cache"]["age_s"]}
+    assert second["response"] == first["response"] and second["attempts"] == []
+    assert "cache" not in bypass
+    assert forced_hit["cache"]["status"] == "hit"
+    # miss, bypass, two sampled requests and the forced miss reach the upstream
+    assert len(echo_upstream.peers) == 5
+    assert sorted(timings)[len(timings) // 2] < 0.001
+    assert stats["bypassed"] == 1 and stats["stores"] == 2 and stats["disk_entries"] == 2
+
+    # a restarted gateway answers from the disk tier
+    main.reset_config()
+    main._responses = None
+    with TestClient(main.app) as client:
+        restarted = client.post("/v1/proxy", json=deterministic).json()
+        stats = client.get("/v1/cache").json()["responses"]
+    assert restarted["cache"]["status"] == "hit"
+    assert stats["disk_hits"] == 1
+    assert len(echo_upstream.peers) == 5
+
+
+def test_response_cache_disk_index_stays_consistent_under_concurrent_io(tmp_path):
+    from gateway.app.cache import ResponseCache
+
+    disk_dir = tmp_path / "responses"
+    cache = ResponseCache({"ttl_s": 60, "max_entries": 1, "disk_dir": str(disk_dir), "disk_max_entries": 4})
+
+    async def scenario():
+        entries = {f"key{index}": cache.put(f"key{index}", "m", "e", {"n": index}) for index in range(20)}
+        # memory holds one entry, so reads of older keys go to disk while writes evict
+        await asyncio.gather(
+            *(cache.persist(key, entry) for key, entry in entries.items()),
+            *(cache.get(key) for key in entries),
+        )
+        return await cache.get("key19"), await cache.get("key0")
+
+    newest, evicted = asyncio.run(scenario())
+    assert newest is not None and newest["response"] == {"n": 19}
+    assert evicted is None
+    assert sorted(cache._disk_index) == sorted(path.stem for path in disk_dir.glob("*.json"))
+    assert len(cache._disk_index) == 4
+
+
+def test_scheduler_shares_a_slow_upstream_fairly_and_rejects_with_429(flaky_pair):
+    import httpx
+
+    scheduler = {
+        "max_in_flight": 1,
+        "max_queue": 6,
+        "default_client": {"rate_per_s": 0.5, "burst": 1},
+        # the batch itself is not rate limited, only queued behind its own earlier calls
+        "clients": {"teen-key": {"name": "teen", "rate_per_s": 0}, "parent-key": {"name": "parent", "rate_per_s": 0}},
+    }
+    handlers, _ = flaky_pair({}, scheduler=scheduler)
+    handlers["primary"].delay = 0.1
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        finished = []
+        async with httpx.AsyncClient(transport=transport, base_url="http://gateway") as client:
+
+            async def call(key, name):
+                response = await client.post(
+                    "/v1/proxy", json={"task": "chat", "payload": {"prompt": name}}, headers={"X-API-Key": key}
+                )
+                finished.append((name, response.status_code))
+                return response
+
+            batch = [asyncio.create_task(call("teen-key", f"teen-{index}")) for index in range(8)]
+            lanes = main.get_scheduler()._lanes
+            while not lanes or next(iter(lanes.values())).served < 1:
+                await asyncio.sleep(0.01)
+            parent = await call("parent-key", "parent")
+            await asyncio.gather(*batch)
+            guest = [await call("guest-key", "guest") for _ in range(2)]
+            stats = (await client.get("/v1/upstreams")).json()["scheduler"]
+            metrics = (await client.get("/metrics")).text
+        await main.get_pool().aclose()
+        return finished, parent, guest, stats, metrics
+
+    try:
+        finished, parent, guest, stats, metrics = asyncio.run(scenario())
+    finally:
+        main._pool = None
+
+    completed = [name for name, status in finished if status == 200]
+    # the parent arrived behind five queued calls but is served right after the one in flight
+    assert parent.status_code == 200
+    assert completed.index("parent") == 2
+    # one in flight plus six queued: the eighth call of the batch is turned away with its position
+    assert [name for name, status in finished if status == 429 and name.startswith("teen")] == ["teen-7"]
+    assert guest[0].status_code == 200
+    assert guest[1].status_code == 429
+    assert int(guest[1].headers["retry-after"]) >= 1
+    assert guest[1].json()["detail"]["reason"] == "rate_limited"
+    assert set(stats["clients"]) >= {"teen", "parent"}
+    assert stats["endpoints"][next(iter(stats["endpoints"]))]["max_in_flight"] == 1
+    assert "gateway_queue_wait_seconds_count" in metrics
+    assert 'gateway_admission_rejections_total{reason="queue_full"}' in metrics
+
+
+def test_web_ui_users_get_their_own_rate_limit_bucket(flaky_pair, monkeypatch):
+    import httpx
+
+    monkeypatch.setenv("WEB_UI_API_KEY", "web-ui-key")
+    scheduler = {
+        "default_client": {"rate_per_s": 0.5, "burst": 1},
+        "forwarded_user": {"header": "x-openwebui-user-id", "key_env": "WEB_UI_API_KEY"},
+    }
+    flaky_pair({}, scheduler=scheduler)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://gateway") as client:
+
+            async def call(user, key="web-ui-key"):
+                # web-ui sends the same key and address for everyone, plus the signed-in user
+                headers = {"Authorization": f"Bearer {key}", "X-OpenWebUI-User-Id": user}
+                return await client.post("/v1/proxy", json={"task": "chat", "payload": {"prompt": "hi"}}, headers=headers)
+
+            web_ui = [await call("mum"), await call("kid"), await call("mum")]
+            # any other caller is known by its key, whatever user it claims to be
+            spoofed = [await call("dad", key="guest-key"), await call("gran", key="guest-key")]
+        await main.get_pool().aclose()
+        return web_ui, spoofed
+
+    try:
+        (mum, kid, mum_again), spoofed = asyncio.run(scenario())
+    finally:
+        main._pool = None
+
+    assert mum.status_code == 200
+    assert kid.status_code == 200
+    assert mum_again.status_code == 429
+    assert mum_again.json()["detail"]["reason"] == "rate_limited"
+    assert [response.status_code for response in spoofed] == [200, 429]
+
+
+def test_scheduler_bounds_tracked_client_buckets():
+    scheduler = AdmissionScheduler({"default_client": {"rate_per_s": 1, "burst": 1}, "max_clients": 3})
+    for index in range(3):
+        scheduler.admit(f"rotating-{index}")
+    # every tracked client is mid-burst: newcomers share one bucket instead of each getting a fresh one
+    scheduler.admit("rotating-3")
+    with pytest.raises(AdmissionRejected):
+        scheduler.admit("rotating-4")
+    assert len(scheduler._buckets) == 4 and "overflow" in scheduler._buckets
+
+    # once refilled, idle buckets are dropped to make room
+    for bucket in scheduler._buckets.values():
+        bucket.updated -= 5
+    scheduler._pruned_at -= 5
+    scheduler.admit("newcomer")
+    assert sorted(scheduler._buckets) == ["newcomer"]
+
+
+@pytest.fixture
+def replica_set(fake_upstream, routing_config):
+    calls = []
+    handlers = {f"r{index}": type(f"r{index}", (_FlakyUpstream,), {"name": f"r{index}", "calls": calls}) for index in range(3)}
+    replicas = [fake_upstream(handler) + "/v1/chat/completions" for handler in handlers.values()]
+
+    def configure(**sections):
+        routing_config(
+            {
+                "models": {"fast": {"endpoint": replicas[0], "replicas": replicas, "kind": "chat"}},
+                "policies": {"chat": {"default": "fast", "balanced": "fast", "complex": "fast"}},
+                **sections,
+            }
+        )
+        return handlers, calls
+
+    return configure
+
+
+def _run_proxy_calls(bodies, headers=None, concurrent=False):
+    import httpx
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://gateway") as client:
+
+            async def call(body):
+                return await client.post("/v1/proxy", json=body, headers=headers(body) if headers else None)
+
+            if concurrent:
+                responses = await asyncio.gather(*(call(body) for body in bodies))
+            else:
+                responses = [await call(body) for body in bodies]
+            stats = (await client.get("/v1/upstreams")).json()["balancer"]
+        await main.get_pool().aclose()
+        return responses, stats
+
+    try:
+        return asyncio.run(scenario())
+    finally:
+        main._pool = None
+
+
+def test_replicas_share_load_and_eject_a_failing_replica(replica_set):
+    handlers, calls = replica_set(balancing={"eject_after": 2, "eject_s": 60})
+    for handler in handlers.values():
+        handler.delay = 0.05
+    body = {"task": "chat", "payload": {"prompt": "hi"}}
+
+    responses, _ = _run_proxy_calls([body] * 30, concurrent=True)
+    assert all(response.status_code == 200 for response in responses)
+    # least outstanding requests: concurrent calls spread evenly over the three replicas
+    assert sorted(calls.count(name) for name in handlers) == [10, 10, 10]
+
+    calls.clear()
+    handlers["r1"].status = 500
+    responses, stats = _run_proxy_calls([body] * 12)
+    # a call that lands on the failing replica is retried on another replica of the same model
+    assert all(response.status_code == 200 for response in responses)
+    assert {response.json()["response"]["served_by"] for response in responses} == {"r0", "r2"}
+    assert sorted(len(response.json()["attempts"]) for response in responses)[-2:] == [2, 2]
+    # two failures in a row eject r1, so the remaining calls never reach it
+    assert calls.count("r1") == 2
+    r1 = next(state for endpoint, state in stats["replicas"].items() if state["failures"])
+    assert r1["ejections"] == 1 and r1["ejected_for_s"] > 0
+
+
+def test_session_affinity_keeps_a_conversation_on_one_replica(replica_set):
+    handlers, calls = replica_set(
+        balancing={"strategy": "power_of_two", "affinity": {"enabled": True, "headers": ["x-session-id"]}}
+    )
+    sessions = [f"conversation-{index}" for index in range(6)]
+    bodies = [{"task": "chat", "payload": {"prompt": "hi", "session": session}} for session in sessions * 5]
+
+    responses, _ = _run_proxy_calls(bodies, headers=lambda body: {"X-Session-Id": body["payload"]["session"]})
+    served = {}
+    for body, response in zip(bodies, responses):
+        served.setdefault(body["payload"]["session"], set()).add(response.json()["response"]["served_by"])
+    assert all(len(replicas) == 1 for replicas in served.values())
+
+    # the OpenAI "user" field works as a session key too, and sessionless calls still spread out
+    calls.clear()
+    _run_proxy_calls([{"task": "chat", "payload": {"prompt": "hi", "user": "grandma"}}] * 5)
+    assert len(set(calls)) == 1
+    calls.clear()
+    _run_proxy_calls([{"task": "chat", "payload": {"prompt": "hi"}}] * 30)
+    assert set(calls) == set(handlers)
+
+
+class _DigestUpstream(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *_args):
+        pass
+
+    def do_POST(self):
+        import hashlib
+
+        digest, remaining = hashlib.sha256(), int(self.headers.get("Content-Length", 0))
+        while remaining:
+            chunk = self.rfile.read(min(remaining, 1 << 16))
+            digest.update(chunk)
+            remaining -= len(chunk)
+        reply = json.dumps(
+            {"sha256": digest.hexdigest(), "path": self.path, "content_type": self.headers.get("Content-Type")}
+        ).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+
+def test_upload_route_streams_multipart_body_to_routed_upstream(fake_upstream):
+    import hashlib
+
+    fake_upstream(
+        _DigestUpstream,
+        {
+            "whisper_small": {"endpoint": "/v1/transcribe", "kind": "asr"},
+            "fast": {},
+            "accurate": {"endpoint": "/v1/accurate/completions"},
+        },
+        policies={"asr": {"default": "whisper_small"}, "chat": {"balanced": "fast", "complex": "accurate"}},
+    )
+
+    audio = os.urandom(3 * 1024 * 1024 + 17)
+    with TestClient(main.app) as client:
+        response = client.post("/v1/upload/asr?language=de", content=audio, headers={"Content-Type": "audio/wav"})
+        multipart = client.post("/v1/upload/asr", files={"file": ("clip.wav", audio[:1024], "audio/wav")})
+        routed = client.post(
+            "/v1/upload/chat", content=b"raw", headers={"X-FamilyAI-Complexity": "0.9", "Content-Type": "text/plain"}
+        )
+        invalid = client.post("/v1/upload/chat?complexity=2", content=b"raw")
+
+    assert response.status_code == 200
+    body = response.json()
+    assert response.headers["x-familyai-model"] == "whisper_small"
+    assert body == {"sha256": hashlib.sha256(audio).hexdigest(), "path": "/v1/transcribe?language=de", "content_type": "audio/wav"}
+    # the multipart boundary is relayed untouched so the upstream can parse the form
+    assert multipart.json()["content_type"].startswith("multipart/form-data; boundary=")
+    assert routed.headers["x-familyai-model"] == "accurate"
+    assert routed.json()["path"] == "/v1/accurate/completions"
+    assert invalid.status_code == 422
@@ -0,0 +1,99 @@
+import asyncio
+import sys
+import threading
+import time
+from pathlib import Path
+
+import httpx
+import pytest
+from fastapi import FastAPI, HTTPException, Request
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from familyai_common.offload import OffloadPool  # noqa: E402
+
+
+class FakeRequest:
+    def __init__(self) -> None:
+        self.gone = False
+
+    async def is_disconnected(self) -> bool:
+        return self.gone
+
+
+def test_full_pool_rejects_with_retry_after():
+    pool = OffloadPool("test", max_workers=1, max_queue=1)
+    release = threading.Event()
+
+    async def scenario():
+        running = asyncio.ensure_future(pool.run(release.wait))
+        queued = asyncio.ensure_future(pool.run(lambda: "queued"))
+        await asyncio.sleep(0.05)
+        with pytest.raises(HTTPException) as excinfo:
+            await pool.run(lambda: "rejected")
+        release.set()
+        return excinfo.value, await running, await queued
+
+    rejected, first, second = asyncio.run(scenario())
+    pool.shutdown()
+    assert rejected.status_code == 429
+    assert int(rejected.headers["Retry-After"]) >= 1
+    assert (first, second) == (True, "queued")
+    assert pool.pending == 0
+
+
+def test_queued_job_is_dropped_when_client_disconnects():
+    pool = OffloadPool("test", max_workers=1, max_queue=4, poll_s=0.01)
+    release = threading.Event()
+    ran = []
+    client = FakeRequest()
+
+    async def scenario():
+        running = asyncio.ensure_future(pool.run(release.wait))
+        queued = asyncio.ensure_future(pool.run(ran.append, "late", request=client))
+        await asyncio.sleep(0.05)
+        client.gone = True
+        with pytest.raises(HTTPException) as excinfo:
+            await queued
+        release.set()
+        await running
+        return excinfo.value
+
+    error = asyncio.run(scenario())
+    pool.shutdown()
+    assert error.status_code == 499
+    assert ran == []
+    assert pool.pending == 0
+
+
+def test_health_stays_responsive_while_heavy_requests_run():
+    pool = OffloadPool("test", max_workers=2, max_queue=8)
+    app = FastAPI()
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    @app.post("/heavy")
+    async def heavy(request: Request):
+        return {"slept": await pool.run(time.sleep, 0.3, request=request)}
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            heavy_calls = asyncio.gather(*(client.post("/heavy") for _ in range(6)))
+            await asyncio.sleep(0.02)
+            latencies = []
+            for _ in range(20):
+                started = time.perf_counter()
+                assert (await client.get("/health")).status_code == 200
+                latencies.append(time.perf_counter() - started)
+                await asyncio.sleep(0.01)
+            statuses = [response.status_code for response in await heavy_calls]
+        return latencies, statuses
+
+    latencies, statuses = asyncio.run(scenario())
+    pool.shutdown()
+    assert statuses == [200] * 6
+    assert max(latencies) < 0.1
@@ -0,0 +1,225 @@
+import asyncio
+import base64
+import importlib.util
+import io
+import json
+import struct
+import sys
+import threading
+import wave
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+pytest.importorskip("soundfile")
+
+ROOT = Path(__file__).resolve().parents[1]
+MODULE_PATH = ROOT / "piper" / "serve.py"
+spec = importlib.util.spec_from_file_location("piper_service", MODULE_PATH)
+module = importlib.util.module_from_spec(spec)
+sys.modules["piper_service"] = module
+assert spec.loader is not None
+spec.loader.exec_module(module)  # type: ignore
+
+THREE_SENTENCES = "Dinner is ready. Please wash your hands! Who is setting the table?"
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    cache = module.PhraseCache(max_bytes=10 * 1024 * 1024)
+    monkeypatch.setattr(module, "phrase_cache", cache)
+    return cache
+
+
+async def _asgi_post(path, body):
+    """Drive the ASGI app directly so each streamed body chunk is observed separately."""
+    raw = json.dumps(body).encode("utf-8")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode("ascii"),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(raw)).encode())],
+        "client": ("127.0.0.1", 50000),
+        "server": ("testserver", 80),
+    }
+    finished = asyncio.Event()
+    request_sent = False
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": raw, "more_body": False}
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    await module.app(scope, receive, send)
+    finished.set()
+    start = messages[0]
+    headers = {key.decode(): value.decode() for key, value in start["headers"]}
+    chunks = [message["body"] for message in messages[1:] if message.get("body")]
+    return start["status"], headers, chunks
+
+
+def test_stream_sends_header_then_one_chunk_per_sentence():
+    status, headers, chunks = asyncio.run(_asgi_post("/v1/speak", {"text": THREE_SENTENCES, "stream": True}))
+    assert status == 200
+    assert headers["content-type"] == "audio/wav"
+    assert headers["x-cache"] == "miss"
+    header, *sentences = chunks
+    assert header[:4] == b"RIFF" and header[8:12] == b"WAVE" and len(header) == 44
+    assert struct.unpack("<I", header[24:28])[0] == module.FALLBACK_SAMPLE_RATE
+    assert len(sentences) == 3
+
+
+def test_repeated_phrase_is_served_from_cache(fresh_cache):
+    _, _, first = asyncio.run(_asgi_post("/v1/speak", {"text": "Dinner is ready.", "stream": True, "format": "pcm"}))
+    status, headers, second = asyncio.run(_asgi_post("/v1/speak", {"text": "Dinner is ready.", "stream": True, "format": "pcm"}))
+    assert status == 200
+    assert headers["x-cache"] == "hit"
+    assert headers["content-type"] == "audio/L16"
+    assert b"".join(second) == b"".join(first)
+    assert fresh_cache.stats()["hits"] == 1
+
+    other = asyncio.run(_asgi_post("/v1/speak", {"text": "Dinner is ready.", "stream": True, "length_scale": 1.2}))
+    assert other[1]["x-cache"] == "miss"
+
+
+def test_json_mode_returns_base64_wav_and_cache_flag():
+    client = TestClient(module.app)
+    first = client.post("/v1/speak", json={"text": THREE_SENTENCES}).json()
+    second = client.post("/v1/speak", json={"text": THREE_SENTENCES}).json()
+    assert (first["cached"], second["cached"]) == (False, True)
+    assert first["audio_base64"] == second["audio_base64"]
+    with wave.open(io.BytesIO(base64.b64decode(first["audio_base64"]))) as wav_file:
+        assert wav_file.getframerate() == module.FALLBACK_SAMPLE_RATE
+        assert wav_file.getnframes() > module.FALLBACK_SAMPLE_RATE
+    assert client.get("/v1/cache").json()["hit_rate"] == 0.5
+
+
+def test_rejects_unknown_format():
+    client = TestClient(module.app)
+    response = client.post("/v1/speak", json={"text": "hello", "format": "mp3"})
+    assert response.status_code == 400
+
+
+def test_cache_spills_to_disk_and_promotes_back(tmp_path, monkeypatch):
+    cache = module.PhraseCache(max_bytes=100, disk_dir=str(tmp_path), disk_max_bytes=150)
+    keys = [module.PhraseCache.key(f"phrase {index}", "voice", {}) for index in range(3)]
+    disk_threads = []
+    for name in ("_read_disk", "_spill"):
+        method = getattr(cache, name)
+        monkeypatch.setattr(
+            cache, name, lambda *args, method=method: disk_threads.append(threading.current_thread()) or method(*args)
+        )
+
+    async def scenario():
+        for key in keys:
+            await cache.put(key, 16_000, bytes(60))
+        stored = sorted(path.stem for path in tmp_path.glob("*.wav"))
+        return stored, await cache.get(keys[0]), await cache.get(keys[1])
+
+    stored, dropped, promoted = asyncio.run(scenario())
+    assert cache.stats()["entries"] == 1
+    # the disk tier only fits one 104-byte WAV, so the older spill was dropped
+    assert stored == sorted(keys[1:2])
+    assert dropped is None
+    assert promoted == (16_000, bytes(60))
+    assert cache.stats()["disk_hits"] == 1
+    # the event loop only touches the in-memory LRU
+    assert disk_threads and threading.main_thread() not in disk_threads
+
+
+class FakeVoice:
+    def __init__(self, name):
+        self.name = name
+
+    def synthesize_stream_raw(self, text, **options):
+        for sentence in module.split_sentences(text):
+            yield self.name.encode() + b":" + sentence.encode()
+
+
+def make_voices(directory, sizes):
+    for voice_id, size in sizes.items():
+        (directory / f"{voice_id}.onnx").write_bytes(bytes(size))
+        (directory / f"{voice_id}.onnx.json").write_text(json.dumps({"audio": {"sample_rate": 16_000}}))
+
+
+def test_voice_pool_loads_lazily_and_evicts_least_recently_used(tmp_path):
+    make_voices(tmp_path, {"amy": 400, "ryan": 400, "lessac": 400})
+    loaded = []
+
+    def loader(model, config):
+        loaded.append(model.stem)
+        return FakeVoice(model.stem)
+
+    pool = module.VoicePool(str(tmp_path), max_bytes=1000, default_voice="amy", loader=loader)
+    assert loaded == []
+    assert pool.get("amy").name == "amy"
+    assert pool.get("ryan").name == "ryan"
+    assert pool.get("amy").name == "amy"  # amy becomes most recently used
+    assert pool.get("lessac").name == "lessac"  # evicts ryan
+    assert pool.get("missing") is None
+    stats = pool.stats()
+    assert stats["resident"] == ["amy", "lessac"]
+    assert stats["bytes"] == 800
+    assert stats["voices"]["amy"]["hit_rate"] == 0.5
+    assert stats["voices"]["ryan"]["resident"] is False
+    assert pool.get("ryan").name == "ryan"
+    assert loaded == ["amy", "ryan", "lessac", "ryan"]
+    assert pool.stats()["voices"]["ryan"]["loads"] == 2
+    assert pool.available() == ["amy", "lessac", "ryan"]
+    assert pool.paths("../etc/passwd") is None
+
+
+def test_concurrent_first_use_shares_one_load(tmp_path):
+    import threading
+    import time
+
+    make_voices(tmp_path, {"amy": 10})
+    calls = []
+
+    def slow_loader(model, config):
+        calls.append(model.stem)
+        time.sleep(0.1)
+        return FakeVoice(model.stem)
+
+    pool = module.VoicePool(str(tmp_path), max_bytes=1000, default_voice="amy", loader=slow_loader)
+    threads = [threading.Thread(target=pool.get, args=("amy",)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert calls == ["amy"]
+
+
+def test_speak_selects_voice_by_id(tmp_path, monkeypatch):
+    make_voices(tmp_path, {"amy": 10, "ryan": 10})
+    pool = module.VoicePool(str(tmp_path), max_bytes=1000, default_voice="amy", loader=lambda model, config: FakeVoice(model.stem))
+    monkeypatch.setattr(module, "PiperVoice", FakeVoice)
+    monkeypatch.setattr(module, "DEFAULT_VOICE", "amy")
+    monkeypatch.setattr(module, "voice_pool", pool)
+    client = TestClient(module.app)
+
+    default = client.post("/v1/speak", json={"text": "Hi there.", "stream": True, "format": "pcm"})
+    ryan = client.post("/v1/speak", json={"text": "Hi there.", "stream": True, "format": "pcm", "voice": "ryan"})
+    assert (default.content, ryan.content) == (b"amy:Hi there.", b"ryan:Hi there.")
+    assert ryan.headers["x-sample-rate"] == "16000"
+    assert ryan.headers["x-cache"] == "miss"
+    assert client.post("/v1/speak", json={"text": "Hi there.", "voice": "nobody"}).status_code == 404
+
+    voices = client.get("/v1/voices").json()
+    assert voices["available"] == ["amy", "ryan"]
+    assert voices["pool"]["voices"]["ryan"]["loads"] == 1
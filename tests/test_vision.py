@@ -0,0 +1,143 @@
+import importlib.util
+import io
+import sys
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+pytest.importorskip("PIL")
+
+from fastapi.testclient import TestClient  # noqa: E402
+from PIL import Image  # noqa: E402
+
+ROOT = Path(__file__).resolve().parents[1]
+MODULE_PATH = ROOT / "vision" / "serve.py"
+spec = importlib.util.spec_from_file_location("vision_service", MODULE_PATH)
+module = importlib.util.module_from_spec(spec)
+sys.modules["vision_service"] = module
+assert spec.loader is not None
+spec.loader.exec_module(module)  # type: ignore
+
+
+def encode(image: Image.Image, fmt: str = "PNG") -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def striped_image(width: int = 1200, height: int = 900) -> Image.Image:
+    """60% red, 30% blue, 10% white horizontal bands."""
+    pixels = np.zeros((height, width, 3), dtype=np.uint8)
+    pixels[: int(height * 0.6)] = (200, 30, 40)
+    pixels[int(height * 0.6) : int(height * 0.9)] = (20, 40, 220)
+    pixels[int(height * 0.9) :] = (255, 255, 255)
+    return Image.fromarray(pixels)
+
+
+def test_palette_matches_exact_counting_on_flat_regions():
+    image = striped_image()
+    exact = Counter(image.getdata()).most_common(3)
+    result = module.describe(encode(image), top_k=3)
+    assert result["dominant_color"] == "#%02x%02x%02x" % exact[0][0]
+    assert [entry["color"] for entry in result["palette"]] == ["#%02x%02x%02x" % rgb for rgb, _ in exact]
+    assert [entry["fraction"] for entry in result["palette"]] == pytest.approx([0.6, 0.3, 0.1], abs=0.01)
+    assert (result["width"], result["height"]) == (1200, 900)
+
+
+def test_histograms_are_normalised_per_channel():
+    result = module.describe(encode(striped_image()))
+    for name in "rgb":
+        histogram = result["histograms"][name]
+        assert len(histogram) == module.HISTOGRAM_BINS
+        assert sum(histogram) == pytest.approx(1.0, abs=1e-3)
+    red = result["histograms"]["r"]
+    assert (red[200 // 16], red[20 // 16], red[-1]) == pytest.approx((0.6, 0.3, 0.1), abs=0.01)
+
+
+@pytest.mark.parametrize("bins", [1, 10, 16, 20, 256])
+def test_histograms_accept_bin_counts_that_do_not_divide_256(bins):
+    pixels = np.random.default_rng(1).integers(0, 256, (5000, 3), dtype=np.uint8)
+    histograms = module.color_stats(pixels, bins=bins)["histograms"]
+    expected, _ = np.histogram(pixels[:, 0], bins=bins, range=(0, 256))
+    assert histograms["r"] == pytest.approx((expected / len(pixels)).tolist(), abs=1e-4)
+
+
+def test_palette_images_and_top_k_larger_than_colours():
+    image = striped_image(2400, 1800).convert("P", palette=Image.Palette.ADAPTIVE, colors=4)
+    result = module.describe(encode(image), top_k=10)
+    assert len(result["palette"]) == 3
+    assert result["dominant_color"] == "#c81e28"
+
+
+def test_vision_endpoint_returns_palette():
+    client = TestClient(module.app)
+    response = client.post(
+        "/v1/vision",
+        files={"file": ("photo.jpg", encode(striped_image(), "JPEG"), "image/jpeg")},
+        data={"prompt": "What colour?", "top_k": "2"},
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert body["prompt"] == "What colour?"
+    assert len(body["palette"]) == 2
+    assert body["summary"] == f"Image 1200x900 with dominant color {body['dominant_color']}"
+
+
+def test_large_jpeg_decodes_in_draft_mode_and_matches_full_decode():
+    photo = encode(striped_image(4000, 3000), "JPEG")
+    draft = module.decode_thumbnail(photo, draft=True)
+    full = module.decode_thumbnail(photo, draft=False)
+    assert draft.draft_scale == 4 and full.draft_scale == 1
+    assert (draft.width, draft.height) == (full.width, full.height) == (4000, 3000)
+    assert max(len(draft.pixels), len(full.pixels)) < 1_000_000
+    fractions = [[entry["fraction"] for entry in module.color_stats(t.pixels, 3)["palette"]] for t in (draft, full)]
+    assert fractions[0] == pytest.approx(fractions[1], abs=0.01)
+
+
+def test_repeated_upload_is_served_from_thumbnail_cache(monkeypatch):
+    monkeypatch.setattr(module, "thumbnail_cache", module.ThumbnailCache(8 * 1024 * 1024))
+    decodes = []
+    decode = module.decode_thumbnail
+    monkeypatch.setattr(module, "decode_thumbnail", lambda data: decodes.append(1) or decode(data))
+    photo = encode(striped_image(), "JPEG")
+
+    first = module.describe(photo, top_k=3)
+    again = module.describe(photo, top_k=3)
+    other_k = module.describe(photo, top_k=2)
+    assert (first["cache"], again["cache"], other_k["cache"]) == ("miss", "hit", "hit")
+    assert again["palette"] == first["palette"] and len(other_k["palette"]) == 2
+    assert len(decodes) == 1
+    stats = TestClient(module.app).get("/v1/cache").json()
+    assert (stats["entries"], stats["hits"], stats["misses"]) == (1, 2, 1)
+
+
+def test_top_k_is_clamped_and_stats_are_cached_once_per_image(monkeypatch):
+    monkeypatch.setattr(module, "thumbnail_cache", module.ThumbnailCache(8 * 1024 * 1024))
+    rng = np.random.default_rng(0)
+    photo = encode(Image.fromarray(rng.integers(0, 256, (64, 64, 3), dtype=np.uint8)))
+
+    full = module.describe(photo, top_k=module.MAX_TOP_K)
+    results = [module.describe(photo, top_k=k) for k in (1, 3, 7, 10_000, 0)]
+    assert [len(result["palette"]) for result in results] == [1, 3, 7, module.MAX_TOP_K, 1]
+    assert results[3]["palette"] == full["palette"]
+    assert results[1]["palette"] == full["palette"][:3]
+    (entry,) = module.thumbnail_cache._entries.values()
+    # one stats record per image, however many top_k values were asked for
+    assert len(entry["stats"]["palette"]) == module.MAX_TOP_K
+
+
+def test_limits_are_enforced_before_decoding(monkeypatch):
+    monkeypatch.setattr(module, "thumbnail_cache", module.ThumbnailCache(8 * 1024 * 1024))
+    client = TestClient(module.app)
+    photo = encode(striped_image(), "JPEG")
+    monkeypatch.setattr(module, "MAX_IMAGE_PIXELS", 1_000_000)
+    too_many_pixels = client.post("/v1/vision", files={"file": ("big.jpg", photo, "image/jpeg")})
+    assert too_many_pixels.status_code == 413
+    assert "1200x900" in too_many_pixels.json()["detail"]
+    monkeypatch.setattr(module, "MAX_UPLOAD_BYTES", len(photo) - 1)
+    assert client.post("/v1/vision", files={"file": ("big.jpg", photo, "image/jpeg")}).status_code == 413
+    monkeypatch.setattr(module, "MAX_UPLOAD_BYTES", 1 << 20)
+    assert client.post("/v1/vision", files={"file": ("notes.txt", b"not an image", "text/plain")}).status_code == 415
+
@@ -0,0 +1,274 @@
+import asyncio
+import importlib.util
+import io
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+whisper = pytest.importorskip("whisper")
+soundfile = pytest.importorskip("soundfile")
+
+from prometheus_client import REGISTRY  # noqa: E402
+
+ROOT = Path(__file__).resolve().parents[1]
+MODULE_PATH = ROOT / "whisper" / "serve.py"
+spec = importlib.util.spec_from_file_location("whisper_service", MODULE_PATH)
+module = importlib.util.module_from_spec(spec)
+sys.modules["whisper_service"] = module
+assert spec.loader is not None
+spec.loader.exec_module(module)  # type: ignore
+
+
+def tiny_random_model():
+    """A randomly initialised, very small Whisper so the decode path runs on CPU without downloads."""
+    dims = whisper.model.ModelDimensions(
+        n_mels=80, n_audio_ctx=1500, n_audio_state=64, n_audio_head=2, n_audio_layer=1,
+        n_vocab=51865, n_text_ctx=448, n_text_state=64, n_text_head=2, n_text_layer=1,
+    )
+    return whisper.model.Whisper(dims).eval()
+
+
+def wav_bytes(seconds: float, sample_rate: int = 16_000, channels: int = 1) -> bytes:
+    t = np.linspace(0, seconds, int(seconds * sample_rate), endpoint=False)
+    tone = 0.1 * np.sin(2 * np.pi * 440 * t)
+    if channels > 1:
+        tone = np.stack([tone] * channels, axis=1)
+    buffer = io.BytesIO()
+    soundfile.write(buffer, tone, sample_rate, format="WAV")
+    return buffer.getvalue()
+
+
+def test_load_audio_downmixes_and_resamples():
+    audio = module.load_audio(wav_bytes(1.0, sample_rate=8_000, channels=2))
+    assert audio.dtype == np.float32
+    assert audio.ndim == 1
+    assert len(audio) == module.SAMPLE_RATE
+
+
+def test_batcher_groups_concurrent_requests():
+    seen_batches = []
+
+    def process(audios):
+        seen_batches.append(len(audios))
+        return [{"text": str(len(audio))} for audio in audios]
+
+    batcher = module.TranscriptionBatcher(process, max_batch=4, max_wait_s=0.05)
+
+    async def scenario():
+        clips = [np.zeros(n, dtype=np.float32) for n in range(1, 7)]
+        results = await asyncio.gather(*(batcher.submit(clip) for clip in clips))
+        await batcher.stop()
+        return results
+
+    results = asyncio.run(scenario())
+    assert [result["text"] for result in results] == ["1", "2", "3", "4", "5", "6"]
+    assert seen_batches == [4, 2]
+
+
+def test_batcher_propagates_decode_errors():
+    def process(_audios):
+        raise RuntimeError("decoder exploded")
+
+    batcher = module.TranscriptionBatcher(process, max_batch=2, max_wait_s=0.0)
+
+    async def scenario():
+        with pytest.raises(RuntimeError, match="decoder exploded"):
+            await batcher.submit(np.zeros(10, dtype=np.float32))
+        await batcher.stop()
+
+    asyncio.run(scenario())
+
+
+def test_transcribe_batch_decodes_on_cpu(monkeypatch):
+    monkeypatch.setattr(module, "_model", tiny_random_model())
+    before = REGISTRY.get_sample_value("whisper_batch_size_count") or 0.0
+    batcher = module.TranscriptionBatcher(module.transcribe_batch, max_batch=4, max_wait_s=0.05)
+
+    async def scenario():
+        clips = [module.load_audio(wav_bytes(seconds)) for seconds in (0.5, 1.0, 1.5)]
+        results = await asyncio.gather(*(batcher.submit(clip) for clip in clips))
+        await batcher.stop()
+        return results
+
+    results = asyncio.run(scenario())
+    assert len(results) == 3
+    assert all(isinstance(result["text"], str) for result in results)
+    for result, seconds in zip(results, (0.5, 1.0, 1.5)):
+        assert all(0.0 <= segment["start"] <= segment["end"] <= seconds for segment in result["segments"])
+    assert REGISTRY.get_sample_value("whisper_batch_size_count") == before + 1
+
+
+def test_batched_decode_is_split_at_timestamp_tokens():
+    tokenizer = whisper.tokenizer.get_tokenizer(False, language="en", task="transcribe")
+    begin = tokenizer.timestamp_begin
+
+    def at(seconds):
+        return begin + round(seconds / module.TIME_PRECISION)
+
+    tokens = [at(0.0), *tokenizer.encode(" Hello there."), at(1.2), at(1.4), *tokenizer.encode(" How are you"), at(2.6)]
+    tokens += tokenizer.encode(" still talking")
+    result = whisper.decoding.DecodingResult(
+        audio_features=None, language="en", tokens=tokens, avg_logprob=-0.25, no_speech_prob=0.01
+    )
+    segments = module.structured_segments(module.timestamped_segments(result, tokenizer, duration=3.0))
+    assert [(segment["start"], segment["end"], segment["text"]) for segment in segments] == [
+        (0.0, 1.2, "Hello there."),
+        (1.4, 2.6, "How are you"),
+        (2.6, 3.0, "still talking"),
+    ]
+    assert segments[0]["avg_logprob"] == -0.25
+
+
+def test_pcm_stream_decoder_handles_wav_split_at_odd_offsets():
+    payload = wav_bytes(0.25, sample_rate=16_000, channels=2)
+    decoder = module.PCMStreamDecoder()
+    pieces = [decoder.feed(payload[start:start + 37]) for start in range(0, len(payload), 37)]
+    samples = np.concatenate(pieces)
+    assert decoder.channels == 2
+    assert len(samples) == 4_000
+    reference, _ = soundfile.read(io.BytesIO(payload), dtype="float32")
+    np.testing.assert_allclose(samples, reference.mean(axis=1), atol=1e-4)
+
+
+def test_windowed_transcript_emits_boundary_segments_once():
+    transcript = module.WindowedTranscript(window_s=4.0, overlap_s=2.0)
+    transcript.append(np.zeros(int(5.5 * module.SAMPLE_RATE), dtype=np.float32))
+    audio, offset, last = transcript.next_window()
+    assert (len(audio), offset, last) == (4 * module.SAMPLE_RATE, 0, False)
+    # "b" straddles the commit boundary at 3 s (midpoint 3.2 s) and belongs to the next window
+    first = transcript.commit([{"start": 0.0, "end": 2.0, "text": " a"}, {"start": 2.5, "end": 3.9, "text": "b"}], offset, len(audio), last)
+    assert [segment["text"] for segment in first] == ["a"]
+
+    audio, offset, last = transcript.next_window(final=True)
+    assert (offset, last) == (2 * module.SAMPLE_RATE, True)
+    second = transcript.commit([{"start": 0.0, "end": 0.5, "text": "a"}, {"start": 0.5, "end": 1.9, "text": "b"}, {"start": 1.9, "end": 3.5, "text": "c"}], offset, len(audio), last)
+    assert [(segment["id"], segment["text"], segment["start"]) for segment in second] == [(1, "b", 2.5), (2, "c", 3.9)]
+
+
+def test_stream_endpoint_sends_partials_then_final(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    windows = []
+
+    def fake_window(audio):
+        windows.append(len(audio) / module.SAMPLE_RATE)
+        return [{"start": 0.2, "end": 0.8, "text": f" window {len(windows)}"}]
+
+    monkeypatch.setattr(module, "transcribe_window", fake_window)
+    windowed = module.WindowedTranscript
+    monkeypatch.setattr(module, "WindowedTranscript", lambda: windowed(window_s=1.0, overlap_s=0.2))
+    monkeypatch.setattr(module, "_model", tiny_random_model())
+    payload = wav_bytes(2.5)
+    with TestClient(module.app) as client:
+        with client.websocket_connect("/v1/transcribe/stream") as websocket:
+            for start in range(0, len(payload), 8_000):
+                websocket.send_bytes(payload[start:start + 8_000])
+            websocket.send_text("end")
+            messages = []
+            while not messages or messages[-1]["type"] != "final":
+                messages.append(websocket.receive_json())
+
+    partials = [message for message in messages if message["type"] == "partial"]
+    assert len(partials) == len(windows) >= 3
+    final = messages[-1]
+    assert final["text"].startswith("window 1 window 2")
+    assert [segment["id"] for segment in final["segments"]] == list(range(len(final["segments"])))
+
+
+def test_stream_resampler_matches_whole_signal_resample():
+    rate = 44_100
+    signal = np.random.default_rng(0).random(3 * rate).astype(np.float32)
+    resampler = module.StreamResampler(rate)
+    # odd chunk sizes leave a fraction of an output sample at every boundary
+    streamed = np.concatenate([resampler.feed(signal[start:start + 1_237]) for start in range(0, len(signal), 1_237)])
+    assert len(streamed) == 3 * module.SAMPLE_RATE
+    np.testing.assert_allclose(streamed, module.resample(signal, rate), atol=1e-6)
+
+
+def test_stream_windows_share_the_offload_queue_limit(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    monkeypatch.setattr(module, "transcribe_window", lambda audio: [])
+    windowed = module.WindowedTranscript
+    monkeypatch.setattr(module, "WindowedTranscript", lambda: windowed(window_s=1.0, overlap_s=0.2))
+    monkeypatch.setattr(module, "_model", tiny_random_model())
+    monkeypatch.setattr(module, "offload", module.OffloadPool("whisper-test", max_workers=1, max_queue=0))
+    with TestClient(module.app) as client, module.offload.reserve():
+        with client.websocket_connect("/v1/transcribe/stream") as websocket:
+            websocket.send_bytes(wav_bytes(1.5))
+            message = websocket.receive_json()
+    assert message["type"] == "error"
+    assert message["status"] == 429
+    assert int(message["retry_after"]) >= 1
+
+
+def test_transcribe_returns_structured_segments(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    async def fake_submit(audio):
+        return {"text": " hello ", "language": "en", "segments": [{"start": 0, "end": 1.0, "text": " hello ", "avg_logprob": -0.25}]}
+
+    monkeypatch.setattr(module.batcher, "submit", fake_submit)
+    monkeypatch.setattr(module, "_model", tiny_random_model())
+    with TestClient(module.app) as client:
+        response = client.post("/v1/transcribe", files={"file": ("clip.wav", wav_bytes(1.0), "audio/wav")})
+    assert response.status_code == 200
+    assert response.json() == {
+        "text": "hello",
+        "language": "en",
+        "segments": [{"id": 0, "start": 0.0, "end": 1.0, "text": "hello", "avg_logprob": -0.25}],
+    }
+
+
+def test_batcher_rejects_when_pending_queue_is_full():
+    from fastapi import HTTPException
+
+    batcher = module.TranscriptionBatcher(lambda audios: [{"text": ""} for _ in audios], max_batch=1, max_wait_s=0.0, max_pending=1)
+
+    async def scenario():
+        batcher._executor.submit(lambda: asyncio.run(asyncio.sleep(0.2)))  # keep the decode thread busy
+        first = asyncio.ensure_future(batcher.submit(np.zeros(1, dtype=np.float32)))
+        await asyncio.sleep(0.02)  # the worker takes the first clip and waits on the busy thread
+        second = asyncio.ensure_future(batcher.submit(np.zeros(1, dtype=np.float32)))
+        await asyncio.sleep(0.02)
+        with pytest.raises(HTTPException) as excinfo:
+            await batcher.submit(np.zeros(1, dtype=np.float32))
+        await asyncio.gather(first, second)
+        await batcher.stop()
+        return excinfo.value
+
+    error = asyncio.run(scenario())
+    assert error.status_code == 429
+    assert "Retry-After" in error.headers
+
+
+def test_model_loads_in_background_while_liveness_answers(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    release = threading.Event()
+
+    def slow_load(name, device):
+        release.wait(5)
+        return tiny_random_model()
+
+    monkeypatch.setattr(module, "_model", None)
+    monkeypatch.setattr(module.whisper, "load_model", slow_load)
+    with TestClient(module.app) as client:
+        # startup returned without the model; probes answer from cached state
+        assert client.get("/health/live").status_code == 200
+        assert client.get("/health").json() == {"status": "loading"}
+        loading = client.get("/health/ready")
+        assert loading.status_code == 503
+        assert loading.json()["dependencies"]["model"]["status"] == "starting"
+        release.set()
+        deadline = time.monotonic() + 5
+        while client.get("/health/ready").status_code != 200 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        ready = client.get("/health/ready").json()
+    assert ready["status"] == "ready"
+    assert ready["dependencies"]["model"]["detail"].startswith(f"{module.MODEL_NAME} on cpu")
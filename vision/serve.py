@@ -1,33 +1,265 @@
 from __future__ import annotations
 
+import hashlib
 import io
-from collections import Counter
-from typing import Dict
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional
 
-from fastapi import FastAPI, File, Form, UploadFile
-from PIL import Image
+import numpy as np
+from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile
+from PIL import Image, UnidentifiedImageError
+from prometheus_client import Counter, Histogram
+
+from familyai_common.metrics import install as install_metrics
+from familyai_common.offload import OffloadPool
+from familyai_common.readiness import Readiness
+from familyai_common.readiness import install as install_readiness
+
+ANALYSIS_MAX_SIDE = int(os.getenv("ANALYSIS_MAX_SIDE", "512"))
+PALETTE_BITS = int(os.getenv("PALETTE_BITS", "5"))
+HISTOGRAM_BINS = min(256, max(1, int(os.getenv("HISTOGRAM_BINS", "16"))))
+MAX_TOP_K = max(1, int(os.getenv("PALETTE_MAX_TOP_K", "16")))
+BOX_REDUCIBLE_MODES = ("L", "LA", "RGB", "RGBA")
+MAX_UPLOAD_BYTES = int(float(os.getenv("MAX_UPLOAD_MB", "40")) * 1024 * 1024)
+MAX_IMAGE_PIXELS = int(float(os.getenv("MAX_IMAGE_MEGAPIXELS", "100")) * 1_000_000)
+DRAFT_DECODE = os.getenv("DRAFT_DECODE", "1") not in ("0", "false", "no")
+THUMBNAIL_CACHE_MB = float(os.getenv("THUMBNAIL_CACHE_MB", "64"))
+
+THUMBNAIL_LOOKUPS = Counter("vision_thumbnail_cache_lookups_total", "Thumbnail cache lookups by outcome.", ["result"])
+DECODE_SECONDS = Histogram(
+    "vision_decode_seconds",
+    "Time to decode an upload down to its analysis thumbnail.",
+    ["mode"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
 
 app = FastAPI(title="FamilyAI Vision Service", version="0.1.0")
+install_metrics(app, "vision")
+offload = OffloadPool.from_env("vision", max_workers=2, max_queue=16)
+# nothing to load: analysis is pure Pillow/numpy, so the service is ready once it answers
+install_readiness(app, Readiness("vision"))
 
 
-@app.get("/health", tags=["health"])
-def health() -> Dict[str, str]:
-    return {"status": "ok"}
+def analysis_image(image: Image.Image, max_side: int = ANALYSIS_MAX_SIDE) -> Image.Image:
+    """Box-reduce so the longest side is at most ``max_side`` before converting to RGB.
 
+    Statistics of a few hundred thousand pixels are indistinguishable from the full
+    frame, and reducing first means a 48 MP photo is never expanded to RGB tuples.
+    """
+    factor = -(-max(image.size) // max_side) if max_side > 0 else 0
+    if factor > 1:
+        if image.mode not in BOX_REDUCIBLE_MODES:
+            image = image.convert("RGB")
+        image = image.reduce(factor)
+    return image.convert("RGB")
 
-@app.post("/v1/vision", tags=["vision"])
-async def describe_image(file: UploadFile = File(...), prompt: str = Form("Describe")) -> Dict[str, str]:
-    image_bytes = await file.read()
-    image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+
+class Thumbnail(NamedTuple):
+    width: int  # of the upload, not the thumbnail
+    height: int
+    pixels: np.ndarray  # (n, 3) uint8 analysis pixels
+    draft_scale: int  # 1 = full decode, 2/4/8 = JPEG DCT scaling
+
+
+def check_upload_size(size: int) -> None:
+    if size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Upload exceeds {MAX_UPLOAD_BYTES / (1024 * 1024):g} MB")
+
+
+def check_limits(image: Image.Image) -> None:
+    """Reject uploads whose header declares more than ``MAX_IMAGE_PIXELS`` before anything is decoded."""
+    width, height = image.size
+    if width * height > MAX_IMAGE_PIXELS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Image is {width}x{height} ({width * height / 1e6:.1f} MP); the limit is {MAX_IMAGE_PIXELS / 1e6:g} MP",
+        )
+
+
+def decode_thumbnail(image_bytes: bytes, max_side: int = ANALYSIS_MAX_SIDE, draft: bool = DRAFT_DECODE) -> Thumbnail:
+    """Decode an upload straight to analysis size.
+
+    ``Image.open`` only parses the header, so the pixel limit is checked before
+    decoding. For JPEGs ``draft()`` then asks libjpeg for a 1/2, 1/4 or 1/8 scale
+    decode that still covers ``max_side`` on both axes: with the default 512 a
+    48 MP photo is decoded at 1/8 scale (0.75 MP) and never materialised at full
+    size. Other formats decode in full and are box-reduced by ``analysis_image``.
+    """
+    started = time.perf_counter()
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+    except Image.DecompressionBombError as exc:
+        raise HTTPException(status_code=413, detail=str(exc)) from exc
+    except UnidentifiedImageError as exc:
+        raise HTTPException(status_code=415, detail="Unsupported or corrupt image") from exc
+    check_limits(image)
     width, height = image.size
-    pixels = image.getdata()
-    counter = Counter(pixels)
-    dominant_rgb, _ = counter.most_common(1)[0]
-    dominant_hex = "#%02x%02x%02x" % dominant_rgb
+    if draft and image.format == "JPEG" and max_side > 0:
+        image.draft("RGB", (max_side, max_side))
+    scale = max(1, width // image.size[0])
+    try:
+        pixels = np.asarray(analysis_image(image, max_side)).reshape(-1, 3)
+    except OSError as exc:
+        raise HTTPException(status_code=415, detail=f"Cannot decode image: {exc}") from exc
+    DECODE_SECONDS.labels("draft" if scale > 1 else "full").observe(time.perf_counter() - started)
+    return Thumbnail(width, height, pixels, scale)
+
+
+class ThumbnailCache:
+    """Content-hash keyed LRU of analysis thumbnails and their stats, bounded by bytes.
+
+    Family photos are re-sent as a chat thread goes on; a hit skips the decode and
+    the statistics, which are kept once per image at ``MAX_TOP_K`` colours and
+    sliced per request. Only the hash of the upload is kept, never the upload itself.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(image_bytes: bytes) -> str:
+        return hashlib.sha256(image_bytes).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                THUMBNAIL_LOOKUPS.labels("miss").inc()
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            THUMBNAIL_LOOKUPS.labels("hit").inc()
+            return entry
+
+    def put(self, key: str, thumbnail: Thumbnail) -> Dict[str, Any]:
+        entry: Dict[str, Any] = {"thumbnail": thumbnail, "stats": None}
+        size = thumbnail.pixels.nbytes
+        if size > self.max_bytes:
+            return entry
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous["thumbnail"].pixels.nbytes
+            self._entries[key] = entry
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= evicted["thumbnail"].pixels.nbytes
+                self.evictions += 1
+        return entry
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+
+thumbnail_cache = ThumbnailCache(int(THUMBNAIL_CACHE_MB * 1024 * 1024))
+
+
+def color_stats(
+    pixels: np.ndarray,
+    top_k: int = 5,
+    bits: int = PALETTE_BITS,
+    bins: int = HISTOGRAM_BINS,
+) -> Dict[str, Any]:
+    """Palette and per-channel histograms of an ``(n, 3)`` uint8 array.
+
+    Colours are quantized to ``bits`` per channel and packed into one integer so a
+    single ``bincount`` counts them; each palette entry reports the mean colour of
+    the pixels in its bucket rather than the bucket corner.
+    """
+    shift = 8 - bits
+    quantized = (pixels >> shift).astype(np.uint32)
+    packed = (quantized[:, 0] << (2 * bits)) | (quantized[:, 1] << bits) | quantized[:, 2]
+    counts = np.bincount(packed, minlength=1 << (3 * bits))
+    occupied = int(np.count_nonzero(counts))
+    k = max(1, min(top_k, occupied))
+    top = np.argpartition(counts, -k)[-k:]
+    top = top[np.argsort(counts[top])[::-1]]
+    sums = np.stack([np.bincount(packed, weights=pixels[:, channel], minlength=len(counts))[top] for channel in range(3)], axis=1)
+    means = np.rint(sums / counts[top, None]).astype(int)
+    total = len(pixels)
+    palette: List[Dict[str, Any]] = [
+        {"color": "#%02x%02x%02x" % tuple(mean), "fraction": round(float(count) / total, 4)}
+        for mean, count in zip(means, counts[top])
+    ]
+    # bin of a value is value * bins // 256, the same edges as np.histogram(range=(0, 256)) for any bin count
+    histograms = {
+        name: (np.bincount(pixels[:, channel].astype(np.uint32) * bins >> 8, minlength=bins) / total).round(4).tolist()
+        for channel, name in enumerate("rgb")
+    }
+    return {"palette": palette, "histograms": histograms}
+
+
+def describe(image_bytes: bytes, top_k: int = 5) -> Dict[str, Any]:
+    check_upload_size(len(image_bytes))
+    top_k = max(1, min(top_k, MAX_TOP_K))
+    key = thumbnail_cache.key(image_bytes)
+    entry = thumbnail_cache.get(key)
+    cached = entry is not None
+    if entry is None:
+        entry = thumbnail_cache.put(key, decode_thumbnail(image_bytes))
+    thumbnail: Thumbnail = entry["thumbnail"]
+    stats = entry["stats"]
+    if stats is None:
+        stats = entry["stats"] = color_stats(thumbnail.pixels, MAX_TOP_K)
+    palette = stats["palette"][:top_k]
+    width, height = thumbnail.width, thumbnail.height
+    dominant_hex = palette[0]["color"]
     return {
-        "prompt": prompt,
         "width": width,
         "height": height,
         "dominant_color": dominant_hex,
+        "palette": palette,
+        "histograms": stats["histograms"],
         "summary": f"Image {width}x{height} with dominant color {dominant_hex}",
+        "cache": "hit" if cached else "miss",
     }
+
+
+@app.get("/health", tags=["health"])
+def health() -> Dict[str, str]:
+    return {"status": "ok"}
+
+
+@app.get("/v1/cache", tags=["vision"])
+def cache_stats() -> Dict[str, Any]:
+    return thumbnail_cache.stats()
+
+
+@app.post("/v1/vision", tags=["vision"])
+async def describe_image(
+    request: Request,
+    file: UploadFile = File(...),
+    prompt: str = Form("Describe"),
+    top_k: int = Form(5),
+) -> Dict[str, Any]:
+    if file.size is not None:
+        # spooled already, but refusing here skips reading it back into memory
+        check_upload_size(file.size)
+    image_bytes = await file.read()
+    return {"prompt": prompt, **await offload.run(describe, image_bytes, top_k, request=request)}
+
+
+@app.on_event("shutdown")
+def stop_offload() -> None:
+    offload.shutdown()
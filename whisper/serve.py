@@ -1,39 +1,472 @@
 from __future__ import annotations
 
+import asyncio
 import io
+import json
 import os
-from typing import Dict
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
+import numpy as np
 import soundfile
 import torch
 import whisper
-from fastapi import FastAPI, File, UploadFile
+from fastapi import FastAPI, File, HTTPException, Request, UploadFile, WebSocket, WebSocketDisconnect
+from prometheus_client import Gauge, Histogram
+
+from familyai_common.metrics import install as install_metrics
+from familyai_common.offload import OffloadPool, overloaded, until_disconnected
+from familyai_common.readiness import Readiness
+from familyai_common.readiness import install as install_readiness
+
+MODEL_NAME = os.getenv("MODEL_NAME", "small")
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "50"))
+BATCH_MAX_PENDING = int(os.getenv("BATCH_MAX_PENDING", "32"))
+STREAM_WINDOW_S = float(os.getenv("STREAM_WINDOW_S", "10"))
+STREAM_OVERLAP_S = float(os.getenv("STREAM_OVERLAP_S", "2"))
+SAMPLE_RATE = whisper.audio.SAMPLE_RATE
+TIME_PRECISION = whisper.audio.HOP_LENGTH * 2 / SAMPLE_RATE  # seconds per timestamp token (0.02)
+
+QUEUE_DEPTH = Gauge("whisper_queue_depth", "Transcriptions waiting for a batch slot.")
+BATCH_SIZE = Histogram("whisper_batch_size", "Transcriptions decoded together.", buckets=(1, 2, 4, 8, 16, 32))
 
 app = FastAPI(title="FamilyAI Whisper Service", version="0.1.0")
+install_metrics(app, "whisper")
+offload = OffloadPool.from_env("whisper", max_workers=2, max_queue=16)
 
 _model = None
+_model_lock = threading.Lock()
 
 
 def get_model() -> whisper.Whisper:
     global _model
     if _model is None:
-        model_name = os.getenv("MODEL_NAME", "small")
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-        _model = whisper.load_model(model_name, device=device)
+        with _model_lock:
+            if _model is None:  # loaded by the startup loader while we waited
+                device = "cuda" if torch.cuda.is_available() else "cpu"
+                _model = whisper.load_model(MODEL_NAME, device=device)
     return _model
 
 
+def load_model() -> str:
+    started = time.perf_counter()
+    model = get_model()
+    return f"{MODEL_NAME} on {model.device} in {time.perf_counter() - started:.1f}s"
+
+
+# the model loads in the background after startup; /health/ready stays 503 until it is resident
+readiness = Readiness("whisper")
+readiness.load("model", load_model, retry_s=float(os.getenv("MODEL_LOAD_RETRY_S", "30")))
+install_readiness(app, readiness)
+
+
+def resample(audio: np.ndarray, sample_rate: int) -> np.ndarray:
+    if sample_rate == SAMPLE_RATE:
+        return audio
+    duration = len(audio) / sample_rate
+    target = np.linspace(0.0, duration, int(duration * SAMPLE_RATE), endpoint=False)
+    return np.interp(target, np.arange(len(audio)) / sample_rate, audio).astype(np.float32)
+
+
+class StreamResampler:
+    """Resample a chunked signal to 16 kHz exactly as if it had arrived in one piece.
+
+    Output sample positions are tracked against the absolute input index and the
+    previous chunk's last sample is kept for interpolation, so no fraction of a
+    sample is lost at chunk boundaries and timestamps do not drift.
+    """
+
+    def __init__(self, sample_rate: int) -> None:
+        self.sample_rate = sample_rate
+        self._consumed = 0  # input samples seen
+        self._produced = 0  # output samples emitted
+        self._last: Optional[np.ndarray] = None
+
+    def feed(self, samples: np.ndarray) -> np.ndarray:
+        if self.sample_rate == SAMPLE_RATE or not len(samples):
+            return samples
+        source = samples if self._last is None else np.concatenate([self._last, samples])
+        first = self._consumed - (len(source) - len(samples))
+        self._consumed += len(samples)
+        self._last = samples[-1:]
+        # every output sample at or before the newest input sample
+        total = (self._consumed - 1) * SAMPLE_RATE // self.sample_rate + 1
+        positions = np.arange(self._produced, total) * (self.sample_rate / SAMPLE_RATE)
+        self._produced = total
+        return np.interp(positions, np.arange(first, first + len(source)), source).astype(np.float32)
+
+
+def load_audio(data: bytes) -> np.ndarray:
+    """Decode an upload to the mono float32 16 kHz signal Whisper expects."""
+    audio, sample_rate = soundfile.read(io.BytesIO(data), dtype="float32")
+    if audio.ndim > 1:
+        audio = audio.mean(axis=1)
+    return resample(audio, sample_rate)
+
+
+def structured_segments(segments: List[Dict[str, Any]], offset_s: float = 0.0) -> List[Dict[str, Any]]:
+    """Keep the JSON-friendly fields of Whisper segments, shifted by ``offset_s``."""
+    structured = []
+    for index, segment in enumerate(segments):
+        entry = {
+            "id": index,
+            "start": round(float(segment["start"]) + offset_s, 3),
+            "end": round(float(segment["end"]) + offset_s, 3),
+            "text": str(segment["text"]).strip(),
+        }
+        for key in ("avg_logprob", "no_speech_prob"):
+            if segment.get(key) is not None:
+                entry[key] = round(float(segment[key]), 4)
+        structured.append(entry)
+    return structured
+
+
+def timestamped_segments(result: Any, tokenizer: Any, duration: float) -> List[Dict[str, Any]]:
+    """Split one batched decode into segments at its timestamp tokens, as ``model.transcribe`` does.
+
+    Whisper emits ``<|start|> text <|end|>`` pairs; text left open at the end of the
+    clip runs to ``duration``, and a decode without timestamps is one segment.
+    """
+    begin = tokenizer.timestamp_begin
+    segments: List[Dict[str, Any]] = []
+    start: Optional[float] = None
+    text_tokens: List[int] = []
+
+    def close(end: float) -> None:
+        text = tokenizer.decode(text_tokens)
+        if text.strip():
+            segment_start = min(start or 0.0, duration)
+            segments.append(
+                {
+                    "start": segment_start,
+                    "end": max(segment_start, min(end, duration)),
+                    "text": text,
+                    "avg_logprob": result.avg_logprob,
+                    "no_speech_prob": result.no_speech_prob,
+                }
+            )
+        text_tokens.clear()
+
+    for token in result.tokens:
+        if token < begin:
+            text_tokens.append(token)
+            continue
+        timestamp = (token - begin) * TIME_PRECISION
+        if text_tokens:
+            close(timestamp)
+        # the closing timestamp also opens the next segment unless another one follows
+        start = timestamp
+    if text_tokens:
+        close(duration)
+    return segments
+
+
+def transcribe_batch(audios: List[np.ndarray]) -> List[Dict[str, Any]]:
+    """Decode clips of up to 30 s as one batch; longer clips use the sliding-window path."""
+    model = get_model()
+    fp16 = torch.cuda.is_available()
+    results: List[Optional[Dict[str, Any]]] = [None] * len(audios)
+
+    short = [index for index, audio in enumerate(audios) if len(audio) <= whisper.audio.N_SAMPLES]
+    if short:
+        mels = torch.stack(
+            [
+                whisper.log_mel_spectrogram(whisper.pad_or_trim(torch.from_numpy(audios[index])), model.dims.n_mels)
+                for index in short
+            ]
+        ).to(model.device)
+        decoded = whisper.decode(model, mels, whisper.DecodingOptions(language="en", fp16=fp16))
+        tokenizer = whisper.tokenizer.get_tokenizer(
+            model.is_multilingual, num_languages=model.num_languages, language="en", task="transcribe"
+        )
+        for index, result in zip(short, decoded):
+            segments = timestamped_segments(result, tokenizer, len(audios[index]) / SAMPLE_RATE)
+            results[index] = {"text": result.text, "language": result.language or "en", "segments": segments}
+
+    for index, audio in enumerate(audios):
+        if results[index] is None:
+            results[index] = model.transcribe(audio, fp16=fp16, language="en")
+    return results  # type: ignore[return-value]
+
+
+class TranscriptionBatcher:
+    """Group concurrent uploads into batches decoded on a single worker thread.
+
+    The first queued clip opens a window of ``max_wait_s``; anything that arrives
+    before it closes (up to ``max_batch`` clips) is decoded together. Decoding runs
+    off the event loop so health checks and uploads keep flowing. Once
+    ``max_pending`` clips are waiting, new submissions get a 429.
+    """
+
+    def __init__(
+        self,
+        process: Callable[[List[np.ndarray]], List[Dict[str, Any]]],
+        max_batch: int = BATCH_MAX_SIZE,
+        max_wait_s: float = BATCH_MAX_WAIT_MS / 1000,
+        max_pending: int = BATCH_MAX_PENDING,
+    ) -> None:
+        self.process = process
+        self.max_batch = max(1, max_batch)
+        self.max_wait_s = max(0.0, max_wait_s)
+        self.max_pending = max(1, max_pending)
+        self.avg_batch_s = 1.0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="whisper-decode")
+        self._queue: Optional[asyncio.Queue[Tuple[np.ndarray, asyncio.Future]]] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    async def submit(self, audio: np.ndarray) -> Dict[str, Any]:
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run(self._queue))
+        assert self._queue is not None
+        if self._queue.qsize() >= self.max_pending:
+            raise overloaded(self.avg_batch_s * (self._queue.qsize() / self.max_batch + 1))
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((audio, future))
+        QUEUE_DEPTH.set(self._queue.qsize())
+        return await future
+
+    async def _collect(self, queue: asyncio.Queue) -> List[Tuple[np.ndarray, asyncio.Future]]:
+        loop = asyncio.get_running_loop()
+        batch = [await queue.get()]
+        deadline = loop.time() + self.max_wait_s
+        while len(batch) < self.max_batch:
+            if not queue.empty():
+                batch.append(queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        QUEUE_DEPTH.set(queue.qsize())
+        return batch
+
+    async def _run(self, queue: asyncio.Queue) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [item for item in await self._collect(queue) if not item[1].done()]
+            if not batch:
+                continue
+            BATCH_SIZE.observe(len(batch))
+            started = loop.time()
+            try:
+                results = await loop.run_in_executor(self._executor, self.process, [audio for audio, _ in batch])
+            except Exception as exc:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+            finally:
+                self.avg_batch_s = 0.8 * self.avg_batch_s + 0.2 * (loop.time() - started)
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    async def run_exclusive(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run ``fn`` on the decode thread so it never overlaps a batch on the model."""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+
+
+batcher = TranscriptionBatcher(transcribe_batch)
+
+
+def transcribe_window(audio: np.ndarray) -> List[Dict[str, Any]]:
+    model = get_model()
+    result = model.transcribe(audio, fp16=torch.cuda.is_available(), language="en", condition_on_previous_text=False)
+    return result.get("segments", [])
+
+
+class PCMStreamDecoder:
+    """Incrementally turn WAV or raw ``s16le`` bytes into mono float32 samples.
+
+    A stream starting with ``RIFF`` is parsed as a 16-bit PCM WAV; anything else is
+    treated as raw little-endian 16-bit PCM with the given rate and channel count.
+    """
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE, channels: int = 1) -> None:
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self._header: Optional[bytearray] = bytearray()
+        self._carry = b""
+
+    def _parse_header(self) -> Optional[bytes]:
+        header = bytes(self._header or b"")
+        if len(header) < 12:
+            return None
+        if header[:4] != b"RIFF":
+            self._header = None
+            return header
+        position = 12
+        while position + 8 <= len(header):
+            chunk_id, size = header[position:position + 4], struct.unpack("<I", header[position + 4:position + 8])[0]
+            if chunk_id == b"data":
+                self._header = None
+                return header[position + 8:]
+            if position + 8 + size > len(header):
+                return None
+            if chunk_id == b"fmt ":
+                fmt, channels, rate, _, _, bits = struct.unpack("<HHIIHH", header[position + 8:position + 24])
+                if fmt != 1 or bits != 16:
+                    raise ValueError("Only 16-bit PCM WAV streams are supported")
+                self.channels, self.sample_rate = channels, rate
+            position += 8 + size + (size & 1)
+        return None
+
+    def feed(self, chunk: bytes) -> np.ndarray:
+        if self._header is not None:
+            self._header.extend(chunk)
+            pending = self._parse_header()
+            if pending is None:
+                return np.zeros(0, dtype=np.float32)
+            chunk = pending
+        data = self._carry + chunk
+        frame = 2 * self.channels
+        usable = len(data) - len(data) % frame
+        self._carry = data[usable:]
+        samples = np.frombuffer(data[:usable], dtype="<i2").astype(np.float32) / 32768.0
+        if self.channels > 1:
+            samples = samples.reshape(-1, self.channels).mean(axis=1)
+        return samples
+
+
+class WindowedTranscript:
+    """Cut a growing signal into overlapping windows and stitch their segments.
+
+    Each window only commits segments whose midpoint falls in its half of the
+    overlap, so text spoken across a window boundary is emitted exactly once.
+    """
+
+    def __init__(self, window_s: float = STREAM_WINDOW_S, overlap_s: float = STREAM_OVERLAP_S) -> None:
+        self.window = int(window_s * SAMPLE_RATE)
+        self.overlap = min(int(overlap_s * SAMPLE_RATE), self.window // 2)
+        self.buffer = np.zeros(0, dtype=np.float32)
+        self.offset = 0  # absolute sample index of buffer[0]
+        self.segments: List[Dict[str, Any]] = []
+
+    def append(self, samples: np.ndarray) -> None:
+        if len(samples):
+            self.buffer = np.concatenate([self.buffer, samples])
+
+    def next_window(self, final: bool = False) -> Optional[Tuple[np.ndarray, int, bool]]:
+        if len(self.buffer) >= self.window:
+            return self.buffer[: self.window], self.offset, False
+        if final and len(self.buffer):
+            return self.buffer, self.offset, True
+        return None
+
+    def commit(self, segments: List[Dict[str, Any]], offset: int, length: int, last: bool) -> List[Dict[str, Any]]:
+        lower = offset + (self.overlap // 2 if offset else 0)
+        upper = float("inf") if last else offset + length - self.overlap // 2
+        kept = []
+        for segment in structured_segments(segments, offset / SAMPLE_RATE):
+            middle = (segment["start"] + segment["end"]) / 2 * SAMPLE_RATE
+            if lower <= middle < upper and segment["text"]:
+                segment["id"] = len(self.segments) + len(kept)
+                kept.append(segment)
+        self.segments.extend(kept)
+        advance = length if last else length - self.overlap
+        self.buffer = self.buffer[advance:]
+        self.offset += advance
+        return kept
+
+
 @app.get("/health", tags=["health"])
-def health() -> Dict[str, str]:
-    get_model()
-    return {"status": "ok"}
+async def health() -> Dict[str, str]:
+    # liveness only: answers while the model is still loading
+    return {"status": "ok" if readiness.ready else "loading"}
 
 
 @app.post("/v1/transcribe", tags=["asr"])
-async def transcribe(file: UploadFile = File(...)) -> Dict[str, str]:
-    audio_bytes = await file.read()
-    audio_buffer = io.BytesIO(audio_bytes)
-    audio, _ = soundfile.read(audio_buffer)
-    model = get_model()
-    result = model.transcribe(audio, fp16=torch.cuda.is_available(), language="en")
-    return {"text": result["text"], "language": result.get("language", "en"), "segments": str(result.get("segments", []))}
+async def transcribe(request: Request, file: UploadFile = File(...)) -> Dict[str, Any]:
+    audio = await offload.run(load_audio, await file.read(), request=request)
+    result = await until_disconnected(batcher.submit(audio), request)
+    return {
+        "text": result["text"].strip(),
+        "language": result.get("language", "en"),
+        "segments": structured_segments(result.get("segments", [])),
+    }
+
+
+def _is_end_marker(text: str) -> bool:
+    if text.strip().lower() == "end":
+        return True
+    try:
+        return json.loads(text).get("event") == "end"
+    except (ValueError, AttributeError):
+        return False
+
+
+async def _drain_windows(websocket: WebSocket, transcript: WindowedTranscript, final: bool) -> None:
+    while True:
+        window = transcript.next_window(final)
+        if window is None:
+            return
+        audio, offset, last = window
+        # admitted like any other offloaded job, though it runs on the model's decode thread
+        with offload.reserve():
+            segments = await batcher.run_exclusive(transcribe_window, audio)
+        kept = transcript.commit(segments, offset, len(audio), last)
+        await websocket.send_json({"type": "partial", "segments": kept})
+        if last:
+            return
+
+
+@app.websocket("/v1/transcribe/stream")
+async def transcribe_stream(websocket: WebSocket, sample_rate: int = SAMPLE_RATE, channels: int = 1) -> None:
+    """Binary frames carry WAV or raw s16le audio; a text frame ``end`` flushes and closes.
+
+    A ``partial`` message with newly committed segments is sent as each window is
+    decoded, followed by a ``final`` message with the full transcript.
+    """
+    await websocket.accept()
+    decoder = PCMStreamDecoder(sample_rate, channels)
+    resampler: Optional[StreamResampler] = None
+    transcript = WindowedTranscript()
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("bytes"):
+                samples = decoder.feed(message["bytes"])
+                if resampler is None and len(samples):
+                    # the rate is only known once a WAV header has been parsed
+                    resampler = StreamResampler(decoder.sample_rate)
+                if resampler is not None:
+                    transcript.append(resampler.feed(samples))
+                await _drain_windows(websocket, transcript, final=False)
+            elif message.get("text") is not None and _is_end_marker(message["text"]):
+                break
+        await _drain_windows(websocket, transcript, final=True)
+        text = " ".join(segment["text"] for segment in transcript.segments)
+        await websocket.send_json({"type": "final", "text": text, "language": "en", "segments": transcript.segments})
+        await websocket.close()
+    except ValueError as exc:
+        await websocket.send_json({"type": "error", "detail": str(exc)})
+        await websocket.close(code=1003)
+    except HTTPException as exc:
+        # the offload queue is full: same backpressure as a 429 on /v1/transcribe
+        await websocket.send_json(
+            {"type": "error", "status": exc.status_code, "detail": exc.detail, "retry_after": (exc.headers or {}).get("Retry-After")}
+        )
+        await websocket.close(code=1013)
+    except WebSocketDisconnect:
+        return
+
+
+@app.on_event("shutdown")
+async def stop_batcher() -> None:
+    await batcher.stop()
+    offload.shutdown()